@@ -21,3 +21,10 @@ def isThreadSafe():
 
 def isInjectionActive():
     return False
+
+def isRuntimeValidationActive():
+    return True
+
+# The CACHE_DESIGNS setting: whether imported design spaces are shared.
+def isCachingActive():
+    return False
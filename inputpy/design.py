@@ -4,9 +4,136 @@ inputpy.design
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import bisect
+from collections.abc import Mapping
 import inputpy.util as util
 from inputpy.exceptions import InPUTException
+from inputpy.param import isFixedValue
 from inputpy.util import Identifiable
+from inputpy.q import *
+
+class LazyValue:
+    """
+    A parameter value that is computed on first access and then memoized.
+    Lazy designs use these as placeholders for structured parameters, so
+    that no objects are constructed unless they are actually requested.
+    """
+    def __init__(self, f, choiceId=None):
+        """
+        The choice ID, if any, is the ID of the choice that the value will
+        be an instance of.
+        """
+        self.__f = f
+        self.__value = None
+        self.__done = False
+        self.__choiceId = choiceId
+
+    def get(self):
+        """
+        Return the value, computing it if this is the first access.
+        """
+        if not self.__done:
+            self.__value = self.__f()
+            self.__done = True
+            self.__f = None
+        return self.__value
+
+    def isResolved(self):
+        """
+        Return whether the value has already been computed.
+        """
+        return self.__done
+
+    def getChoiceId(self):
+        """
+        Return the ID of the choice the value is made from, if known.
+        """
+        return self.__choiceId
+
+def resolve(value):
+    """
+    Return the value, forcing it first if it is a LazyValue.
+    """
+    if isinstance(value, LazyValue):
+        return value.get()
+    return value
+
+def copyArray(value):
+    """
+    Return a copy of the (possibly nested) array. Only the lists are
+    copied. The elements themselves are shared.
+    """
+    if isinstance(value, list):
+        return [copyArray(v) for v in value]
+    return value
+
+def hashValue(value, seen=()):
+    """
+    Return a hash of the value. Arrays are hashed element by element.
+    Objects without a hash of their own (such as structured values) are
+    hashed by their attributes, so that objects with equal attributes have
+    equal hashes. Other values that cannot be hashed only contribute their
+    type.
+    """
+    if isinstance(value, list):
+        return hash(tuple(hashValue(v, seen) for v in value))
+    if type(value).__hash__ not in (None, object.__hash__):
+        try:
+            return hash(value)
+        except TypeError:
+            pass
+    attributes = getattr(value, '__dict__', None)
+    if attributes is None or id(value) in seen:
+        return hash(type(value).__name__)
+    seen = seen + (id(value),)
+    return hash((type(value).__name__, frozenset(
+        (k, hashValue(v, seen)) for (k, v) in attributes.items()
+    )))
+
+def diffValues(paramId, value, other, delta):
+    """
+    Add the differences between the two values of the parameter to the
+    delta. Arrays of the same shape are compared element by element, and
+    only the differing elements are added, using element IDs.
+    """
+    if isinstance(value, list) and isinstance(other, list):
+        if len(value) == len(other):
+            for i in range(len(value)):
+                elementId = '%s.%d' % (paramId, i+1)
+                diffValues(elementId, value[i], other[i], delta)
+            return
+    if value != other:
+        delta[paramId] = other
+
+class Delta:
+    """
+    The differences between two designs. A delta consists of changes, which
+    map parameter IDs or array element IDs to new values, and a tuple of
+    parameter IDs that have been removed. Deltas are created using
+    Design.diff and applied using Design.applyDelta.
+    """
+    def __init__(self, changes=None, removed=()):
+        self.changes = dict(changes or {})
+        self.removed = tuple(removed)
+
+    def isEmpty(self):
+        return len(self.changes) == 0 and len(self.removed) == 0
+
+    def __len__(self):
+        return len(self.changes) + len(self.removed)
+
+    def __eq__(self, other):
+        if not isinstance(other, Delta):
+            return False
+        if self.changes != other.changes:
+            return False
+        return set(self.removed) == set(other.removed)
+
+    def __str__(self):
+        return 'changes: %s, removed: %s' % (self.changes, self.removed)
+
+    def __repr__(self):
+        return self.__str__()
 
 class Design(Identifiable):
     def __init__(self, params, designSpace=None, designId=None, readOnly=False):
@@ -15,7 +142,45 @@ class Design(Identifiable):
         self.__readOnly = readOnly
         self.__ext = [self]
         self.space = designSpace
-        self.__updateSupportedIds()
+        self.__runtimeValidation = None     # None means same as the space.
+        # Copy-on-write state. See clone.
+        self.__sharedParams = False
+        self.__ownedArrays = None   # None means that all arrays are owned.
+        self.__supportedIds = None  # Built on demand.
+
+    @staticmethod
+    def fromSharedValues(params, designSpace=None, designId=None):
+        """
+        Return a design whose values (a dictionary or other mapping) are
+        shared with something else, such as an archive. Like with clone,
+        the values are copied before the design is first changed.
+        """
+        design = Design(params, designSpace, designId)
+        design.__sharedParams = True
+        design.__ownedArrays = set()
+        return design
+
+    def clone(self, designId=None):
+        """
+        Return a copy of this design. Cloning is cheap, because the two
+        designs share their parameter values until either of them sets a
+        value (copy-on-write). An array is only copied when one of its
+        elements is set.
+        The clone extends the same designs as this design, and is
+        read-only if this design is.
+        """
+        design = Design.__new__(Design)
+        Identifiable.__init__(design, designId)
+        design.params = self.params
+        design.space = self.space
+        design.__supportedIds = self.__supportedIds
+        design.__readOnly = self.__readOnly
+        design.__runtimeValidation = self.__runtimeValidation
+        design.__ext = [design] + self.__ext[1:]
+        for d in (self, design):
+            d.__sharedParams = True
+            d.__ownedArrays = set()
+        return design
 
     def getValue(self, paramId):
         if paramId is None:
@@ -24,6 +189,9 @@ class Design(Identifiable):
         result = None
         for d in self.__ext:
             result = util.getValue(paramId, d.params)
+            if isinstance(result, LazyValue):
+                result = result.get()
+                d.params[paramId] = result
             if result is not None:
                 return result
 
@@ -43,19 +211,160 @@ class Design(Identifiable):
         if not succeeded:
             raise InPUTException('Could not set %s to %s' % (paramId, value))
 
+    def setValues(self, values):
+        """
+        Set all the values in the dictionary, which maps parameter IDs
+        (or array element IDs) to values. Every value is validated against
+        the state of the design after the update, so dependent parameters
+        can be set together with the parameters they depend on.
+        Either all values are set or, if any value is invalid, none are.
+
+        Raises InPUTException if any value is None or invalid, or if the
+        design is read-only.
+        """
+        if self.__readOnly:
+            raise InPUTException('Cannot set value on a read-only Design')
+        if None in values.values():
+            raise InPUTException('Cannot set to None value')
+        if self.isRuntimeValidationActive():
+            self.__checkAll(values)
+        for paramId in values:
+            if not self.__isTarget(paramId):
+                msg = 'No parameter with ID %s exists.'
+                raise InPUTException(msg % (paramId))
+        for (paramId, value) in values.items():
+            self.__prepareWrite(paramId)
+            util.setValue(paramId, self.params, value)
+        self.__supportedIds = None
+
+    def __isTarget(self, paramId):
+        """
+        Return whether the ID is a parameter or an existing array element
+        of this design.
+        """
+        if paramId in self.params:
+            return True
+        parts = paramId.split('.')
+        target = resolve(self.params.get(parts[0]))
+        for part in parts[1:]:
+            if not isinstance(target, list) or not part.isdigit():
+                return False
+            index = int(part) - 1
+            if not 0 <= index < len(target):
+                return False
+            target = target[index]
+        return len(parts) > 1
+
+    def __checkAll(self, values):
+        """
+        Check the values against the state of this design after they have
+        been set.
+        """
+        updated = dict(self.params)
+        for (paramId, value) in values.items():
+            if paramId in updated:
+                updated[paramId] = value
+        for paramId in self.__inDependencyOrder(values.keys()):
+            value = values[paramId]
+            if not self.__checkValidity(paramId, value, updated):
+                msg = 'Invalid value (%s) for parameter %s'
+                raise InPUTException(msg % (value, paramId))
+
+    def __inDependencyOrder(self, paramIds):
+        """
+        Return the parameter IDs sorted so that parameters come after any
+        parameters they depend on.
+        """
+        order = self.space.params.getInitializationOrder()
+        rank = {p: k for (k, ids) in order.items() for p in ids}
+        key = lambda p: rank.get(p, rank.get(util.root(p), 0))
+        return sorted(paramIds, key=key)
+
+    def isRuntimeValidationActive(self):
+        """
+        Return whether values are validated as they are set. Unless set
+        for this design specifically, the setting of the design space is
+        used. Designs without a space have nothing to validate against.
+        """
+        if self.__runtimeValidation is not None:
+            return self.__runtimeValidation
+        if self.space is None:
+            return False
+        return self.space.isRuntimeValidationActive()
+
+    def setRuntimeValidation(self, active):
+        """
+        Turn runtime validation on or off for this design. When off,
+        setting a value simply stores it, and validate can be used to
+        check all values afterwards. Passing None reverts to the setting
+        of the design space.
+        """
+        self.__runtimeValidation = active
+
+    def validate(self):
+        """
+        Check all values of this design against the design space.
+
+        Raises InPUTException, naming every invalid parameter, if any
+        value is invalid.
+        """
+        if self.space is None:
+            return
+        invalid = []
+        for paramId in self.__inDependencyOrder(self.params.keys()):
+            value = resolve(self.params[paramId])
+            param = self.space.params.getParam(paramId)
+            if param is None:
+                invalid.append(paramId)
+            elif param.isFixed():
+                if not isFixedValue(param, value):
+                    invalid.append(paramId)
+            elif value is None:
+                invalid.append(paramId)
+            elif not self.__isValid(paramId, param, value, self.params):
+                invalid.append(paramId)
+        if len(invalid) > 0:
+            msg = 'Invalid values for parameters %s'
+            raise InPUTException(msg % (', '.join(invalid)))
+
     def __setValue(self, paramId, value):
-        if not self.__checkValidity(paramId, value):
+        if not self.isRuntimeValidationActive():
+            if self.__readOnly:
+                raise InPUTException('Cannot set value on a read-only Design')
+        elif not self.__checkValidity(paramId, value):
             raise InPUTException('Invalid value (%s) for parameter %s' % (value, paramId))
+        if not self.__isTarget(paramId):
+            msg = 'No parameter with ID %s exists.'
+            raise InPUTException(msg % (paramId))
+        self.__prepareWrite(paramId)
         util.setValue(paramId, self.params, value)
-        self.__updateSupportedIds()
+        self.__supportedIds = None
 
-    def __checkValidity(self, paramId, value):
+    def __prepareWrite(self, paramId):
+        """
+        Make sure that setting the parameter does not affect any clones.
+        """
+        if self.__sharedParams:
+            self.params = dict(self.params)
+            self.__sharedParams = False
+        if self.__ownedArrays is None or paramId in self.params:
+            return
+        # Setting an array element.
+        root = util.root(paramId)
+        if root not in self.__ownedArrays:
+            self.params[root] = copyArray(self.params.get(root))
+            self.__ownedArrays.add(root)
+
+    def __checkValidity(self, paramId, value, dep=None):
         if self.__readOnly:
             raise InPUTException('Cannot set value on a read-only Design')
 
         # Array elements are not part of the supported keys.
+        depth = 0
         if paramId not in self.params:
-            paramId = util.root(paramId)
+            root = util.root(paramId)
+            depth = len(util.relativeTo(root, paramId))
+            paramId = root
         param = self.space.params.getParam(paramId)
 
         if param is not None and param.isFixed():
@@ -63,28 +372,123 @@ class Design(Identifiable):
 
         if param is None:
             return False
-        return param.isValid(value, self.params)
+        if dep is None:
+            dep = self.params
+        return self.__isValid(paramId, param, value, dep, depth)
+
+    def __isValid(self, paramId, param, value, values, depth=0):
+        """
+        Return whether the value is valid for the parameter, given the
+        values (mapping parameter IDs to values) of the parameters it
+        depends on. A value whose dependencies are missing is invalid.
+        For arrays, depth is the number of indexes of the element that the
+        value is for (see ParamStore.isValid).
+        """
+        store = self.space.params
+        dep = {}
+        element = param
+        if param.getTag() == ARRAY:
+            element = param.getElementParameter()
+        # Only numeric ranges depend on other values.
+        if element.getTag() != NPARAM:
+            return store.isValid(paramId, value, dep, depth)
+        for d in param.getDependees():
+            dependee = resolve(values.get(store.getAbsoluteId(paramId, d)))
+            if dependee is None:
+                return False
+            dep[d] = dependee
+        return store.isValid(paramId, value, dep, depth)
 
     def __updateSupportedIds(self):
-        self.supportedIds = set()
+        self.__supportedIds = set()
         for (paramId, value) in self.params.items():
             for id in util.getAllIds(paramId, value):
-                self.supportedIds.add(id)
+                self.__supportedIds.add(id)
+
+    def diff(self, other):
+        """
+        Return a Delta that turns the values of this design into the
+        values of the other design. Only the values of this design are
+        compared (not any designs extending it).
+        """
+        delta = {}
+        for (paramId, value) in other.params.items():
+            if paramId not in self.params:
+                delta[paramId] = resolve(value)
+            else:
+                value = resolve(value)
+                diffValues(paramId, resolve(self.params[paramId]), value,
+                    delta)
+        removed = [p for p in self.params if p not in other.params]
+        return Delta(delta, removed)
+
+    def applyDelta(self, delta):
+        """
+        Update this design with the changes in the delta. The values are
+        expected to come from a design of the same design space (see diff),
+        so they are not validated. Arrays are copied, so the delta is never
+        affected by later changes to this design.
+
+        Raises InPUTException if this design is read-only.
+        """
+        if self.__readOnly:
+            raise InPUTException('Cannot set value on a read-only Design')
+        if self.__sharedParams:
+            self.params = dict(self.params)
+            self.__sharedParams = False
+        for paramId in delta.removed:
+            del self.params[paramId]
+        elements = []
+        for (paramId, value) in delta.changes.items():
+            if self.__isArrayElement(paramId):
+                elements.append((paramId, value))
+            else:
+                self.params[paramId] = copyArray(value)
+                if self.__ownedArrays is not None:
+                    self.__ownedArrays.add(paramId)
+        for (paramId, value) in elements:
+            self.__prepareWrite(paramId)
+            util.setValue(paramId, self.params, copyArray(value))
+        self.__supportedIds = None
+
+    def __isArrayElement(self, paramId):
+        if paramId in self.params:
+            return False
+        return isinstance(self.params.get(util.root(paramId)), list)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, Design):
             return False
         if self.getId() != other.getId():
             return False
-        if self.space != other.space:
+        if self.space is not other.space and self.space != other.space:
             return False
+        if self.params is other.params:
+            return True
         if self.params.keys() != other.params.keys():
             return False
         for (k, v) in self.params.items():
-            if other.params[k] != v:
+            if resolve(other.params[k]) != resolve(v):
                 return False
         return True
 
+    def __hash__(self):
+        """
+        Hash the ID, the design space and the values of this design, so
+        that equal designs have equal hashes. A design should not be
+        modified while it is used as a dictionary key or set member.
+        """
+        if self.space is None:
+            fingerprint = None
+        else:
+            fingerprint = self.space.getFingerprint()
+        values = frozenset(
+            (k, hashValue(resolve(v))) for (k, v) in self.params.items()
+        )
+        return hash((self.getId(), fingerprint, values))
+
     def setReadOnly(self):
         self.__readOnly = True
 
@@ -105,7 +509,12 @@ class Design(Identifiable):
         return self.space
 
     def getSupportedParamIds(self):
-        return self.supportedIds
+        return self.__getIds()
+
+    def __getIds(self):
+        if self.__supportedIds is None:
+            self.__updateSupportedIds()
+        return self.__supportedIds
 
     # -------------------------------------------------------------------------
     # These are dummy implementations, taken from the first version of Design.
@@ -117,3 +526,148 @@ class Design(Identifiable):
     def same(self, design):
         pass
     # -------------------------------------------------------------------------
+
+
+class DesignArchive:
+    """
+    A sequence of designs, such as an optimizer trajectory, stored as a
+    base design followed by a chain of deltas. Each delta is relative to
+    the previous design, so a design that differs from its predecessor in
+    a few parameters only costs as much as those differences to store.
+    """
+    def __init__(self, base):
+        values = {k: copyArray(resolve(v)) for (k, v) in base.params.items()}
+        self.__base = Design(values, base.getSpace(), base.getId())
+        self.__last = self.__base.clone()
+        self.__deltas = []
+        self.__ids = [base.getId()]
+
+    def append(self, design):
+        """
+        Add the design to the end of the archive.
+        """
+        self.__deltas.append(self.__last.diff(design))
+        self.__ids.append(design.getId())
+        self.__last = design.clone()
+
+    def getBase(self):
+        return self.__base
+
+    def getDeltas(self):
+        """
+        Return the list of deltas. The delta at index i turns design i
+        into design i+1.
+        """
+        return self.__deltas
+
+    def getDesign(self, index):
+        """
+        Return the design at the index by replaying the deltas leading up
+        to it.
+        """
+        index = range(len(self))[index]     # Handles negative indexes.
+        design = self.__base.clone(self.__ids[index])
+        for delta in self.__deltas[:index]:
+            design.applyDelta(delta)
+        return design
+
+    def __len__(self):
+        return len(self.__ids)
+
+    def __iter__(self):
+        """
+        Return a generator over the designs in the archive. The deltas are
+        replayed on a single set of values, so each step costs as much as
+        the changes it makes. The designs are views of those values, and
+        are only copied once they are changed.
+        """
+        replay = _Replay(self.__base.params)
+        space = self.__base.getSpace()
+        for (i, designId) in enumerate(self.__ids):
+            if i > 0:
+                replay.apply(self.__deltas[i-1])
+            yield Design.fromSharedValues(replay.getView(), space, designId)
+
+
+_MISSING = object()
+
+class _Replay:
+    """
+    Values that deltas are applied to, one version at a time. Every
+    earlier version can still be read through a view, because the values
+    replaced by each change are kept (with the version they belong to).
+    """
+    def __init__(self, values):
+        self.current = dict(values)
+        self.version = 0
+        self.history = {}   # ID -> [(last version, value)] for old values.
+
+    def apply(self, delta):
+        for paramId in delta.removed:
+            self.__set(paramId, _MISSING)
+        copied = set()
+        for (paramId, value) in delta.changes.items():
+            root = util.root(paramId)
+            isElement = paramId not in self.current and \
+                isinstance(self.current.get(root), list)
+            if not isElement:
+                self.__set(paramId, value)
+                continue
+            # Arrays seen by earlier versions are never changed in place.
+            if root not in copied:
+                self.__set(root, copyArray(self.current[root]))
+                copied.add(root)
+            util.setValue(paramId, self.current, value)
+        self.version += 1
+
+    def __set(self, paramId, value):
+        old = self.current.get(paramId, _MISSING)
+        self.history.setdefault(paramId, []).append((self.version, old))
+        if value is _MISSING:
+            del self.current[paramId]
+        else:
+            self.current[paramId] = value
+
+    def get(self, paramId, version):
+        """
+        Return the value that the parameter had in the version, or
+        _MISSING.
+        """
+        changes = self.history.get(paramId)
+        if changes is not None:
+            i = bisect.bisect_left(changes, version, key=lambda c: c[0])
+            if i < len(changes):
+                return changes[i][1]
+        return self.current.get(paramId, _MISSING)
+
+    def getIds(self, version):
+        ids = list(self.current)
+        ids.extend(p for p in self.history if p not in self.current)
+        return [p for p in ids if self.get(p, version) is not _MISSING]
+
+    def getView(self):
+        return _ReplayView(self, self.version)
+
+
+class _ReplayView(Mapping):
+    """
+    A read-only view of one version of the values of a _Replay.
+    """
+    def __init__(self, replay, version):
+        self.__replay = replay
+        self.__version = version
+
+    def __getitem__(self, paramId):
+        value = self.__replay.get(paramId, self.__version)
+        if value is _MISSING:
+            raise KeyError(paramId)
+        return value
+
+    def __contains__(self, paramId):
+        return self.__replay.get(paramId, self.__version) is not _MISSING
+
+    def __iter__(self):
+        return iter(self.__replay.getIds(self.__version))
+
+    def __len__(self):
+        return len(self.__replay.getIds(self.__version))
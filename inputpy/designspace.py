@@ -4,16 +4,105 @@ inputpy.designspace
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import math
+import random
+import inputpy.config as config
 import inputpy.generators as generator
 import inputpy.util as util
 import inputpy.mapping as mapping
 import inputpy.param as param
-from inputpy.design import Design
-from inputpy.param import Identifiable
+from inputpy.design import Design, LazyValue, resolve, hashValue, copyArray
+from inputpy.exceptions import InPUTException
+from inputpy.param import Identifiable, isFixedValue
 from inputpy.paramstore import ParamStore
 from inputpy.util import Identifiable
 from inputpy.q import *
 
+def isDeferrable(param):
+    """
+    Return whether initializing the parameter can be postponed until its
+    value is requested. Only structured parameters, which need objects to
+    be constructed, are worth deferring. Strings are cheap.
+    """
+    tag = param.getTag()
+    return (tag == SPARAM or tag == SCHOICE) and param.getType() != STRING
+
+class EmptyRangeError(ValueError):
+    """
+    Raised when a parameter cannot be initialized because its value range,
+    given the values of the parameters it depends on, is empty.
+    """
+    def __init__(self, paramId):
+        ValueError.__init__(self, 'Invalid range')
+        self.paramId = paramId
+
+def resolveAll(values):
+    """
+    Return a copy of the dictionary with any lazy values forced.
+    """
+    return {k: resolve(v) for (k, v) in values.items()}
+
+def getChoiceId(param, value):
+    """
+    Return the ID of the choice that the value of the Choice parameter
+    corresponds to, or None if no choice matches.
+    String choices are identified by value, and all others by type.
+    """
+    for c in param.getChoices():
+        schoice = c.getSChoices()[0]
+        if schoice.getType() == STRING:
+            if value == schoice.getRelativeId():
+                return value
+        elif type(value) is schoice.getMapping().getType():
+            return schoice.getRelativeId()
+    return None
+
+def getElementParameter(param):
+    """
+    Return the parameter that the innermost elements of an array have.
+    """
+    if param.getTag() == ARRAY:
+        return param.getElementParameter()
+    return param
+
+def getArraySizes(param):
+    """
+    Return the sizes of the dimensions of an array parameter, outermost
+    first. Unspecified sizes count as 1, like when generating values.
+    """
+    if param.getTag() != ARRAY:
+        return []
+    return [size or 1 for size in param.getShape()]
+
+def getWidth(bounds):
+    """
+    Return the total width of the union of the Bounds.
+    """
+    width = 0
+    end = -math.inf
+    for b in sorted(bounds, key=lambda b: b.lo):
+        if b.hi > end:
+            width += b.hi - max(b.lo, end)
+            end = b.hi
+    return width
+
+def mutateArray(param, value, rate, scale, rng, dep, affected):
+    """
+    Return a copy of the (possibly nested) array value where each element
+    has been perturbed with probability rate. If the dependencies have
+    changed (affected), then the remaining elements are clamped.
+    """
+    if isinstance(value, list):
+        return [
+            mutateArray(param, v, rate, scale, rng, dep, affected)
+            for v in value
+        ]
+    if rate > 0 and rng.random() < rate:
+        return generator.perturb(param, value, scale, rng, dep)
+    if affected:
+        return generator.clamp(param, value, dep)
+    return value
+
 class DesignSpace(Identifiable):
     """
     The design space contains a set of parameters and is capable of
@@ -23,15 +112,34 @@ class DesignSpace(Identifiable):
     - No parameters can be added to an existing design space.
     - Parameters cannot be removed from the design space.
     - Parameters cannot be modified(*).
-    - No internal state exists, apart from the set of parameters.
-      This means that, initializing parameters (whether single parameters,
-      using next(), or the full set, using nextDesign()), does not have side
-      effects.
 
     * Parameters can be set to a fixed value though. That's the only
-      mutability exception.
+      mutability exception for parameters.
+
+    Apart from the parameters, a design space keeps some sampling state,
+    which is shared by everything that uses the space:
+    - The designs seen by unique sampling (nextDesign(unique=True) and
+      markSeen), until clearSeen is called.
+    - The number of rejected samples per parameter (getRejections), until
+      clearRejections is called.
+    - Settings: runtime validation and the resampling strategy.
+    - Cached results that only depend on the parameters, such as the
+      cardinality. These are recomputed when the parameters change.
+    Initializing parameters has no other side effects.
     """
 
+    UNIFORM = 'uniform'
+    SUBTREE = 'subtree'
+    CROSSOVER_METHODS = (UNIFORM, SUBTREE,)
+    # How many duplicates to sample in a row before giving up.
+    UNIQUE_RETRIES = 100
+    # How many values of a parameter to enumerate at most while counting.
+    COUNT_LIMIT = 100000
+    NO_RESAMPLING = 'none'
+    RETRY = 'retry'
+    BACKTRACK = 'backtrack'
+    RESAMPLING_STRATEGIES = (NO_RESAMPLING, RETRY, BACKTRACK,)
+
     # fileName is currently ignored.
     def __init__(self, paramStore=None, spaceId=None, fileName=None):
         """
@@ -46,6 +154,13 @@ class DesignSpace(Identifiable):
         self.fileName = fileName
         self.params = paramStore or ParamStore()
         self.params.finalize()
+        self.__runtimeValidation = config.isRuntimeValidationActive()
+        self.__seen = set()     # Keys of designs sampled in unique mode.
+        self.__bloomArgs = None # Bloom filter arguments, if used.
+        self.__cache = {}       # Results that only depend on the params.
+        self.__cacheFingerprint = None
+        self.__resampling = (self.NO_RESAMPLING, 0)
+        self.__rejections = {}  # Parameter ID -> number of empty ranges.
 
     def getSupportedParamIds(self):
         return self.params.getSupportedParamIds()
@@ -71,14 +186,839 @@ class DesignSpace(Identifiable):
             param = parent.getChoice(relativeId)
         return self.__initParam(param, {})[paramId]
 
-    def nextDesign(self, designId=None, readOnly=False):
+    def nextDesign(self, designId=None, readOnly=False, lazy=False,
+            given=None, unique=False):
         """
         Return a new design with freshly initialized parameters.
+
+        A lazy design only samples numeric values and choices up front.
+        Structured parameters (SParams) are instantiated the first time
+        their value is requested, and are then memoized.
+
+        The optional given argument maps parameter IDs to values that the
+        design should have. Any parameter that depends on a given value is
+        initialized relative to it. For a parameter with choices, the value
+        may also be the ID of a choice, in which case that choice is made
+        and the parameter is initialized as usual.
+        Unlike setFixed, this does not modify the design space.
+
+        If unique is true, then the design is guaranteed to differ from
+        every design that has previously been sampled in unique mode (or
+        marked as seen). Duplicates are rejected and sampled again. If
+        that keeps failing, a finite space is searched (see enumerate).
+
+        Raises InPUTException if a given value is invalid, or if no new
+        design could be found in unique mode.
         """
-        params = {}
+        (values, choices) = self.__resolveGiven(given)
+        if unique:
+            return self.__nextUniqueDesign(designId, readOnly, lazy,
+                values, choices)
+        return self.__nextDesign(designId, readOnly, lazy, values, choices)
+
+    def nextDesigns(self, n, readOnly=False, lazy=False, given=None,
+            unique=False):
+        """
+        Return a list of n new designs. The keyword arguments work exactly
+        like for nextDesign, but the given values are only checked once for
+        the whole batch.
+        """
+        (values, choices) = self.__resolveGiven(given)
+        if unique:
+            f = self.__nextUniqueDesign
+        else:
+            f = self.__nextDesign
+        return [f(None, readOnly, lazy, values, choices) for i in range(n)]
+
+    def markSeen(self, design):
+        """
+        Record the design as sampled, so that unique mode will not produce
+        an equivalent design. Only the values matter, not the design ID.
+        """
+        self.__seen.add(self.__getDesignKey(design))
+
+    def clearSeen(self):
+        """
+        Forget all designs sampled in unique mode, keeping the kind of
+        record (set or Bloom filter).
+        """
+        if self.__bloomArgs is None:
+            self.__seen = set()
+        else:
+            self.__seen = util.BloomFilter(*self.__bloomArgs)
+
+    def useBloomFilter(self, capacity, errorRate=0.01):
+        """
+        Record designs sampled in unique mode in a Bloom filter instead of
+        a set. This uses a small, fixed amount of memory for very long
+        streams of designs, at the cost of occasionally rejecting a design
+        that has not actually been seen (at roughly the error rate).
+        Any designs seen so far are forgotten.
+        """
+        self.__bloomArgs = (capacity, errorRate)
+        self.__seen = util.BloomFilter(capacity, errorRate)
+
+    def __nextUniqueDesign(self, designId, readOnly, lazy, given, choices):
+        for i in range(self.UNIQUE_RETRIES):
+            design = self.__nextDesign(designId, readOnly, lazy, given,
+                choices)
+            key = self.__getDesignKey(design)
+            if key not in self.__seen:
+                self.__seen.add(key)
+                return design
+        msg = 'No new design found in %d attempts. The design space is ' \
+            'probably exhausted.'
+        if len(given) > 0 or len(choices) > 0:
+            raise InPUTException(msg % (self.UNIQUE_RETRIES))
+        # Look for a design that has not been seen, if the space is finite.
+        try:
+            for design in self.__enumerateDesigns(designId, readOnly, lazy):
+                key = self.__getDesignKey(design)
+                if key not in self.__seen:
+                    self.__seen.add(key)
+                    return design
+        except InPUTException:
+            raise InPUTException(msg % (self.UNIQUE_RETRIES))
+        raise InPUTException('The design space is exhausted')
+
+    def __getDesignKey(self, design):
+        """
+        Return a hash that identifies the values of the design. Structured
+        values are identified by their choices and their nested values, and
+        the values that belong to choices that were not made are ignored.
+        Lazy values are not resolved.
+        """
+        choices = {}
+        ignored = []
+        for (paramId, value) in design.params.items():
+            param = self.params.getParam(paramId)
+            if param is None or param.getTag() != CHOICE:
+                continue
+            if isinstance(value, LazyValue) and not value.isResolved():
+                choiceId = value.getChoiceId()
+            else:
+                choiceId = getChoiceId(param, resolve(value))
+            choices[paramId] = choiceId
+            for c in param.getChoiceIds():
+                if c != choiceId:
+                    ignored.append(util.absolute(paramId, c))
+        key = []
+        for (paramId, value) in design.params.items():
+            if any(paramId == i or paramId.startswith(i + '.')
+                    for i in ignored):
+                continue
+            param = self.params.getParam(paramId)
+            if paramId in choices:
+                key.append((paramId, choices[paramId]))
+            elif param is not None and isDeferrable(param):
+                key.append((paramId, None))
+            else:
+                key.append((paramId, hashValue(resolve(value))))
+        return hash(frozenset(key))
+
+    def validate(self, designs):
+        """
+        Check a batch of designs against this design space, one parameter
+        at a time. The designs may be Design objects or dictionaries
+        mapping parameter IDs to values. Alternatively, the batch may be
+        given as columns: a dictionary mapping each parameter ID to a list
+        of values, one for each design.
+
+        Return a violation mask as a dictionary mapping each parameter ID
+        to a list of booleans, one for each design, that are true where the
+        value is invalid. Unknown parameters are always invalid, and so are
+        dependent values whose dependencies are missing. Parameters that a
+        design lacks are never flagged. Arrays must have the right shape as
+        well as valid elements.
+
+        Ranges are first checked against the precomputed bounds of each
+        parameter (see ParamStore.checkBounds), so dependent limits are
+        only evaluated for the values that the bounds cannot decide.
+        """
+        if isinstance(designs, dict):
+            columns = designs
+            rows = None
+            n = max([len(c) for c in columns.values()] or [0])
+        else:
+            rows = [
+                d.params if isinstance(d, Design) else d for d in designs
+            ]
+            columns = {}
+            for (i, row) in enumerate(rows):
+                for paramId in row:
+                    columns.setdefault(paramId, {})[i] = row[paramId]
+            n = len(rows)
+
+        mask = {}
+        resolved = {}   # Design index -> resolved values of that design.
+        for (paramId, column) in columns.items():
+            if not isinstance(column, dict):
+                column = dict(enumerate(column))
+            param = self.params.getParam(paramId)
+            violations = [False] * n
+            mask[paramId] = violations
+            undecided = {}  # Dependency values -> (indexes, values).
+            dependencies = None
+            element = param
+            if param is not None and param.getTag() == ARRAY:
+                element = param.getElementParameter()
+            for (i, value) in column.items():
+                value = resolve(value)
+                if param is None or value is None:
+                    violations[i] = True
+                elif param.isFixed():
+                    violations[i] = not isFixedValue(param, value)
+                elif element.getTag() != NPARAM or not param.isDependent():
+                    # Only numeric parameters have dependent ranges.
+                    violations[i] = not self.params.isValid(paramId, value)
+                else:
+                    if param.getTag() == NPARAM:
+                        valid = self.params.checkBounds(paramId, value)
+                        if valid is not None:
+                            violations[i] = not valid
+                            continue
+                    if i not in resolved:
+                        resolved[i] = self.__getRow(rows, columns, i)
+                    row = resolved[i]
+                    if dependencies is None:
+                        dependencies = self.__getAbsoluteDependencies(
+                            paramId, param)
+                    if any(a not in row for a in dependencies.values()):
+                        violations[i] = True
+                        continue
+                    key = tuple(row[a] for a in dependencies.values())
+                    if param.getTag() == ARRAY:
+                        dep = dict(zip(dependencies, key))
+                        valid = self.params.isValid(paramId, value, dep)
+                        violations[i] = not valid
+                        continue
+                    try:
+                        group = undecided.setdefault(key, ([], []))
+                    except TypeError:
+                        dep = dict(zip(dependencies, key))
+                        violations[i] = not param.isValid(value, dep)
+                        continue
+                    group[0].append(i)
+                    group[1].append(value)
+            # Values with the same dependency values are checked together.
+            for (key, (indexes, values)) in undecided.items():
+                dep = dict(zip(dependencies, key))
+                for (i, valid) in zip(indexes, param.isValidMany(values, dep)):
+                    violations[i] = not valid
+        return mask
+
+    @staticmethod
+    def __getRow(rows, columns, i):
+        """
+        Return a dictionary mapping parameter IDs to (resolved) values for
+        design i of a batch.
+        """
+        if rows is not None:
+            return resolveAll(rows[i])
+        return {
+            k: resolve(c[i]) for (k, c) in columns.items() if i < len(c)
+        }
+
+    def enumerate(self, readOnly=False, lazy=False):
+        """
+        Return a generator over every design in this design space. The
+        space must be finite, meaning that all numeric parameters are
+        integers or booleans (or fixed), and all structured parameters are
+        built from such parameters and choices.
+
+        The designs are produced one at a time, in the same order as
+        designAt indexes them. Each choice is expanded in turn, and within
+        a choice, the parameters vary like the digits of a number, with
+        the last parameter in initialization order varying the fastest.
+        Dependent ranges are evaluated for each value of the parameters
+        they depend on.
+
+        Raises InPUTException (when iterated) if the space is not finite.
+        """
+        return self.__enumerateDesigns(None, readOnly, lazy)
+
+    def __enumerateDesigns(self, designId, readOnly, lazy):
+        for (choices, leaves, free, needed) in self.__getStructure():
+            for values in self.__enumerateValues(leaves):
+                yield self.__nextDesign(designId, readOnly, lazy, values,
+                    choices)
+
+    def cardinality(self):
+        """
+        Return the number of designs in this design space. See enumerate.
+        This takes constant time per parameter unless some ranges depend on
+        other parameters, in which case the values of the parameters they
+        depend on are enumerated.
+
+        The result is cached until the parameters change.
+
+        Raises InPUTException if the space is not finite, or if counting
+        would require enumerating more than COUNT_LIMIT values of a
+        parameter.
+        """
+        return self.__getCached('cardinality', self.__findCardinality)
+
+    def __findCardinality(self):
+        return sum(
+            self.__count(leaves, free, needed, 0, {})
+            for (choices, leaves, free, needed) in self.__getStructure()
+        )
+
+    def volume(self):
+        """
+        Return the measure of the continuous part of this design space.
+        That is the product of the widths of the ranges of all float
+        parameters (counting each array element), summed over every
+        combination of choices. A parameter with multiple ranges has the
+        total width of their union. Discrete parameters, including floats
+        with a single possible value, do not contribute, and combinations
+        of choices without continuous parameters have no volume.
+
+        Dependent ranges are bounded using interval arithmetic (see
+        ParamStore.getBounds), which makes the volume an upper bound for
+        spaces with dependent float parameters.
+        The result is computed without sampling and cached until the
+        parameters change.
+        """
+        return self.__getCached('volume', self.__findVolume)
+
+    def __findVolume(self):
+        total = 0
+        for (choices, leaves, free, needed) in self.__getStructure():
+            volume = None
+            for (paramId, param, dependencies) in leaves:
+                element = getElementParameter(param)
+                if element.getType() not in generator.FLOAT_TYPES:
+                    continue
+                width = getWidth(self.params.getBounds(paramId))
+                if width == 0:
+                    continue
+                for size in getArraySizes(param):
+                    width = width ** size
+                volume = width * (1 if volume is None else volume)
+            total += volume or 0
+        return total
+
+    def designAt(self, index, designId=None, readOnly=False, lazy=False):
+        """
+        Return the design at the index in the enumeration of this design
+        space, without enumerating the designs before it. Negative indexes
+        count from the end.
+
+        Raises IndexError if the index is out of range, and InPUTException
+        if the space is not finite.
+        """
+        if index < 0:
+            index += self.cardinality()
+        if index >= 0:
+            for (choices, leaves, free, needed) \
+                    in self.__getStructure():
+                count = self.__count(leaves, free, needed, 0, {})
+                if index < count:
+                    values = self.__getValuesAt(leaves, free, needed, index)
+                    return self.__nextDesign(designId, readOnly, lazy,
+                        values, choices)
+                index -= count
+        raise IndexError('Design index out of range')
+
+    def __getStructure(self):
+        """
+        Return a list with one (choices, leaves, free, needed) tuple for
+        every combination of choices. The leaves are the (ID, param,
+        dependency) tuples of the parameters whose values need to be
+        enumerated, in initialization order. The dependency dictionary maps
+        references to absolute IDs. free[i] is true if none of the leaves
+        from index i depend on each other, and needed[i] is true if any
+        later leaf depends on leaf i.
+        """
+        return self.__getCached('structure', self.__findStructure)
+
+    def __findStructure(self):
+        structure = []
+        for (choices, leaves) in self.__getChoiceCombinations({}):
+            index = {leaf[0]: i for (i, leaf) in enumerate(leaves)}
+            free = [True] * (len(leaves) + 1)
+            needed = [False] * len(leaves)
+            last = -1
+            for i in reversed(range(len(leaves))):
+                dep = [index[d] for d in leaves[i][2].values() if d in index]
+                for j in dep:
+                    needed[j] = True
+                last = max([last] + dep)
+                free[i] = last < i
+            structure.append((choices, leaves, free, needed))
+        return structure
+
+    def __getCached(self, name, f):
+        """
+        Return the cached result of calling f, calling it if necessary.
+        The cache is cleared whenever the parameters change.
+        """
+        fingerprint = self.getFingerprint()
+        if fingerprint != self.__cacheFingerprint:
+            self.__cache = {}
+            self.__cacheFingerprint = fingerprint
+        if name not in self.__cache:
+            self.__cache[name] = f()
+        return self.__cache[name]
+
+    def __getChoiceCombinations(self, choices):
+        """
+        Return a list of (choices, leaves) tuples, for every way of
+        extending the choices to all reachable parameters with choices.
+        """
+        leaves = []
+        visited = set()
+        undecided = None
+        for p in self.params.getTopLevelParameters():
+            undecided = self.__findLeaves(p, choices, visited, leaves)
+            if undecided is not None:
+                break
+        if undecided is None:
+            return [(choices, leaves)]
+        result = []
+        for choiceId in undecided.getChoiceIds():
+            extended = dict(choices)
+            extended[undecided.getId()] = choiceId
+            result += self.__getChoiceCombinations(extended)
+        return result
+
+    def __findLeaves(self, param, choices, visited, leaves):
+        """
+        Visit the parameter, and the parameters it depends on, the same
+        way that __initParam initializes them, and append any numeric
+        parameters to the leaves. Return the first parameter found that
+        has choices that have not been made, or None.
+        """
+        paramId = param.getId()
+        if paramId in visited:
+            return None
+        visited.add(paramId)
+        if param.getTag() == CHOICE:
+            if paramId not in choices:
+                return param
+            param = param.getChoice(choices[paramId])
+        dependencies = {}
+        for d in param.getDependees():
+            absolute = self.params.getAbsoluteId(paramId, d)
+            dependencies[d] = absolute
+            dependee = self.params.getParam(absolute)
+            undecided = self.__findLeaves(dependee, choices, visited, leaves)
+            if undecided is not None:
+                return undecided
+        if param.getTag() in (NPARAM, ARRAY):
+            leaves.append((paramId, param, dependencies))
+        return None
+
+    def __getDomain(self, leaf, values):
+        (paramId, param, dependencies) = leaf
+        dep = {d: values[a] for (d, a) in dependencies.items() if a in values}
+        try:
+            return generator.getDomain(param, dep)
+        except ValueError as e:
+            raise InPUTException(str(e))
+
+    def __enumerateValues(self, leaves):
+        """
+        Generate every combination of values for the leaves, as
+        dictionaries mapping IDs to values.
+        """
+        if len(leaves) == 0:
+            yield {}
+            return
+        values = {}
+        stack = [iter(self.__getDomain(leaves[0], values))]
+        while len(stack) > 0:
+            i = len(stack) - 1
+            try:
+                values[leaves[i][0]] = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            if i + 1 == len(leaves):
+                yield dict(values)
+            else:
+                stack.append(iter(self.__getDomain(leaves[i + 1], values)))
+
+    def __count(self, leaves, free, needed, index, values):
+        """
+        Return the number of combinations of values for the leaves from
+        the index, given the values of the leaves before it.
+        """
+        if free[index]:
+            result = 1
+            for leaf in leaves[index:]:
+                result *= len(self.__getDomain(leaf, values))
+            return result
+        domain = self.__getDomain(leaves[index], values)
+        if not needed[index]:
+            rest = self.__count(leaves, free, needed, index + 1, values)
+            return len(domain) * rest
+        self.__checkCountLimit(leaves[index], domain)
+        paramId = leaves[index][0]
+        result = 0
+        for value in domain:
+            values[paramId] = value
+            result += self.__count(leaves, free, needed, index + 1, values)
+        del values[paramId]
+        return result
+
+    def __checkCountLimit(self, leaf, domain):
+        if len(domain) > self.COUNT_LIMIT:
+            msg = 'Cannot count designs: other ranges depend on %s, ' \
+                'which has too many values'
+            raise InPUTException(msg % (leaf[0]))
+
+    def __getValuesAt(self, leaves, free, needed, index):
+        """
+        Return the combination of values at the index of the enumeration
+        of the leaves.
+        """
+        values = {}
+        for i in range(len(leaves)):
+            if free[i]:
+                # The remaining leaves are digits of a mixed-radix number.
+                domains = [self.__getDomain(l, values) for l in leaves[i:]]
+                digits = []
+                for domain in reversed(domains):
+                    (index, j) = divmod(index, len(domain))
+                    digits.append(domain[j])
+                for (leaf, value) in zip(leaves[i:], reversed(digits)):
+                    values[leaf[0]] = value
+                return values
+            paramId = leaves[i][0]
+            domain = self.__getDomain(leaves[i], values)
+            if not needed[i]:
+                rest = self.__count(leaves, free, needed, i + 1, values)
+                (j, index) = divmod(index, rest)
+                values[paramId] = domain[j]
+                continue
+            self.__checkCountLimit(leaves[i], domain)
+            for value in domain:
+                values[paramId] = value
+                count = self.__count(leaves, free, needed, i + 1, values)
+                if index < count:
+                    break
+                index -= count
+        return values
+
+    def mutate(self, design, rate=0.1, scale=0.1, seed=None):
+        """
+        Return a new design that is a random neighbor of the given design.
+
+        Each numeric parameter (or numeric array element) is perturbed
+        with probability rate. Integers and floats take a normally
+        distributed step, with a standard deviation of scale times the
+        width of their range, and stay inside their range. Booleans are
+        flipped. Parameters with choices switch to a different choice
+        with probability rate, and the new choice is initialized as usual.
+        Fixed parameters never change.
+
+        Only parameters that depend on a changed value are repaired:
+        numeric values are clamped into their updated range, and
+        structured values are instantiated again.
+
+        The seed makes the mutation itself reproducible. Any newly chosen
+        parameters are initialized exactly like in nextDesign.
+        """
+        return self.__mutate(design, rate, scale, random.Random(seed))
+
+    def mutateDesigns(self, designs, rate=0.1, scale=0.1, seed=None):
+        """
+        Return a list of mutated designs, one for each of the given
+        designs. See mutate.
+        """
+        rng = random.Random(seed)
+        return [self.__mutate(d, rate, scale, rng) for d in designs]
+
+    def crossover(self, design, other, method=UNIFORM, rate=0.5, seed=None):
+        """
+        Return a pair of new designs that recombine the values of the two
+        designs. The second design gets the values the first one did not.
+
+        Values are inherited in units. In uniform crossover, every
+        parameter is a unit of its own, except that a parameter with
+        choices is inherited together with everything nested in the
+        chosen SChoice. In subtree crossover, every top level parameter is
+        inherited together with all of its nested parameters.
+        The first design inherits each unit from the other design with
+        probability rate.
+
+        Values that depend on values inherited from the other design are
+        repaired like in mutate.
+
+        Raises ValueError if the method is not one of CROSSOVER_METHODS.
+        """
+        self.__checkCrossoverMethod(method)
+        rng = random.Random(seed)
+        return self.__crossover(design, other, method, rate, rng)
+
+    def crossoverDesigns(self, designs, others, method=UNIFORM, rate=0.5,
+            seed=None):
+        """
+        Return a list of design pairs, where each pair is the result of
+        crossing over the designs at the same position in the two
+        sequences. See crossover.
+        """
+        self.__checkCrossoverMethod(method)
+        rng = random.Random(seed)
+        return [
+            self.__crossover(d, o, method, rate, rng)
+            for (d, o) in zip(designs, others)
+        ]
+
+    def __crossover(self, design, other, method, rate, rng):
+        parents = (resolveAll(design.params), resolveAll(other.params))
+        children = ({}, {})
+        origins = ({}, {})
+        swapped = {}
+        for i in (0, 1):
+            for (paramId, value) in parents[i].items():
+                unit = self.__getCrossoverUnit(paramId, method)
+                if unit not in swapped:
+                    swapped[unit] = rng.random() < rate
+                child = i ^ swapped[unit]
+                children[child][paramId] = value
+                origins[child][paramId] = i
+        return tuple(
+            self.__rebuild(children[i], origins[i], 0, 0, rng) for i in (0, 1)
+        )
+
+    def __getCrossoverUnit(self, paramId, method):
+        """
+        Return the ID of the parameter that the parameter is inherited
+        together with during crossover.
+        """
+        if method == DesignSpace.SUBTREE:
+            return util.root(paramId)
+        # Find the outermost choice that this parameter is nested in.
+        unit = paramId
+        child = paramId
+        ancestor = util.parent(paramId)
+        while ancestor is not None:
+            param = self.params.getParam(ancestor)
+            if param is not None and param.getTag() == CHOICE:
+                if util.relative(child) in param.getChoiceIds():
+                    unit = ancestor
+            child = ancestor
+            ancestor = util.parent(ancestor)
+        return unit
+
+    @classmethod
+    def __checkCrossoverMethod(cls, method):
+        if not method in cls.CROSSOVER_METHODS:
+            raise ValueError('%s is not a valid crossover method' % (method))
+
+    def __mutate(self, design, rate, scale, rng):
+        values = resolveAll(design.params)
+        return self.__rebuild(values, {}, rate, scale, rng)
+
+    def __rebuild(self, values, origin, rate, scale, rng):
+        """
+        Return a design with the values, after mutating them and repairing
+        any values that depend on changed values.
+
+        The origin argument maps parameter IDs to the design each value
+        was taken from. A value that depends on a value of a different
+        origin is also repaired. A rate of 0 means that nothing is mutated.
+        """
+        choices = self.__getChoiceIds(values)
+        changed = set()
+        regenerate = set()
+
+        for paramId in self.__getOrderedParamIds():
+            param = self.params.getParam(paramId)
+            tag = param.getTag()
+            if tag == CHOICE and paramId in choices:
+                param = param.getChoice(choices[paramId])
+            dependencies = self.__getAbsoluteDependencies(paramId, param)
+            # An SChoice belongs to the same design as its parent.
+            if tag == SCHOICE:
+                own = origin.get(param.getParentId())
+            else:
+                own = origin.get(paramId)
+            affected = any(
+                a in changed or origin.get(a) != own
+                for a in dependencies.values()
+            )
+
+            # SChoices are never part of a design, but they are instantiated
+            # again whenever any of their own dependencies change.
+            if tag == SCHOICE:
+                if affected:
+                    changed.add(paramId)
+                continue
+            value = values.get(paramId)
+            if value is None:
+                continue
+
+            dep = {d: values.get(a) for (d, a) in dependencies.items()}
+            mutable = rate > 0 and not param.isFixed()
+            if tag == CHOICE:
+                param = self.params.getParam(paramId)
+                if mutable and rng.random() < rate:
+                    affected = self.__switchChoice(param, values, choices, rng)
+            elif tag == NPARAM:
+                if mutable and rng.random() < rate:
+                    newValue = generator.perturb(param, value, scale, rng, dep)
+                elif affected:
+                    newValue = generator.clamp(param, value, dep)
+                else:
+                    continue
+                if newValue != value:
+                    values[paramId] = newValue
+                    changed.add(paramId)
+                continue
+            elif tag == ARRAY:
+                element = getElementParameter(param)
+                if element.getTag() == NPARAM and not param.isFixed():
+                    # Numeric arrays are clamped rather than regenerated.
+                    if not (mutable or affected):
+                        continue
+                    values[paramId] = mutateArray(element, value, rate, scale,
+                        rng, dep, affected)
+                    if values[paramId] != value:
+                        changed.add(paramId)
+                    continue
+
+            if affected:
+                regenerate.add(paramId)
+                changed.add(paramId)
+
+        for paramId in regenerate:
+            del values[paramId]
         for p in self.params.getTopLevelParameters():
-            params = self.__initParam(p, params)
+            values = self.__initParam(p, values, choices=choices)
+        return Design(self.__withoutSChoices(values), self)
+
+    def __switchChoice(self, param, values, choices, rng):
+        """
+        Make a different choice for the parameter, if possible, and remove
+        the values that belonged to the old choice. Return whether a new
+        choice was made.
+        """
+        paramId = param.getId()
+        current = choices.get(paramId)
+        alternatives = [c for c in param.getChoiceIds() if c != current]
+        if len(alternatives) == 0:
+            return False
+        if current is not None:
+            prefix = util.absolute(paramId, current) + '.'
+            for k in [k for k in values if k.startswith(prefix)]:
+                del values[k]
+        choices[paramId] = rng.choice(alternatives)
+        return True
+
+    def __getChoiceIds(self, values):
+        """
+        Return a dictionary mapping the IDs of any parameters with choices
+        to the IDs of the choices that the values correspond to.
+        """
+        choices = {}
+        for (paramId, value) in values.items():
+            param = self.params.getParam(paramId)
+            if param is None or param.getTag() != CHOICE:
+                continue
+            choiceId = getChoiceId(param, value)
+            if choiceId is not None:
+                choices[paramId] = choiceId
+        return choices
 
+    def __getAbsoluteDependencies(self, paramId, param):
+        """
+        Return a dictionary mapping the dependencies of the parameter, as
+        they are referenced, to absolute parameter IDs.
+        """
+        return {
+            d: self.params.getAbsoluteId(paramId, d)
+            for d in param.getDependees()
+        }
+
+    def __getOrderedParamIds(self):
+        """
+        Return all parameter IDs in an order where every parameter comes
+        after the parameters it depends on.
+        """
+        return self.params.getIndexedParamIds()
+
+    def __nextDesign(self, designId, readOnly, lazy, given, choices):
+        params = {}
+        (strategy, attempts) = self.__resampling
+        (depth, tries) = (1, 0)
+        while True:
+            try:
+                for p in self.params.getTopLevelParameters():
+                    params = self.__initParam(p, params, lazy, given, choices)
+                break
+            except EmptyRangeError as e:
+                paramId = e.paramId
+                self.__rejections[paramId] = \
+                    self.__rejections.get(paramId, 0) + 1
+                if strategy == self.NO_RESAMPLING:
+                    raise
+                upstream = self.__getUpstream(paramId, depth, given)
+                if tries == attempts:
+                    if strategy == self.RETRY:
+                        raise
+                    previous = upstream
+                    (depth, tries) = (depth + 1, 0)
+                    upstream = self.__getUpstream(paramId, depth, given)
+                    if upstream == previous:
+                        raise   # The whole chain has been tried.
+                if not upstream:
+                    raise
+                self.__discard(params, upstream | {paramId})
+                tries += 1
+        params = self.__withoutSChoices(params)
+        return Design(params, self, designId, readOnly=readOnly)
+
+    def __getUpstream(self, paramId, depth, given):
+        """
+        Return the IDs of the parameters that the parameter depends on,
+        directly or through at most depth steps along the dependency chain.
+        Given and fixed parameters are excluded, since resampling them would
+        not change their values. They are still followed though.
+        """
+        result = set()
+        current = {paramId}
+        for i in range(depth):
+            found = set()
+            for p in current:
+                param = self.params.getParam(p)
+                found.update(
+                    self.__getAbsoluteDependencies(p, param).values())
+            current = found - result
+            result.update(found)
+        return {
+            p for p in result
+            if p not in given and not self.params.getParam(p).isFixed()
+        }
+
+    def __discard(self, params, paramIds):
+        """
+        Remove the parameters from the partially initialized parameters, as
+        well as any parameters that (directly or indirectly) depend on them.
+        The removed parameters will be initialized again.
+        """
+        discarded = set(paramIds)
+        changed = True
+        while changed:
+            changed = False
+            for p in list(params.keys()):
+                if p in discarded:
+                    del params[p]
+                    continue
+                param = self.params.getParam(p)
+                dep = self.__getAbsoluteDependencies(p, param).values()
+                if discarded.intersection(dep):
+                    discarded.add(p)
+                    del params[p]
+                    changed = True
+
+    def __withoutSChoices(self, params):
+        """
+        Return the parameter values that belong in a design.
+        """
         # This only makes sense as long as the behavior* of the "current"
         # InPUT4j is imitated. Future specifications may require getters and
         # setters to be invoked, but for now this is good enough.
@@ -86,36 +1026,184 @@ class DesignSpace(Identifiable):
         # included, and have nested parameters retrieved by getter.
         # For now SChoices are removed (they are replaced by their parent).
         # * "Point.X" gets the value of the parameter X, not p.getX().
-        params = {
+        return {
             k: v for (k,v) in params.items()
             if self.params.getParam(k).getTag() != SCHOICE
         }
-        return Design(params, self, designId, readOnly=readOnly)
 
-    def __initParam(self, param, init):
+    def __resolveGiven(self, given):
+        """
+        Return a tuple of given values and given choices, both of which map
+        parameter IDs to values/choice IDs. All values that do not depend on
+        other parameters are validated here. Dependent values can only be
+        validated once their dependencies have been initialized.
+
+        A value nested in a choice selects that choice. Raises
+        InPUTException if a different choice was given.
+        """
+        values = {}
+        choices = {}
+        for (paramId, value) in (given or {}).items():
+            param = self.params.getParam(paramId)
+            if param is None:
+                raise InPUTException('Unknown parameter %s' % (paramId))
+            if param.isFixed() and not isFixedValue(param, value):
+                raise InPUTException('%s is fixed' % (paramId))
+            if param.getTag() == CHOICE and value in param.getChoiceIds():
+                choices[paramId] = value
+                continue
+            independent = not param.isDependent()
+            if independent and not self.params.isValid(paramId, value):
+                msg = 'Invalid value (%s) for parameter %s'
+                raise InPUTException(msg % (value, paramId))
+            values[paramId] = value
+        for paramId in values:
+            for (choiceParamId, choiceId) in self.__getChoicesOf(paramId):
+                if choices.setdefault(choiceParamId, choiceId) != choiceId:
+                    msg = '%s requires choice %s of %s'
+                    raise InPUTException(msg % (paramId, choiceId,
+                        choiceParamId))
+        return (values, choices)
+
+    def __getChoicesOf(self, paramId):
+        """
+        Return (parameter ID, choice ID) pairs for the choices that the
+        parameter is nested in.
+        """
+        parts = paramId.split('.')
+        pairs = []
+        for i in range(1, len(parts) - 1):
+            param = self.params.getParam('.'.join(parts[:i]))
+            if param is None or param.getTag() != CHOICE:
+                continue
+            if parts[i] in param.getChoiceIds():
+                pairs.append(('.'.join(parts[:i]), parts[i]))
+        return pairs
+
+    def __initParam(self, param, init, lazy=False, given={}, choices={}):
         """
         Return a dictionary mapping parameter ID to initialized value for
         the specified parameter and any parameters it depends on. The init
         argument is a dictionary containing a subset of the result.
+
+        If lazy is true, then structured parameters are mapped to LazyValue
+        placeholders instead of fully instantiated objects.
+        The given and choices arguments map parameter IDs to values and
+        choice IDs that should be used instead of random ones.
         """
         paramId = param.getId()
         if paramId in init:
             return init
-        param = generator.getChoice(param)
+        choiceId = None
+        if paramId in choices:
+            param = param.getChoice(choices[paramId])
+        else:
+            param = generator.getChoice(param)
+        if param.getTag() == SPARAM and param.hasChoice():
+            choiceId = param.getSChoices()[0].getRelativeId()
 
         # When initializing dependent parameters, find the absolute ID of the
         # dependencies. Then use the appropriate values for those IDs when
         # resolving dependencies. (map the relative ID to the proper value)
         dependencies = {}
-        ids = self.params.getSupportedParamIds()
         for d in param.getDependees():
-            absolute = util.findAbsoluteParameter(paramId, d, ids)
-            init = self.__initParam(self.params.getParam(absolute), init)
+            absolute = self.params.getAbsoluteId(paramId, d)
+            dependee = self.params.getParam(absolute)
+            init = self.__initParam(dependee, init, lazy, given, choices)
             dependencies[d] = init[absolute]
 
-        init[paramId] = generator.nextValue(param, dependencies)
+        if paramId in given:
+            value = given[paramId]
+            if param.isDependent():
+                dep = resolveAll(dependencies)
+                if not self.params.isValid(paramId, value, dep):
+                    msg = 'Invalid value (%s) for parameter %s'
+                    raise InPUTException(msg % (value, paramId))
+            # Every design gets arrays of its own.
+            init[paramId] = copyArray(value)
+            return init
+
+        if not lazy:
+            init[paramId] = self.__nextValue(param, dependencies)
+            return init
+
+        f = lambda: generator.nextValue(param, resolveAll(dependencies))
+        if isDeferrable(param):
+            init[paramId] = LazyValue(f, choiceId)
+        else:
+            init[paramId] = self.__nextValue(param, resolveAll(dependencies))
         return init
 
+    @staticmethod
+    def __nextValue(param, dependencies):
+        """
+        Return a new value for the parameter. Numeric parameters (and arrays
+        of them) whose range is empty raise EmptyRangeError.
+        """
+        if param.getTag() not in (NPARAM, ARRAY):
+            return generator.nextValue(param, dependencies)
+        try:
+            return generator.nextValue(param, dependencies)
+        except generator.InvalidRangeError:
+            raise EmptyRangeError(param.getId())
+
+    def setResampling(self, strategy, attempts=10):
+        """
+        Set how nextDesign handles parameters whose range turns out to be
+        empty, given the values of the parameters they depend on.
+
+        - NO_RESAMPLING (the default) gives up immediately.
+        - RETRY samples the parameters that the rejected parameter directly
+          depends on again, at most attempts times.
+        - BACKTRACK works like RETRY, but when the attempts are exhausted,
+          it moves one step further up the dependency chain and tries again,
+          until the chain has been exhausted.
+
+        Parameters that depend on a resampled parameter are also sampled
+        again. Given and fixed parameters are never resampled.
+        """
+        if not strategy in self.RESAMPLING_STRATEGIES:
+            msg = '%s is not a valid resampling strategy'
+            raise ValueError(msg % (strategy))
+        if attempts < 1:
+            raise ValueError('The number of attempts must be positive')
+        self.__resampling = (strategy, attempts)
+
+    def getResampling(self):
+        """
+        Return the resampling strategy and the number of attempts as a
+        tuple. See setResampling.
+        """
+        return self.__resampling
+
+    def getRejections(self):
+        """
+        Return a dictionary mapping parameter IDs to the number of times a
+        value for that parameter could not be generated because its range
+        was empty. Parameters that were never rejected are left out.
+        """
+        return dict(self.__rejections)
+
+    def clearRejections(self):
+        """
+        Reset the rejection counters. See getRejections.
+        """
+        self.__rejections = {}
+
+    def isRuntimeValidationActive(self):
+        """
+        Return whether designs of this space validate values as they are
+        set. Individual designs can override this setting.
+        """
+        return self.__runtimeValidation
+
+    def setRuntimeValidation(self, active):
+        """
+        Turn runtime validation on or off for designs of this space. The
+        default is taken from the InPUT configuration.
+        """
+        self.__runtimeValidation = active
+
     def setFixed(self, paramId, value):
         """
         Set the parameter to a fixed value. The value may be any expression
@@ -141,18 +1229,23 @@ class DesignSpace(Identifiable):
         return Design({})
     # -------------------------------------------------------------------------
 
+    def getFingerprint(self):
+        """
+        Return a string that identifies the parameters of this design
+        space. See ParamStore.getFingerprint.
+        """
+        return self.params.getFingerprint()
+
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, DesignSpace):
             return False
         if self.getId() != other.getId():
             return False
         if self.getFileName() != other.getFileName():
             return False
-        paramKeys1 = self.getSupportedParamIds()
-        paramKeys2 = other.getSupportedParamIds()
-        if paramKeys1 != paramKeys2:
-            return False
-        for key in paramKeys1:
-            if self.params.getParam(key) != other.params.getParam(key):
-                return False
-        return True
+        return self.getFingerprint() == other.getFingerprint()
+
+    def __hash__(self):
+        return hash((self.getId(), self.getFileName(), self.getFingerprint()))
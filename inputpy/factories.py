@@ -2,7 +2,15 @@
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import contextlib
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
 import xml.etree.ElementTree as et
+from collections import OrderedDict
+import inputpy.config as config
 import inputpy.param as param
 import inputpy.util as util
 import inputpy.generators as gen
@@ -17,6 +25,37 @@ def getTag(tag):
     index = tag.index('}')
     return tag[index+1:]
 
+class _ValueFrame:
+    """
+    The state of an element that is being imported by
+    XMLFactory.readParamValues.
+    """
+    __slots__ = (
+        'paramId', 'values', 'target', 'element', 'shape', 'container',
+    )
+
+    def __init__(self, paramId, values):
+        self.paramId = paramId
+        self.values = values    # Where nested values are stored.
+        self.target = None      # (list, index) for array elements.
+        self.element = None     # Element parameter, inside arrays.
+        self.shape = None       # Remaining dimensions, for (sub-)arrays.
+        self.container = None   # The elements, for (sub-)arrays.
+
+    def setShape(self, shape):
+        self.shape = shape
+        self.container = [None] * shape[0]
+
+    def store(self, value):
+        if self.target is None:
+            self.values[self.paramId] = value
+            return
+        (container, index) = self.target
+        if index >= len(container):
+            container.extend([None] * (index + 1 - len(container)))
+        container[index] = value
+
+
 class XMLFactory:
     @staticmethod
     def __getParamArgs(element, parentId=None):
@@ -79,17 +118,135 @@ class XMLFactory:
 
     @staticmethod
     def getDesign(fileName, dsFactory=None):
+        """
+        Import a design from a file. The file is parsed incrementally, so
+        only the values (and not the whole document) are kept in memory.
+
+        Unless a design space factory is given, designs that refer to the
+        same (unchanged) design space file share one DesignSpace instance,
+        if caching is active. See SpaceCache. A shared space also shares
+        its state: fixed values, settings such as runtime validation and
+        resampling, the designs seen by unique sampling, and the rejection
+        counters.
+        """
+        if dsFactory is None and config.isCachingActive():
+            dsFactory = SPACE_CACHE.get
         dsFactory = dsFactory or XMLFactory.getDesignSpace
         try:
-            root = et.parse(fileName).getroot()
+            events = et.iterparse(fileName, events=('start', 'end'))
+            (event, root) = next(events)
         except (FileNotFoundError, TypeError) as e:
             raise InPUTException('Could not import Design: %s' % (e))
         designId = root.attrib.get(ID_ATTR)
         spaceFile = root.attrib.get(REF_ATTR)
         space = dsFactory(spaceFile)
-        params = XMLFactory.getParamValues(root, space)
+        params = XMLFactory.readParamValues(events, root, space)
         return Design(params, space, designId)
 
+    @staticmethod
+    def readParamValues(events, root, space):
+        """
+        Return the parameter values in a stream of iterparse events (start
+        and end) for the children of the root element. This gives the same
+        result as getParamValues, but in a single pass, clearing elements
+        as soon as they have been processed.
+
+        Array elements are written directly into lists, which are allocated
+        using the declared sizes of the array. Structured values are built
+        once all numeric values are known, in the same order as
+        getParamValues builds them.
+        """
+        values = {}
+        pending = []    # SValues to build once all NValues are known.
+        stack = []      # One _ValueFrame per open element.
+        for (event, element) in events:
+            if event == 'start':
+                parent = stack[-1] if stack else None
+                stack.append(XMLFactory.__startValue(
+                    element, parent, values, space))
+                continue
+            if element is root:
+                break
+            frame = stack.pop()
+            XMLFactory.__endValue(element, frame, pending, space)
+            element.clear()
+            if not stack:
+                root.clear()
+        for (frame, param, workingId, choiceName) in pending:
+            value = XMLFactory.__buildSValue(frame.values, space, param,
+                workingId, choiceName)
+            frame.store(value)
+        return values
+
+    @staticmethod
+    def __startValue(element, parent, values, space):
+        parentId = parent.paramId if parent else None
+        paramId = util.absolute(parentId, element.attrib.get(ID_ATTR))
+        frame = _ValueFrame(paramId, parent.values if parent else values)
+        if parent is not None and parent.shape is not None:
+            # An element of an array (or of a sub-array).
+            index = int(element.attrib.get(ID_ATTR)) - 1
+            frame.target = (parent.container, index)
+            frame.element = parent.element
+            if len(parent.shape) > 1:
+                frame.setShape(parent.shape[1:])
+                frame.store(frame.container)
+            elif getTag(element.tag) == SVALUE and \
+                    parent.element.getType() != STRING:
+                # Nested values of a structured element stay local to it,
+                # and are identified like the parameters they belong to.
+                frame.paramId = parent.element.getId()
+                frame.values = {}
+            return frame
+        param = space.params.getParam(paramId)
+        if param is not None and param.getTag() == ARRAY:
+            frame.element = param.getElementParameter()
+            frame.setShape(param.getShape())
+            frame.values[paramId] = frame.container
+        return frame
+
+    @staticmethod
+    def __endValue(element, frame, pending, space):
+        tag = element.tag
+        paramId = frame.paramId
+        value = element.attrib.get(VALUE_ATTR)
+        if frame.shape is not None:
+            return      # Arrays and sub-arrays only contain elements.
+        if tag.endswith(NVALUE):
+            if value is None:
+                return
+            param = frame.element or space.params.getParam(paramId)
+            # Some parameters are currently not supported, so their values
+            # are imported as plain numbers.
+            if param is None:
+                try:
+                    value = int(value)
+                except:
+                    value = float(value)
+            else:
+                value = XMLFactory.castValue(param, space, value)
+            frame.store(value)
+            return
+        if not tag.endswith(SVALUE):
+            return
+        if frame.element is not None:
+            param = frame.element
+            workingId = paramId
+        else:
+            param = space.params.getParam(paramId)
+            workingId = paramId
+            # Could be an array. Try again using the root parameter ID.
+            if param is None:
+                param = space.params.getParam(util.root(paramId))
+                if param is None:
+                    return
+                workingId = param.getId()
+        if param.getType() == STRING:
+            if value is not None:
+                frame.store(value)
+            return
+        pending.append((frame, param, workingId, value))
+
     @staticmethod
     def getParamValues(root, space):
         result = XMLFactory.getNValues({}, root, space)
@@ -99,38 +256,58 @@ class XMLFactory:
 
     @staticmethod
     def convertArrays(values, space):
-        elements = XMLFactory.getArrayElements(values, space)
-        for key in elements.keys():
-            del values[key]
-        result = XMLFactory.condense(elements)
-        for (k,v) in result.items():
-            values[k] = v
+        """
+        Replace the values of array elements (such as 'A.2.1') with the
+        arrays they belong to (A). Elements are placed according to their
+        indexes, in lists that are allocated using the declared sizes of
+        the array. Values nested inside array elements are dropped.
+        """
+        trie = util.IdTrie(values.keys())
+        for array in XMLFactory.getArrays(space):
+            arrayId = array.getId()
+            shape = array.getShape()
+            container = None
+            for k in trie.descendants(arrayId):
+                if k not in values:
+                    continue
+                value = values.pop(k)
+                try:
+                    index = [int(i) - 1 for i in util.relativeTo(arrayId, k)]
+                except ValueError:
+                    continue    # Not an element.
+                if container is None:
+                    container = [None] * shape[0]
+                XMLFactory.__placeElement(container, shape, index, value)
+            if container is not None:
+                values[arrayId] = container
         return values
 
     @staticmethod
-    def condense(elements):
-        prefixes = {
-            id[:id.rfind('.')] for id in elements.keys() if id.rfind('.') != -1
-        }
-        if len(prefixes) == 0:
-            return elements
-        results = {prefix: [
-                v for (k,v) in elements.items() if k.startswith(prefix + '.')
-            ] for prefix in prefixes
-        }
-        results.update({
-            k: v for (k,v) in elements.items() if k.find('.') == -1
-        })
-        return XMLFactory.condense(results)
+    def __placeElement(container, shape, index, value):
+        """
+        Store the value at the index (a sequence of positions, one per
+        dimension) in the nested lists, allocating sub-lists as needed.
+        """
+        last = len(index) - 1
+        for (depth, i) in enumerate(index):
+            if i >= len(container):
+                container.extend([None] * (i + 1 - len(container)))
+            if depth == last:
+                container[i] = value
+                return
+            if container[i] is None:
+                size = shape[depth + 1] if depth + 1 < len(shape) else 0
+                container[i] = [None] * size
+            container = container[i]
 
     @staticmethod
     def getArrayElements(values, space):
         arrays = XMLFactory.getArrays(space)
+        trie = util.IdTrie(values.keys())
         elements = {}
         for a in arrays:
-            rootId = a.getId() + '.'
-            for k in values.keys():
-                if k.startswith(rootId):
+            for k in trie.descendants(a.getId()):
+                if k in values:
                     elements[k] = values[k]
         return elements
 
@@ -216,31 +393,288 @@ class XMLFactory:
                 if value is not None:
                     values[paramId] = value
             else:
-                ids = values.keys()
-                dep = {}
-
-                # Dear God this is ugly!
-                if param.getTag() == CHOICE:
-                    choiceName = element.attrib.get(VALUE_ATTR)
-                    sparam = param.getOriginal()
-                    param = param.getChoice(choiceName)
-                    # find schoice
-                    schoice = None
-                    for d in sparam.getNestedParameters():
-                        if d.getRelativeId() == choiceName:
-                            schoice = d
-                    for d in schoice.getDependees():
-                        absolute = util.findAbsoluteParameter(workingId, d, ids)
-                        dep[d] = values.get(absolute)
-
-                for d in param.getDependees():
-                    absolute = util.findAbsoluteParameter(workingId, d, ids)
-                    value = values.get(absolute)
-                    if value is not None:
-                        dep[d] = value
-                    else:
-                        absolute = workingId + '.' + d
-                        dependee = space.params.getParam(absolute)
-                        dep[d] = gen.nextValue(dependee, dep)
-                values[paramId] = gen.nextValue(param, dep)
+                choiceName = element.attrib.get(VALUE_ATTR)
+                values[paramId] = XMLFactory.__buildSValue(values, space,
+                    param, workingId, choiceName)
         return values
+
+    @staticmethod
+    def __buildSValue(values, space, param, workingId, choiceName):
+        """
+        Return the value of a structured parameter, given the values that
+        have been imported so far. Missing dependencies are generated.
+        """
+        ids = values.keys()
+        dep = {}
+
+        # Dear God this is ugly!
+        if param.getTag() == CHOICE:
+            sparam = param.getOriginal()
+            param = param.getChoice(choiceName)
+            # find schoice
+            schoice = None
+            for d in sparam.getNestedParameters():
+                if d.getRelativeId() == choiceName:
+                    schoice = d
+            for d in schoice.getDependees():
+                absolute = util.findAbsoluteParameter(workingId, d, ids)
+                dep[d] = values.get(absolute)
+
+        for d in param.getDependees():
+            absolute = util.findAbsoluteParameter(workingId, d, ids)
+            value = values.get(absolute)
+            if value is not None:
+                dep[d] = value
+            else:
+                absolute = workingId + '.' + d
+                dependee = space.params.getParam(absolute)
+                dep[d] = gen.nextValue(dependee, dep)
+        return gen.nextValue(param, dep)
+
+
+class SpaceCache:
+    """
+    A registry of imported design spaces, keyed by the resolved path of
+    the design space file. A cached space is only used while the design
+    space file and its code mapping file (if any) have the same
+    modification times and sizes as when the space was imported.
+
+    The least recently used spaces are evicted when there are more than
+    maxEntries of them, or when their estimated total size exceeds
+    maxBytes. The size of a space is estimated from the sizes of its files.
+
+    Every user of a cached space shares its state (see DesignSpace). If
+    InPUTpy is configured to be thread safe, the cache is guarded by a
+    lock. The spaces themselves are not.
+    """
+    # Roughly how many bytes an imported space takes per byte of XML.
+    SIZE_FACTOR = 25
+
+    def __init__(self, maxEntries=32, maxBytes=64 * 2**20, factory=None):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.__factory = factory or XMLFactory.getDesignSpace
+        self.__entries = OrderedDict()  # Path -> (stamps, space, size).
+        self.__size = 0
+        if config.isThreadSafe():
+            self.__lock = threading.RLock()
+        else:
+            self.__lock = contextlib.nullcontext()
+
+    def get(self, fileName):
+        """
+        Return the design space imported from the file, importing it only
+        if no up to date space is cached.
+        """
+        try:
+            path = os.path.realpath(fileName)
+        except TypeError as e:
+            raise InPUTException('Could not import DesignSpace: %s' % (e))
+        with self.__lock:
+            return self.__get(fileName, path)
+
+    def __get(self, fileName, path):
+        entry = self.__entries.get(path)
+        if entry is not None:
+            (stamps, space, size) = entry
+            if stamps == self.__getStamps(path, stamps[1][0]):
+                self.__entries.move_to_end(path)
+                return space
+            self.__remove(path)
+        space = self.__factory(fileName)
+        stamps = self.__getStamps(path, getMappingFile(path))
+        size = (stamps[0][2] + stamps[1][2]) * self.SIZE_FACTOR
+        self.__entries[path] = (stamps, space, size)
+        self.__size += size
+        self.__evict()
+        return space
+
+    @staticmethod
+    def __getStamps(path, mappingPath):
+        """
+        Return a tuple of (path, modification time, size) tuples, for the
+        design space file and the code mapping file.
+        """
+        return (getFileStamp(path), getFileStamp(mappingPath))
+
+    def __remove(self, path):
+        (stamps, space, size) = self.__entries.pop(path)
+        self.__size -= size
+
+    def __evict(self):
+        # The most recently used space is kept, no matter how big.
+        while len(self.__entries) > 1 and (
+                len(self.__entries) > self.maxEntries or
+                self.__size > self.maxBytes):
+            self.__remove(next(iter(self.__entries)))
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, fileName):
+        return os.path.realpath(fileName) in self.__entries
+
+class CompiledSpaceCache:
+    """
+    Compiled design spaces on disk. A compiled space is a snapshot of an
+    imported (and finalized) design space, so it includes the resolved
+    dependencies, initialization order and parameter indices. Loading it
+    skips parsing, parameter creation and finalization altogether.
+
+    Compiled spaces are written to an __inputcache__ directory next to the
+    design space file, or to cacheDir if given. A compiled space is keyed by
+    a hash of the contents of the design space file, its code mapping file
+    and the InPUTpy sources, so it is only used while none of them has
+    changed. Otherwise the space is imported and compiled again.
+
+    Each file starts with a plain header holding the format and the key,
+    and the snapshot is only unpickled if the header matches. Since
+    unpickling can run arbitrary code, the cache directory must not be
+    writable by anyone untrusted.
+
+    This can be used as the factory of a SpaceCache.
+    """
+    MAGIC = b'InPUTpy compiled space'
+    # Increment whenever the file layout changes.
+    FORMAT = 2
+    DIR_NAME = '__inputcache__'
+    SUFFIX = '.pickle'
+
+    def __init__(self, cacheDir=None, factory=None):
+        self.cacheDir = cacheDir
+        self.__factory = factory or XMLFactory.getDesignSpace
+
+    def get(self, fileName):
+        """
+        Return the design space imported from the file, loading a compiled
+        space if there is an up to date one.
+        """
+        try:
+            path = os.path.realpath(fileName)
+            key = self.getKey(path)
+        except (OSError, TypeError) as e:
+            raise InPUTException('Could not import DesignSpace: %s' % (e))
+        cacheFile = self.getCacheFile(path)
+        space = self.load(cacheFile, key)
+        if space is None:
+            space = self.__factory(fileName)
+            self.write(cacheFile, key, space)
+        space.fileName = fileName
+        return space
+
+    def getKey(self, spaceFile):
+        """
+        Return the hash of the design space file and its code mapping file,
+        as well as of the library itself.
+        """
+        digest = hashlib.sha256(getLibraryHash().encode())
+        for path in (spaceFile, getMappingFile(spaceFile)):
+            digest.update(b'\0')
+            if path is not None and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def getCacheFile(self, spaceFile):
+        """
+        Return the path of the compiled space for the design space file.
+        """
+        (directory, name) = os.path.split(spaceFile)
+        if self.cacheDir is None:
+            directory = os.path.join(directory, self.DIR_NAME)
+            return os.path.join(directory, name + self.SUFFIX)
+        # Files with the same name in different directories may share the
+        # cache directory.
+        pathHash = hashlib.sha256(spaceFile.encode()).hexdigest()[:16]
+        name = '%s.%s%s' % (name, pathHash, self.SUFFIX)
+        return os.path.join(self.cacheDir, name)
+
+    def load(self, cacheFile, key):
+        """
+        Return the compiled space from the file, or None if the file is
+        missing, unreadable, or was compiled from other files.
+        """
+        header = self.__getHeader(key)
+        try:
+            with open(cacheFile, 'rb') as f:
+                if f.read(len(header)) != header:
+                    return None
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def __getHeader(self, key):
+        return b'%s %d %s\n' % (self.MAGIC, self.FORMAT, key.encode())
+
+    def write(self, cacheFile, key, space):
+        """
+        Write the compiled space to the file. The file is replaced
+        atomically, so concurrent processes never see a partial file.
+        Failing to write (to a read-only directory, say) is not an error.
+        """
+        directory = os.path.dirname(cacheFile)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            (fd, tmpFile) = tempfile.mkstemp(dir=directory)
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.__getHeader(key))
+                pickle.dump(space, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpFile, cacheFile)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            os.remove(tmpFile)
+            return False
+        return True
+
+LIBRARY_HASH = None     # Computed on first use.
+
+def getLibraryHash():
+    """
+    Return a hash of the source files of InPUTpy. Compiled design spaces
+    are only valid for the code that compiled them.
+    """
+    global LIBRARY_HASH
+    if LIBRARY_HASH is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.py'):
+                digest.update(name.encode() + b'\0')
+                with open(os.path.join(directory, name), 'rb') as f:
+                    digest.update(f.read())
+        LIBRARY_HASH = digest.hexdigest()
+    return LIBRARY_HASH
+
+def getFileStamp(path):
+    """
+    Return a (path, modification time, size) tuple for the file. Missing
+    files (and None) have no time and size.
+    """
+    if path is None:
+        return (None, None, 0)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (path, None, 0)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+def getMappingFile(spaceFile):
+    """
+    Return the path of the code mapping file that the design space file
+    refers to, or None.
+    """
+    for (event, root) in et.iterparse(spaceFile, events=('start',)):
+        mappingFile = root.attrib.get(MAPPING_ATTR)
+        if mappingFile is None:
+            return None
+        return os.path.realpath(mappingFile)
+
+# The design spaces shared by imported designs.
+SPACE_CACHE = SpaceCache()
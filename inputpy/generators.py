@@ -9,14 +9,15 @@ using the two main functions of this module.
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import math
 import random
 from inputpy.exceptions import InPUTException
 from inputpy.util import Evaluator
 from inputpy.q import *
 
 __all__ = (
-    'isValid', 'nextValue',
-    'IntGenerator', 'FloatGenerator', 'ArrayGenerator', 'SParamGenerator',
+    'isValid', 'nextValue', 'perturb', 'clamp', 'getDomain',
+    'InvalidRangeError', 'IntGenerator', 'FloatGenerator', 'ArrayGenerator', 'SParamGenerator',
 )
 
 # Maps the string description to a range.
@@ -34,6 +35,65 @@ RANGE_MAP = {
 INT_TYPES = (SHORT, INTEGER, LONG,)
 FLOAT_TYPES = (FLOAT, DOUBLE, DECIMAL,)
 
+class InvalidRangeError(ValueError):
+    """
+    Raised when no value can be generated because the range of the
+    parameter, given the values of the parameters it depends on, is empty.
+    """
+    def __init__(self):
+        ValueError.__init__(self, 'Invalid range')
+
+class Domain:
+    """
+    The finite sequence of values that a parameter can have. The values
+    are the concatenation of a few parts (such as ranges), and are only
+    produced as they are requested.
+    """
+    def __init__(self, parts):
+        self.parts = tuple(parts)
+        self.size = sum(len(p) for p in self.parts)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError('Domain index out of range')
+        for p in self.parts:
+            if index < len(p):
+                return p[index]
+            index -= len(p)
+
+    def __iter__(self):
+        for p in self.parts:
+            for value in p:
+                yield value
+
+class ArrayDomain(Domain):
+    """
+    All arrays of the given size with elements from the element domain,
+    ordered such that the first element varies the slowest.
+    """
+    def __init__(self, elements, size):
+        self.elements = elements
+        self.length = size
+        self.size = len(elements) ** size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError('Domain index out of range')
+        n = len(self.elements)
+        result = []
+        for i in range(self.length):
+            (index, j) = divmod(index, n)
+            result.append(self.elements[j])
+        result.reverse()
+        return result
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self[i]
+
 class ValueGenerator:
     rng = random
 
@@ -48,13 +108,53 @@ class ValueGenerator:
     def isValid(cls, param, dep={}):
         raise NotImplementedError
 
+    @classmethod
+    def perturb(cls, param, value, scale, rng, dep={}):
+        """
+        Return a value close to the given one. The scale is relative to
+        the width of the range that the value is in.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def clamp(cls, param, value, dep={}):
+        """
+        Return the valid value that is closest to the given one.
+        """
+        return value
+
+    @classmethod
+    def getDomain(cls, param, dep={}):
+        """
+        Return a Domain containing all valid values.
+
+        Raises ValueError if there are infinitely many values.
+        """
+        if param.isFixed():
+            return Domain(((param.getFixedValue(),),))
+        msg = 'Parameter %s does not have a finite number of values'
+        raise ValueError(msg % (param.getId()))
+
     @classmethod
     def __getMinMax__(cls, param, dep={}):
         minVal = param.getMin()
         maxVal = param.getMax()
         minMaxPairs = list(zip(minVal, maxVal))
         (minVal, maxVal) = cls.rng.choice(minMaxPairs)
+        return cls.__resolveMinMax__(param, minVal, maxVal, dep)
+
+    @classmethod
+    def __getAllMinMax__(cls, param, dep={}):
+        """
+        Return all (min, max) pairs, with any dependencies resolved.
+        """
+        return [
+            cls.__resolveMinMax__(param, minVal, maxVal, dep)
+            for (minVal, maxVal) in zip(param.getMin(), param.getMax())
+        ]
 
+    @classmethod
+    def __resolveMinMax__(cls, param, minVal, maxVal, dep={}):
         if param.isMinDependent() and isinstance(minVal, str):
             minVal = Evaluator.evaluate(minVal, dep)
         if param.isMaxDependent() and isinstance(maxVal, str):
@@ -65,6 +165,28 @@ class ValueGenerator:
             maxVal = RANGE_MAP[param.getType()][1]
         return (minVal, maxVal)
 
+    @classmethod
+    def __getNearestMinMax__(cls, param, value, dep={}):
+        """
+        Return the non-empty (min, max) pair that is closest to the value.
+        A pair that contains the value has a distance of 0.
+
+        Raises InvalidRangeError if all ranges are empty.
+        """
+        pairs = [
+            (minVal, maxVal)
+            for (minVal, maxVal) in cls.__getAllMinMax__(param, dep)
+            if cls.__isValidMinMax__(param, minVal, maxVal)
+        ]
+        if len(pairs) == 0:
+            raise InvalidRangeError()
+        distance = lambda p: max(p[0] - value, value - p[1], 0)
+        return min(pairs, key=distance)
+
+    @classmethod
+    def __isValidMinMax__(cls, param, minVal, maxVal):
+        return maxVal >= minVal
+
 
 class IntGenerator(ValueGenerator):
     @classmethod
@@ -77,7 +199,7 @@ class IntGenerator(ValueGenerator):
         minVal = int(minVal)
         maxVal = int(maxVal)
         if not cls.__isValid(minVal, maxVal):
-            raise ValueError('Invalid range')
+            raise InvalidRangeError()
         return cls.rng.randint(minVal, maxVal)
 
     @classmethod
@@ -85,9 +207,49 @@ class IntGenerator(ValueGenerator):
         (minVal, maxVal) = cls.__getMinMax__(param, dep)
         return cls.__isValid(minVal, maxVal)
 
+    @classmethod
+    def perturb(cls, param, value, scale, rng, dep={}):
+        (minVal, maxVal) = cls.__getNearestMinMax__(param, value, dep)
+        step = round(rng.gauss(0, scale * (maxVal - minVal)))
+        # Rounding makes small steps vanish. Always move at least one step.
+        if step == 0:
+            step = rng.choice((-1, 1))
+        return min(max(value + step, minVal), maxVal)
+
+    @classmethod
+    def clamp(cls, param, value, dep={}):
+        (minVal, maxVal) = cls.__getNearestMinMax__(param, value, dep)
+        return min(max(value, minVal), maxVal)
+
+    @classmethod
+    def getDomain(cls, param, dep={}):
+        if param.isFixed():
+            return ValueGenerator.getDomain(param, dep)
+        # Merge overlapping ranges so that every value occurs once.
+        ranges = []
+        for (minVal, maxVal) in sorted(cls.__getAllMinMax__(param, dep)):
+            if maxVal < minVal:
+                continue
+            if len(ranges) > 0 and minVal <= ranges[-1][1] + 1:
+                ranges[-1][1] = max(ranges[-1][1], maxVal)
+            else:
+                ranges.append([minVal, maxVal])
+        return Domain(range(minVal, maxVal + 1) for (minVal, maxVal) in ranges)
+
     @classmethod
     def __getMinMax__(cls, param, dep={}):
         (minVal, maxVal) = ValueGenerator.__getMinMax__(param, dep)
+        return cls.__adjustMinMax(param, minVal, maxVal)
+
+    @classmethod
+    def __getAllMinMax__(cls, param, dep={}):
+        pairs = ValueGenerator.__getAllMinMax__(param, dep)
+        pairs = [cls.__adjustMinMax(param, *p) for p in pairs]
+        return [(int(minVal), int(maxVal)) for (minVal, maxVal) in pairs]
+
+    # Exclusive integer limits are turned into inclusive ones.
+    @classmethod
+    def __adjustMinMax(cls, param, minVal, maxVal):
         if param.isMinExclusive():
             minVal += 1
         if param.isMaxExclusive():
@@ -109,7 +271,7 @@ class FloatGenerator(ValueGenerator):
 
         (minVal, maxVal) = cls.__getMinMax__(param, dep)
         if not cls.isValid(param, dep):
-            raise ValueError('Invalid range')
+            raise InvalidRangeError()
         return cls.rng.uniform(minVal, maxVal)
 
     @classmethod
@@ -117,12 +279,55 @@ class FloatGenerator(ValueGenerator):
         (minVal, maxVal) = cls.__getMinMax__(param, dep)
         return cls.__isValid(param, minVal, maxVal)
 
+    @classmethod
+    def perturb(cls, param, value, scale, rng, dep={}):
+        (minVal, maxVal) = cls.__getNearestMinMax__(param, value, dep)
+        value = value + rng.gauss(0, scale * (maxVal - minVal))
+        return cls.__clamp(param, value, minVal, maxVal)
+
+    @classmethod
+    def clamp(cls, param, value, dep={}):
+        (minVal, maxVal) = cls.__getNearestMinMax__(param, value, dep)
+        return cls.__clamp(param, value, minVal, maxVal)
+
+    @classmethod
+    def getDomain(cls, param, dep={}):
+        """
+        Only ranges that contain a single value are finite.
+        """
+        if param.isFixed():
+            return ValueGenerator.getDomain(param, dep)
+        values = set()
+        for (minVal, maxVal) in cls.__getAllMinMax__(param, dep):
+            if maxVal > minVal:
+                return ValueGenerator.getDomain(param, dep)
+            if cls.__isValid(param, minVal, maxVal):
+                values.add(minVal)
+        return Domain((sorted(values),))
+
+    @classmethod
+    def __isValidMinMax__(cls, param, minVal, maxVal):
+        return cls.__isValid(param, minVal, maxVal)
+
     # A helper that is specific to this class.
     @classmethod
     def __isValid(cls, param, minVal, maxVal):
         excl = param.isMinExclusive() or param.isMaxExclusive()
         return (maxVal > minVal) or (maxVal >= minVal and not excl)
 
+    # Exclusive limits are approached as closely as possible.
+    @classmethod
+    def __clamp(cls, param, value, minVal, maxVal):
+        if value <= minVal:
+            value = minVal
+            if param.isMinExclusive():
+                value = math.nextafter(value, maxVal)
+        if value >= maxVal:
+            value = maxVal
+            if param.isMaxExclusive():
+                value = math.nextafter(value, minVal)
+        return value
+
 
 class BoolGenerator(ValueGenerator):
     @classmethod
@@ -137,6 +342,16 @@ class BoolGenerator(ValueGenerator):
     def isValid(cls, param, dep={}):
         return True
 
+    @classmethod
+    def perturb(cls, param, value, scale, rng, dep={}):
+        return not value
+
+    @classmethod
+    def getDomain(cls, param, dep={}):
+        if param.isFixed():
+            return ValueGenerator.getDomain(param, dep)
+        return Domain(((False, True),))
+
 class ArrayGenerator(ValueGenerator):
     @classmethod
     def nextValue(cls, param, dep={}):
@@ -144,6 +359,11 @@ class ArrayGenerator(ValueGenerator):
         param = param.getParameter()
         return [nextValue(param, dep) for i in range(size)]
 
+    @classmethod
+    def getDomain(cls, param, dep={}):
+        size = param.getSize() or 1
+        return ArrayDomain(getDomain(param.getParameter(), dep), size)
+
     @classmethod
     def isValid(cls, param, dep={}):
         return True
@@ -289,6 +509,15 @@ def nextValue(param, dep={}):
     assert dep is not None, 'None dependency dicitionary'
     return __getGenerator(param).nextValue(param, dep)
 
+def getDomain(param, dep={}):
+    """
+    Return a Domain containing all the values that the parameter can have.
+    A Domain supports len, indexing and iteration.
+
+    Raises ValueError if there are infinitely many values.
+    """
+    return __getGenerator(param).getDomain(param, dep)
+
 def isValid(param, dep={}):
     """
     Return whether the parameter is valid. Optionally, a dictionary of
@@ -296,6 +525,27 @@ def isValid(param, dep={}):
     """
     return __getGenerator(param).isValid(param, dep)
 
+def perturb(param, value, scale, rng=None, dep={}):
+    """
+    Return a valid value for the numeric parameter close to the given
+    value. For integer and float parameters, the step is normally
+    distributed with a standard deviation of scale times the width of the
+    range the value is in. Booleans are simply flipped.
+    A dictionary of parameter ID to value mappings can be supplied to
+    resolve dependencies.
+    """
+    rng = rng or ValueGenerator.rng
+    return __getGenerator(param).perturb(param, value, scale, rng, dep)
+
+def clamp(param, value, dep={}):
+    """
+    Return the valid value for the numeric parameter that is closest to
+    the given value. Valid values are returned unchanged.
+    A dictionary of parameter ID to value mappings can be supplied to
+    resolve dependencies.
+    """
+    return __getGenerator(param).clamp(param, value, dep)
+
 def nextArray(param, sizes=(0,), dep={}):
     """
     Return an array of values initialized using the parameter.
@@ -71,6 +71,8 @@ def inheritMapping(child, parent):
     return Mapping(**kwargs)
 
 class Mapping:
+    __slots__ = ('id', 'typeName', 'constructor', 'setter', 'getter', 'dep')
+
     def __init__(self, id, type, constructor=None, set=None, get=None):
         self.id = id
         self.typeName = type
@@ -21,6 +21,7 @@ The module also contains a few supporting classes:
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import sys
 from inputpy.util import Evaluator
 import inputpy.util as util
 from inputpy.util import Identifiable
@@ -40,6 +41,11 @@ class Param(Identifiable):
     exception of fixed values), and does not know how to generate
     appropriate values or even which ones would be valid.
     """
+    __slots__ = (
+        'type', 'fixed', 'dependees', 'parentId', 'mapping', 'relativeId',
+        'tag',
+    )
+
     def __init__(self, id, type, tag,
         fixed=None, parentId=None, mapping=None, dependees=[]):
         """
@@ -47,7 +53,11 @@ class Param(Identifiable):
         - parent ID is always absolute.
         - dependees is a sequence of parameter IDs.
         """
-        Identifiable.__init__(self, util.absolute(parentId, id))
+        paramId = util.absolute(parentId, id)
+        # IDs are compared and hashed a lot, so intern them.
+        if isinstance(paramId, str):
+            paramId = sys.intern(paramId)
+        Identifiable.__init__(self, paramId)
         self.type = type
         self.fixed = fixed
         self.dependees = tuple(dependees)
@@ -141,6 +151,11 @@ class NParam(Param):
     """
     This class represents numeric parameters.
     """
+    __slots__ = (
+        'exclMin', 'exclMax', 'minDependees', 'maxDependees', 'min', 'max',
+        'intervals', 'intervalIndex', 'dependentIntervals',
+    )
+
     def __init__(self, id, type,
             tag=NPARAM, fixed=None, parentId=None, mapping=None,
             inclMin=None, exclMin=None, inclMax=None, exclMax=None):
@@ -216,6 +231,12 @@ class NParam(Param):
             intervals.append(util.Interval(inclMin=inclMin, exclMin=exclMin,
                 inclMax=inclMax, exclMax=exclMax, type=intervalType))
         self.intervals = tuple(intervals)
+        # Fully evaluated intervals can be indexed. The rest depend on the
+        # values of other parameters and are checked one at a time.
+        self.intervalIndex = util.IntervalIndex(
+            [i for i in intervals if i.isFullyEvaluated()])
+        self.dependentIntervals = tuple(
+            i for i in intervals if not i.isFullyEvaluated())
 
         self.minDependees = tuple(self.minDependees)
         self.maxDependees = tuple(self.maxDependees)
@@ -284,19 +305,24 @@ class NParam(Param):
         return self.intervals
 
     def isValid(self, value, dep={}):
-        for interval in self.intervals:
-            if not interval.isFullyEvaluated():
-                minVal = interval.getMin()
-                maxVal = interval.getMax()
-                if isinstance(minVal, str):
-                    minVal = Evaluator.evaluate(minVal, dep)
-                if isinstance(maxVal, str):
-                    maxVal = Evaluator.evaluate(maxVal, dep)
-                interval = interval.getUpdated((minVal, maxVal))
-            if interval.contains(value):
+        if self.intervalIndex.contains(value):
+            return True
+        for interval in self.dependentIntervals:
+            if interval.containsWith(value, dep):
                 return True
         return False
 
+    def isValidMany(self, values, dep={}):
+        """
+        Return a list of booleans, telling which of the values are valid.
+        All values are checked using the same dependencies.
+        """
+        result = self.intervalIndex.containsMany(values)
+        for interval in self.dependentIntervals:
+            contained = interval.containsMany(values, dep)
+            result = [a or b for (a, b) in zip(result, contained)]
+        return result
+
     def setFixed(self, value):
         """
         Sets this parameter to a fixed value. A parameter can also be
@@ -384,6 +410,8 @@ class NParam(Param):
 
 
 class SParam(Param):
+    __slots__ = ('nested', 'schoices', 'nonchoices')
+
     def __init__(self, id, type=None, tag=SPARAM,
             fixed=None, parentId=None, mapping=None, nested=[]):
         # Strings are a special case and don't require a mapping.
@@ -440,6 +468,8 @@ class SParam(Param):
         return True
 
 class SChoice(SParam):
+    __slots__ = ()
+
     def __init__(self, id, type=None, tag=SCHOICE, parentId=None,
             mapping=None, nested=[]):
         SParam.__init__(self, id, type, tag, parentId=parentId,
@@ -467,6 +497,21 @@ def getParameter(id, tag, type=None, **kwargs):
     return paramClasses[tag](id, type, **kwargs)
 
 
+def isFixedValue(param, value):
+    """
+    Return whether the value is the value that the parameter is fixed to.
+    The elements of a fixed array are all fixed to the same value.
+    """
+    fixed = param.getFixedValue()
+    if param.getTag() == ARRAY:
+        return __isFixedArray(value, fixed)
+    return value == fixed
+
+def __isFixedArray(value, fixed):
+    if not isinstance(value, list):
+        return value == fixed
+    return all(__isFixedArray(v, fixed) for v in value)
+
 def paramFactory(kwargs, mappings=None):
     """
     Return a parameter created from the arguments in the dictionary and
@@ -563,6 +608,12 @@ class Choice():
     def getChoices(self):
         return self.choices
 
+    def getChoiceIds(self):
+        """
+        Return the relative IDs of the SChoices that can be chosen.
+        """
+        return tuple(c.getSChoices()[0].getRelativeId() for c in self.choices)
+
     def getChoice(self, paramId):
         for c in self.choices:
             for n in c.getSChoices():
@@ -625,25 +676,104 @@ class ParamArray():
     Multidimensional arrays are handled by wrapping multiple parameters
     recursively.
 
-    Almost all method calls end up at the actual parameter. This class
-    only adds two new methods:
+    Almost all method calls end up at the element parameter (the innermost
+    parameter of a multidimensional array). The common ones are forwarded
+    explicitly, and any others through __getattr__. This class adds these
+    methods:
     - getSize
+    - getShape
     - getParameter
-    And overrides one method:
-    - getType
+    - getElementParameter
+    - getElements
+    And overrides:
+    - getTag
+    - isValid
     """
+    __slots__ = ('__param', '__size', '__element', '__shape')
+
     def __init__(self, paramId, paramType, tag, size, **kwargs):
         # Convert to choice on the fly as needed.
         self.__param = choiceFactory(getParameter(paramId, tag, paramType, **kwargs))
         self.__size = size
         assert self.__param is not None
+        if self.__param.getTag() == ARRAY:
+            self.__element = self.__param.getElementParameter()
+            self.__shape = (size,) + self.__param.getShape()
+        else:
+            self.__element = self.__param
+            self.__shape = (size,)
 
     def __getattr__(self, attr):
-        return getattr(self.__param, attr)
+        # Slots are looked up normally, unless they have not been set yet.
+        if attr.startswith('_ParamArray__'):
+            raise AttributeError(attr)
+        return getattr(self.__element, attr)
 
     def getTag(self):
         return ARRAY
 
+    def getId(self):
+        return self.__element.getId()
+
+    def getRelativeId(self):
+        return self.__element.getRelativeId()
+
+    def getParentId(self):
+        return self.__element.getParentId()
+
+    def getType(self):
+        return self.__element.getType()
+
+    def getDependees(self):
+        return self.__element.getDependees()
+
+    def isDependent(self):
+        return self.__element.isDependent()
+
+    def getFixedValue(self):
+        return self.__element.getFixedValue()
+
+    def isFixed(self):
+        return self.__element.isFixed()
+
+    def setFixed(self, value):
+        self.__element.setFixed(value)
+
+    def getMapping(self):
+        return self.__element.getMapping()
+
+    def getNestedParameters(self):
+        return self.__element.getNestedParameters()
+
+    def getMin(self):
+        return self.__element.getMin()
+
+    def getMax(self):
+        return self.__element.getMax()
+
+    def getIntervals(self):
+        return self.__element.getIntervals()
+
+    def isMinExclusive(self):
+        return self.__element.isMinExclusive()
+
+    def isMaxExclusive(self):
+        return self.__element.isMaxExclusive()
+
+    def getShape(self):
+        """
+        Return the sizes of all dimensions of this array as a tuple,
+        outermost first. A size of 0 means that the size is unspecified.
+        """
+        return self.__shape
+
+    def getElementParameter(self):
+        """
+        Return the parameter that the innermost elements of this array
+        should have.
+        """
+        return self.__element
+
     def getSize(self):
         """
         Return the size of this array. A size of 0 means that the size is
@@ -657,18 +787,36 @@ class ParamArray():
         """
         return self.__param
 
-    # Array validation is a little tricky.
-    # There is no spec for this. Additionally, the "original" InPUT4j that
-    # I started porting did no validation.
-    def isValid(self, value, dep={}):
-        return True
+    def getElements(self, value):
+        """
+        Return a list of the innermost elements of the array value, or
+        None if the value does not have the shape of this array.
+        """
+        if not isinstance(value, list):
+            return None
+        if self.__size != 0 and len(value) != self.__size:
+            return None
+        if self.__param.getTag() != ARRAY:
+            return list(value)
+        elements = []
+        for v in value:
+            inner = self.__param.getElements(v)
+            if inner is None:
+                return None
+            elements.extend(inner)
+        return elements
 
-        if len(value) != self.__size and self.__size != 0:
+    def isValid(self, value, dep={}):
+        """
+        Return whether the value has the shape of this array and only
+        valid elements.
+        """
+        elements = self.getElements(value)
+        if elements is None:
             return False
-        for element in value:
-            if not self.__param.isValid(element, dep):
-                return False
-        return True
+        if self.__element.getTag() == NPARAM:
+            return all(self.__element.isValidMany(elements, dep))
+        return all(self.__element.isValid(e, dep) for e in elements)
 
     def __eq__(self, other):
         if not isinstance(other, ParamArray):
@@ -4,15 +4,134 @@ inputpy.paramstore
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import hashlib
+import math
+import sys
+import warnings
 import inputpy.generators as generator
 import inputpy.util as util
 from inputpy.param import choiceFactory
+from inputpy.q import *
 
 def transformParameters(paramDict):
     return {k: choiceFactory(v) for (k,v) in paramDict.items()}
 
-def getTopLevelParameters(parameters):
-    return list(filter(lambda p: p.getParentId() is None, parameters))
+def getMappingKey(mapping):
+    if mapping is None:
+        return None
+    return (mapping.id, mapping.typeName, mapping.constructor,
+        mapping.setter, mapping.getter)
+
+def getParamKey(param):
+    """
+    Return a tuple that describes the definition of the parameter, such
+    that two parameters that are equal have equal keys.
+    """
+    tag = param.getTag()
+    # The choices are derived from the original parameter.
+    if tag == CHOICE:
+        return getParamKey(param.getOriginal())
+    key = [
+        param.getId(), param.getType(), tuple(sorted(param.getDependees())),
+        repr(param.getFixedValue()), getMappingKey(param.getMapping()),
+    ]
+    if tag == ARRAY:
+        key.append((param.getSize(), getParamKey(param.getParameter())))
+    elif tag == NPARAM:
+        key.append((repr(param.getMin()), repr(param.getMax()),
+            param.isMinExclusive(), param.isMaxExclusive()))
+    else:
+        nested = (getParamKey(p) for p in param.getNestedParameters())
+        key.append(tuple(sorted(nested, key=repr)))
+    return tuple(key)
+
+def getHull(bounds):
+    """
+    Return the smallest Bounds containing all the Bounds in the list. An
+    unknown (None) or empty list is unbounded.
+    """
+    if not bounds:
+        return util.Bounds(-math.inf, math.inf)
+    return util.Bounds(min(b.lo for b in bounds), max(b.hi for b in bounds))
+
+def getLimitBounds(limit, dep, default, truncated=False):
+    """
+    Return the Bounds of a min or max limit, which may be missing (None),
+    a number, or an expression referencing the parameters in dep. If
+    truncated is true, then the evaluated expression is truncated to an
+    integer, the way integer Intervals do it when validating values.
+    """
+    if limit is None:
+        return util.Bounds(default, default)
+    if isinstance(limit, str):
+        bounds = util.evaluateBounds(limit, dep)
+        if truncated:
+            return util.Bounds(truncate(bounds.lo), truncate(bounds.hi))
+        return bounds
+    return util.Bounds(limit, limit)
+
+def getAffineLimit(limit, names, default):
+    """
+    Return a min or max limit as an Affine of the parameters in names, or
+    None if it is an expression that is not linear in them. A missing
+    limit is the default.
+    """
+    if limit is None:
+        return util.Affine(default)
+    if isinstance(limit, str):
+        return util.evaluateAffine(limit, names)
+    return util.Affine(limit)
+
+def getLeaves(value):
+    """
+    Return a list of the values in the (possibly nested) array value.
+    """
+    if not isinstance(value, list):
+        return [value]
+    return [v for element in value for v in getLeaves(element)]
+
+def truncate(value):
+    if math.isinf(value):
+        return value
+    return int(value)
+
+def getIntegerLimits(param, minBounds, maxBounds):
+    """
+    Return Bounds for the inclusive min and max limits of the integer
+    parameter, given Bounds for its limits. Exclusive limits are turned
+    into inclusive ones and then truncated, the way IntGenerator does it.
+    """
+    exclMin = param.isMinExclusive()
+    exclMax = param.isMaxExclusive()
+    minBounds = util.Bounds(
+        truncate(minBounds.lo + exclMin), truncate(minBounds.hi + exclMin))
+    maxBounds = util.Bounds(
+        truncate(maxBounds.lo - exclMax), truncate(maxBounds.hi - exclMax))
+    return (minBounds, maxBounds)
+
+def isEmptyRange(param, minBounds, maxBounds):
+    """
+    Return True if the range of the numeric parameter, with limits in the
+    given Bounds, is always empty, False if it is never empty, and None if
+    it can be either.
+    """
+    exclMin = param.isMinExclusive()
+    exclMax = param.isMaxExclusive()
+    if param.getType() in generator.INT_TYPES:
+        (minBounds, maxBounds) = getIntegerLimits(param, minBounds, maxBounds)
+        if minBounds.hi <= maxBounds.lo:
+            return False
+        if minBounds.lo > maxBounds.hi:
+            return True
+        return None
+    excl = exclMin or exclMax
+    if minBounds.hi < maxBounds.lo or \
+            (minBounds.hi == maxBounds.lo and not excl):
+        return False
+    if minBounds.lo > maxBounds.hi or \
+            (minBounds.lo == maxBounds.hi and excl):
+        return True
+    return None
 
 class ParamStore:
     def __init__(self, params=()):
@@ -24,6 +143,13 @@ class ParamStore:
         self.__params = {}            # ID-to-Param mapping.
         self.__dep = {}               # ID-to-IDs mapping.
         self.__finalized = False
+        self.__fingerprint = None
+        self.__bounds = None          # ID-to-Bounds mapping.
+        self.__limits = None          # ID-to-(min, max) Bounds mapping.
+        self.__ids = ()               # Index-to-ID mapping.
+        self.__index = {}             # ID-to-index mapping.
+        self.__absolute = {}          # (context, reference)-to-ID mapping.
+        self.__trie = None            # Parent-to-child IDs.
         self.addParam(params)
 
     # Assumes that params is a sequence of parameters. If it turns out to be
@@ -58,6 +184,27 @@ class ParamStore:
 
     def setFixed(self, paramId, value):
         self.__params[paramId].setFixed(value)
+        self.__fingerprint = None
+        if self.__finalized:
+            self.__computeBounds()
+
+    def getFingerprint(self):
+        """
+        Return a string that identifies the content of this parameter
+        store. Stores with equal parameters have equal fingerprints.
+        The fingerprint is computed once, on first use, and again only if
+        a parameter is fixed through the store.
+
+        Calling this method will force finalization if not already done.
+        """
+        if not self.__finalized:
+            self.finalize()
+        if self.__fingerprint is None:
+            params = self.__params.values()
+            keys = sorted(repr(getParamKey(p)) for p in params)
+            data = '\n'.join(keys).encode('utf-8')
+            self.__fingerprint = hashlib.sha1(data).hexdigest()
+        return self.__fingerprint
 
     def finalize(self):
         """
@@ -69,11 +216,19 @@ class ParamStore:
         - There are unmet dependencies. (A referenced parameter is missing.)
         - There are circular dependencies.
         - Any independent parameters have invalid ranges.
+        - Any dependent parameters have ranges that are always empty.
+
+        Dependent ranges that might be empty, depending on the values of
+        other parameters, only cause a warning.
         """
         if self.__finalized:
             return
         self.__params = transformParameters(self.__params)
-        self.__topLevel = getTopLevelParameters(self.__params.values())
+        self.__trie = util.IdTrie(self.__params.keys())
+        self.__topLevel = [
+            self.__params[p] for p in self.__trie.children()
+            if p in self.__params
+        ]
         # Update dependencies so that all are absolute.
         self.__dep = util.getAbsoluteDependencies(self.__params)#, self.__dep)
 
@@ -81,8 +236,289 @@ class ParamStore:
         # is significant.
         self.__validateParameters()
         self.initOrder = util.initOrder(self.__dep)
+        self.__assignIndices()
+        self.__checkDependentRanges(self.__computeBounds())
         self.__finalized = True
 
+    def __assignIndices(self):
+        """
+        Number the parameters densely, in initialization order, and intern
+        their IDs.
+        """
+        order = self.initOrder
+        ids = [sys.intern(p) for k in sorted(order) for p in sorted(order[k])]
+        self.__params = {p: self.__params[p] for p in ids}
+        self.__ids = tuple(ids)
+        self.__index = {p: i for (i, p) in enumerate(ids)}
+
+    def getParamIndex(self, paramId):
+        """
+        Return the index of the parameter with the given ID, or None if
+        there is no such parameter. Indexes range from 0 to the number of
+        parameters (exclusive), and a parameter always comes after the
+        parameters it depends on.
+
+        Calling this method will force finalization if not already done.
+        """
+        if not self.__finalized:
+            self.finalize()
+        return self.__index.get(paramId)
+
+    def getParamIdAt(self, index):
+        """
+        Return the ID of the parameter with the given index.
+
+        Calling this method will force finalization if not already done.
+        """
+        if not self.__finalized:
+            self.finalize()
+        return self.__ids[index]
+
+    def getIndexedParamIds(self):
+        """
+        Return a tuple of all parameter IDs, ordered by index.
+
+        Calling this method will force finalization if not already done.
+        """
+        if not self.__finalized:
+            self.finalize()
+        return self.__ids
+
+    def getAbsoluteId(self, contextId, paramId):
+        """
+        Return the absolute ID of a parameter that is referenced (by a
+        possibly relative ID) from the context parameter, or None if no
+        such parameter exists. See util.findAbsoluteParameter.
+        The result is remembered, so repeated lookups are cheap.
+        """
+        key = (contextId, paramId)
+        if key not in self.__absolute:
+            ids = self.__params.keys()
+            absolute = util.findAbsoluteParameter(contextId, paramId, ids)
+            if absolute is not None:
+                absolute = sys.intern(absolute)
+            self.__absolute[key] = absolute
+        return self.__absolute[key]
+
+    def getBounds(self, paramId):
+        """
+        Return a list of util.Bounds that contain all the values that the
+        numeric parameter (or the elements of the numeric array) can be
+        initialized to, one for each non-empty range. Limits that depend on
+        other parameters are bounded using interval arithmetic, and missing
+        limits are the limits of the type. Return None for parameters that
+        are not numeric.
+
+        The bounds are computed when the store is finalized. Calling this
+        method will force finalization if not already done.
+        """
+        if not self.__finalized:
+            self.finalize()
+        return self.__bounds.get(paramId)
+
+    def checkBounds(self, paramId, value):
+        """
+        Return True if the value is valid for the numeric parameter (or as
+        an element of the numeric array) no matter what values the
+        parameters it depends on have, False if it can never be valid, and
+        None if that depends on those values (or the parameter is not a
+        numeric parameter with ranges).
+        This never evaluates any expressions.
+
+        Calling this method will force finalization if not already done.
+        """
+        if not self.__finalized:
+            self.finalize()
+        if self.__limits is None:
+            self.__computeLimits()
+        limits = self.__limits.get(paramId)
+        if limits is None:
+            return None
+        param = self.__params[paramId]
+        exclMin = param.isMinExclusive()
+        exclMax = param.isMaxExclusive()
+        possible = False
+        for (minBounds, maxBounds) in limits:
+            aboveMin = minBounds.hi < value or \
+                (minBounds.hi == value and not exclMin)
+            belowMax = value < maxBounds.lo or \
+                (value == maxBounds.lo and not exclMax)
+            if aboveMin and belowMax:
+                return True
+            if minBounds.lo <= value <= maxBounds.hi:
+                possible = True
+        return None if possible else False
+
+    def isValid(self, paramId, value, dep={}, depth=0):
+        """
+        Return whether the value is valid for the parameter. The cached
+        bounds (see checkBounds) are used to avoid evaluating dependent
+        limits whenever possible.
+        For arrays, depth is the number of indexes of the element (or
+        sub-array) that the value is for, if not the whole array.
+        """
+        param = self.__params[paramId]
+        if param.getTag() == ARRAY:
+            return self.__isValidArray(paramId, param, value, dep, depth)
+        result = self.checkBounds(paramId, value)
+        if result is None:
+            return param.isValid(value, dep)
+        return result
+
+    def __isValidArray(self, paramId, param, value, dep, depth):
+        if depth == 0:
+            elements = param.getElements(value)
+            if elements is None:
+                return False
+        else:
+            # Only the values of a part of the array are checked.
+            elements = getLeaves(value)
+        param = param.getElementParameter()
+        if param.getTag() != NPARAM:
+            return all(param.isValid(e, dep) for e in elements)
+        undecided = []
+        for e in elements:
+            result = self.checkBounds(paramId, e)
+            if result is False:
+                return False
+            if result is None:
+                undecided.append(e)
+        return all(param.isValidMany(undecided, dep))
+
+    def __computeBounds(self):
+        """
+        Compute the bounds used for initializing values (getBounds). The
+        limits used for validating values (checkBounds) are computed on
+        first use.
+        Return the limits used for initializing values.
+        """
+        (self.__bounds, limits) = self.__propagateBounds(True)
+        self.__limits = None
+        return limits
+
+    def __computeLimits(self):
+        """
+        Compute the limits used for validating values (checkBounds).
+        Values that are set rather than initialized are only limited by
+        the ranges, not by the type.
+        """
+        (bounds, self.__limits) = self.__propagateBounds(False)
+
+    def __propagateBounds(self, typeRange):
+        """
+        Return dictionaries mapping the IDs of numeric parameters to lists
+        of Bounds (one for each non-empty range) and to lists of (min, max)
+        pairs of Bounds (one for each range). If typeRange is true, then
+        missing limits are the limits of the type, otherwise unbounded.
+        """
+        bounds = {}
+        limits = {}
+        for paramId in self.__ids:
+            param = self.__params[paramId]
+            if param.getTag() == ARRAY:
+                param = param.getElementParameter()
+            if param.getTag() != NPARAM:
+                continue
+            if param.isFixed():
+                value = param.getFixedValue()
+                bounds[paramId] = [util.Bounds(value, value)]
+                continue
+            if param.getType() == BOOLEAN:
+                bounds[paramId] = [util.Bounds(0, 1)]
+                continue
+            dep = {}
+            for d in param.getDependees():
+                absolute = self.getAbsoluteId(paramId, d)
+                dep[d] = getHull(bounds.get(absolute))
+            if typeRange:
+                (typeMin, typeMax) = generator.RANGE_MAP[param.getType()]
+            else:
+                (typeMin, typeMax) = (-math.inf, math.inf)
+            if typeRange:
+                ranges = zip(param.getMin(), param.getMax())
+            else:
+                # Validation uses the (converted) limits of the intervals.
+                ranges = [
+                    (i.getMin(), i.getMax()) for i in param.getIntervals()
+                ]
+            # Integer intervals truncate their limits when validating.
+            truncated = not typeRange and \
+                param.getType() in generator.INT_TYPES
+            pairs = [
+                (getLimitBounds(minVal, dep, typeMin, truncated),
+                    getLimitBounds(maxVal, dep, typeMax, truncated))
+                for (minVal, maxVal) in ranges
+            ]
+            limits[paramId] = pairs
+            if typeRange and param.getType() in generator.INT_TYPES:
+                pairs = [getIntegerLimits(param, *p) for p in pairs]
+            bounds[paramId] = [
+                util.Bounds(minBounds.lo, maxBounds.hi)
+                for (minBounds, maxBounds) in pairs
+                if minBounds.lo <= maxBounds.hi
+            ]
+        return (bounds, limits)
+
+    def __checkDependentRanges(self, limits):
+        """
+        Use the bounds of the limits of dependent ranges to prove that
+        they cannot be empty. A single warning lists all the ranges that
+        might be empty, depending on the values of other parameters.
+
+        Raises ValueError if a range is always empty.
+        """
+        possiblyEmpty = []
+        for (paramId, pairs) in limits.items():
+            param = self.__params[paramId]
+            if not param.isDependent():
+                continue
+            if param.getTag() == ARRAY:
+                param = param.getElementParameter()
+            empty = [isEmptyRange(param, *p) for p in pairs]
+            if False in empty:
+                continue
+            if all(empty):
+                raise ValueError('Empty value range for %s' % (paramId))
+            if self.__isNeverEmpty(paramId, param):
+                continue
+            dependees = ', '.join(sorted(set(param.getDependees())))
+            possiblyEmpty.append('%s (%s)' % (paramId, dependees))
+        if possiblyEmpty:
+            msg = 'These ranges may be empty, depending on the parameters ' \
+                'in parentheses: %s'
+            warnings.warn(msg % (', '.join(possiblyEmpty)))
+
+    def __isNeverEmpty(self, paramId, param):
+        """
+        Return True if the numeric parameter has a range with linear limits
+        that can be proven to never be empty. The bounds of the limits are
+        not enough when both limits depend on the same parameter, such as
+        X and X * 2 + 10, but the bounds of their difference are exact.
+        """
+        dependees = set(param.getDependees())
+        bounds = {
+            d: getHull(self.__bounds.get(self.getAbsoluteId(paramId, d)))
+            for d in dependees
+        }
+        (typeMin, typeMax) = generator.RANGE_MAP[param.getType()]
+        exclMin = param.isMinExclusive()
+        exclMax = param.isMaxExclusive()
+        for (minVal, maxVal) in zip(param.getMin(), param.getMax()):
+            minVal = getAffineLimit(minVal, dependees, typeMin)
+            maxVal = getAffineLimit(maxVal, dependees, typeMax)
+            if minVal is None or maxVal is None:
+                continue
+            if param.getType() in generator.INT_TYPES:
+                # Truncation preserves the order of the limits.
+                (minVal, maxVal) = (minVal + exclMin, maxVal - exclMax)
+                if (maxVal - minVal).getBounds(bounds).lo >= 0:
+                    return True
+            else:
+                lo = (maxVal - minVal).getBounds(bounds).lo
+                if lo > 0 or (lo == 0 and not (exclMin or exclMax)):
+                    return True
+        return False
+
     def getInitializationOrder(self):
         """
         Return a dictionary that maps the initialization order to the
@@ -114,6 +550,17 @@ class ParamStore:
     def getTopLevelParameters(self):
         return self.__topLevel
 
+    def getIdTrie(self):
+        """
+        Return a util.IdTrie of all parameter IDs, for finding the nested
+        parameters of a parameter.
+
+        Calling this method will force finalization if not already done.
+        """
+        if not self.__finalized:
+            self.finalize()
+        return self.__trie
+
     def __validateParameters(self):
         """
         Check that all parameters are valid.
@@ -134,8 +581,8 @@ class ParamStore:
                 msg = '%s referencing nonexistent parameter %s' % (paramId, d)
                 raise ValueError(msg)
 
-    # This test isn't as thorough as it could be. It only checks completely
-    # independent parameters.
+    # This test only checks completely independent parameters. Dependent
+    # ranges are checked once the initialization order is known.
     def __validRange(self, param):
         if param.isDependent():
             return True     # Don't know that it's invalid at least.
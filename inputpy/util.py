@@ -5,11 +5,22 @@ This module exports utility classes/functions:
 - Evaluator
     - Can evaluate expressions, optionally including parameter values.
     - Can parse expressions and return referenced parameters.
+- Bounds
+    - Interval arithmetic for bounding the values of expressions.
+- Affine
+    - Exact arithmetic on linear expressions of parameters.
+- IntervalIndex
+    - Fast membership testing for a set of intervals.
+- IdTrie
+    - Prefix queries (children, descendants) over dotted parameter IDs.
+- BloomFilter
+    - A compact, probabilistic set for detecting repeated items.
 
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
 import math
+from bisect import bisect_right
 
 class Identifiable:
     """
@@ -17,6 +28,8 @@ class Identifiable:
     An instance can be initialized using an id argument. If none is
     provided, then a unique id will be constructed automatically.
     """
+    __slots__ = ('__id',)
+
     def __init__(self, objId=None):
         self.__id = objId or str(id(self))
 
@@ -173,6 +186,30 @@ class Evaluator:
         exp = cls.remapExpression(exp, remapping)
         return eval(exp, ns)
 
+    @classmethod
+    def compile(cls, exp, mode=JS):
+        """
+        Return a function that evaluates the expression, given a dictionary
+        of parameters, the same way evaluate does. The expression is parsed
+        and remapped only once, so the function is cheap to call.
+
+        Keyword arguments:
+        mode    -- the evaluation mode (default 'js')
+        """
+        parameters = cls.parseDependencies(exp, mode)
+        remapping = cls.getRemapping(parameters, parameters)
+        names = tuple((p, remapping.get(p, p)) for p in parameters)
+        exp = cls.remapExpression(exp, remapping).strip()
+        code = compile(exp, exp, 'eval')
+        namespace = cls.getSafeNamespace(mode)
+
+        def evaluate(params={}):
+            ns = dict(namespace)
+            for (k, v) in names:
+                ns[v] = params[k]
+            return eval(code, ns)
+        return evaluate
+
     @classmethod
     def __checkMode(cls, mode):
         if not mode in cls.MODES:
@@ -187,6 +224,188 @@ class Evaluator:
     def parseRange(exp):
         return [s.strip() for s in exp.split(',')]
 
+class Bounds:
+    """
+    A closed range of numbers that supports arithmetic. The result of an
+    operation contains every result of the operation applied to numbers
+    in the operands (interval arithmetic). Expressions can therefore be
+    evaluated with Bounds in place of parameter values to find bounds for
+    the result.
+    """
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    @staticmethod
+    def of(value):
+        if isinstance(value, Bounds):
+            return value
+        return Bounds(value, value)
+
+    @staticmethod
+    def hull(values):
+        """
+        Return the smallest Bounds that contain all the values. Values that
+        are not a number (infinity minus infinity, say) make the result
+        unbounded.
+        """
+        if any(math.isnan(v) for v in values):
+            return Bounds(-math.inf, math.inf)
+        return Bounds(min(values), max(values))
+
+    def __add__(self, other):
+        other = Bounds.of(other)
+        return Bounds.hull((self.lo + other.lo, self.hi + other.hi))
+
+    def __sub__(self, other):
+        other = Bounds.of(other)
+        return Bounds.hull((self.lo - other.hi, self.hi - other.lo))
+
+    def __mul__(self, other):
+        other = Bounds.of(other)
+        return Bounds.hull([
+            a * b for a in (self.lo, self.hi) for b in (other.lo, other.hi)
+        ])
+
+    def __truediv__(self, other):
+        other = Bounds.of(other)
+        if other.lo <= 0 <= other.hi:
+            return Bounds(-math.inf, math.inf)
+        return self * Bounds.hull((1 / other.lo, 1 / other.hi))
+
+    def __radd__(self, other):
+        return Bounds.of(other) + self
+
+    def __rsub__(self, other):
+        return Bounds.of(other) - self
+
+    def __rmul__(self, other):
+        return Bounds.of(other) * self
+
+    def __rtruediv__(self, other):
+        return Bounds.of(other) / self
+
+    def __neg__(self):
+        return Bounds(-self.hi, -self.lo)
+
+    def __pos__(self):
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, Bounds):
+            return False
+        return self.lo == other.lo and self.hi == other.hi
+
+    def __str__(self):
+        return '[%s, %s]' % (self.lo, self.hi)
+
+    def __repr__(self):
+        return self.__str__()
+
+def evaluateBounds(exp, bounds):
+    """
+    Return Bounds for the value of the expression, given Bounds for the
+    parameters it references. Expressions that cannot be evaluated using
+    interval arithmetic (such as function calls) are unbounded.
+    """
+    try:
+        return Bounds.of(Evaluator.evaluate(exp, bounds))
+    except Exception:
+        return Bounds(-math.inf, math.inf)
+
+class Affine:
+    """
+    A linear combination of parameters plus a constant that supports the
+    arithmetic operations that keep it linear. Unlike Bounds, it keeps
+    track of the parameters, so X * 2 - X evaluates to exactly X. Other
+    operations raise TypeError.
+    """
+    def __init__(self, const, coefficients={}):
+        self.const = const
+        self.coefficients = {k: v for (k, v) in coefficients.items() if v}
+
+    @staticmethod
+    def of(value):
+        if isinstance(value, Affine):
+            return value
+        if isinstance(value, (int, float)):
+            return Affine(value)
+        raise TypeError('Not an affine value: %r' % (value,))
+
+    @staticmethod
+    def variable(name):
+        return Affine(0, {name: 1})
+
+    def isConstant(self):
+        return not self.coefficients
+
+    def getBounds(self, bounds):
+        """
+        Return the Bounds of the value, given Bounds for the parameters.
+        """
+        (lo, hi) = (self.const, self.const)
+        for (k, v) in self.coefficients.items():
+            terms = (v * bounds[k].lo, v * bounds[k].hi)
+            (lo, hi) = (lo + min(terms), hi + max(terms))
+        return Bounds.hull((lo, hi))
+
+    def __scale(self, factor):
+        coefficients = {k: v * factor for (k, v) in self.coefficients.items()}
+        return Affine(self.const * factor, coefficients)
+
+    def __add__(self, other):
+        other = Affine.of(other)
+        coefficients = dict(self.coefficients)
+        for (k, v) in other.coefficients.items():
+            coefficients[k] = coefficients.get(k, 0) + v
+        return Affine(self.const + other.const, coefficients)
+
+    def __sub__(self, other):
+        return self + -Affine.of(other)
+
+    def __mul__(self, other):
+        other = Affine.of(other)
+        if other.isConstant():
+            return self.__scale(other.const)
+        if self.isConstant():
+            return other.__scale(self.const)
+        raise TypeError('Product of parameters is not affine')
+
+    def __truediv__(self, other):
+        other = Affine.of(other)
+        if not other.isConstant():
+            raise TypeError('Division by a parameter is not affine')
+        return self.__scale(1 / other.const)
+
+    def __radd__(self, other):
+        return Affine.of(other) + self
+
+    def __rsub__(self, other):
+        return Affine.of(other) - self
+
+    def __rmul__(self, other):
+        return Affine.of(other) * self
+
+    def __rtruediv__(self, other):
+        return Affine.of(other) / self
+
+    def __neg__(self):
+        return self.__scale(-1)
+
+    def __pos__(self):
+        return self
+
+def evaluateAffine(exp, names):
+    """
+    Return the expression as an Affine of the parameters in names, or None
+    if it is not linear in them.
+    """
+    try:
+        return Affine.of(
+            Evaluator.evaluate(exp, {k: Affine.variable(k) for k in names}))
+    except Exception:
+        return None
+
 def depLen(params, paramId, dependents=None):
     """
     Return the longest chain of dependencies for the parameter ID using
@@ -395,6 +614,13 @@ def relative(paramId):
     else:
         return paramId[index + 1:]
 
+def relativeTo(ancestorId, paramId):
+    """
+    Return a list of the parts of the parameter ID below the ancestor.
+    For example, relativeTo('A.B', 'A.B.C.D') returns ['C', 'D'].
+    """
+    return paramId[len(ancestorId) + 1:].split('.')
+
 def root(paramId):
     index = paramId.find('.')
     if index == -1:
@@ -572,6 +798,11 @@ class Interval:
     types = {
         'int': int, int: int, 'float': float, float: float,
     }
+    __slots__ = (
+        'type', 'inclMin', 'exclMin', 'inclMax', 'exclMax', 'minIsExcl',
+        'maxIsExcl', 'min', 'max', 'fullyEvaluated', '__spec',
+        '__limitFunctions',
+    )
 
     def __init__(self, inclMin=None, exclMin=None, inclMax=None, exclMax=None,
             spec=None, type=None):
@@ -584,12 +815,12 @@ class Interval:
         # Update this to types[type]. We want an invalid type to fail.
         self.type = Interval.types.get(type)
 
-        self.inclMin = Interval.__evaluateLimit(inclMin)
-        self.exclMin = Interval.__evaluateLimit(exclMin)
-        self.inclMax = Interval.__evaluateLimit(inclMax)
-        self.exclMax = Interval.__evaluateLimit(exclMax)
+        self.inclMin = Interval.__evaluateLimit(inclMin, self.type)
+        self.exclMin = Interval.__evaluateLimit(exclMin, self.type)
+        self.inclMax = Interval.__evaluateLimit(inclMax, self.type)
+        self.exclMax = Interval.__evaluateLimit(exclMax, self.type)
 
-        self.spec = IntervalParser.makeIntervalSpec(*self.getLimits())
+        self.__spec = None  # Formatted on first use.
 
         self.minIsExcl = exclMin is not None
         self.maxIsExcl = exclMax is not None
@@ -599,12 +830,31 @@ class Interval:
         self.max = Interval.__getLimit(
             self.inclMax, self.exclMax, self.maxIsExcl)
 
-        if isinstance(self.min, str) or isinstance(self.max, str):
-            self.fullyEvaluated = False
-        else:
-            self.fullyEvaluated = True
-            self.containmentTest = self.__getContainmentTest()
-
+        self.fullyEvaluated = not (
+            isinstance(self.min, str) or isinstance(self.max, str))
+        self.__limitFunctions = None    # Compiled on first use.
+
+    def __getstate__(self):
+        # The compiled limit functions cannot be pickled. They are compiled
+        # again on first use.
+        state = {}
+        for name in Interval.__slots__:
+            if name.startswith('__'):
+                name = '_Interval' + name
+            state[name] = getattr(self, name)
+        state['_Interval__limitFunctions'] = None
+        return state
+
+    def __setstate__(self, state):
+        for (name, value) in state.items():
+            setattr(self, name, value)
+
+    @property
+    def spec(self):
+        if self.__spec is None:
+            limits = self.getLimits()
+            self.__spec = IntervalParser.makeIntervalSpec(*limits)
+        return self.__spec
 
     @staticmethod
     def __getLimit(inclLimit, exclLimit, exclusive):
@@ -614,9 +864,12 @@ class Interval:
             return inclLimit
 
     @staticmethod
-    def __evaluateLimit(limit):
+    def __evaluateLimit(limit, type=None):
         if limit is None:
             return limit
+        # Only float intervals keep the fractions of their limits.
+        if type is float and isinstance(limit, (int, float)):
+            return limit
         try:
             return int(limit)
         except ValueError: pass
@@ -628,17 +881,6 @@ class Interval:
         except (NameError, KeyError): pass
         return limit
 
-    def __getContainmentTest(self):
-        minVal = self.min
-        leftOpen = self.isLeftOpen()
-        lowerLimitTest = self.__getLowerLimitTest(minVal, leftOpen)
-
-        maxVal = self.max
-        rightOpen = self.isRightOpen()
-        upperLimitTest = self.__getUpperLimitTest(maxVal, rightOpen)
-
-        return lambda x: lowerLimitTest(x) and upperLimitTest(x)
-
     def isLeftOpen(self):
         return not self.isLeftClosed()
 
@@ -655,26 +897,66 @@ class Interval:
     def __isClosed(limit, exclusive):
         return exclusive or limit is None
 
-    @staticmethod
-    def __getLowerLimitTest(limit, open):
-        if open:
-            return lambda x: limit <= x
-        elif limit is None:
-            return lambda x: True
-        else:
-            return lambda x: limit < x
+    def contains(self, value):
+        return self.__contains(value, self.min, self.max)
 
-    @staticmethod
-    def __getUpperLimitTest(limit, open):
-        if open:
-            return lambda x: x <= limit
-        elif limit is None:
-            return lambda x: True
-        else:
-            return lambda x: x < limit
+    def __contains(self, value, minVal, maxVal):
+        """
+        Return whether the value is between the (evaluated) limits.
+        """
+        if minVal is not None:
+            if self.minIsExcl:
+                if not minVal < value:
+                    return False
+            elif not minVal <= value:
+                return False
+        if maxVal is not None:
+            if self.maxIsExcl:
+                if not value < maxVal:
+                    return False
+            elif not value <= maxVal:
+                return False
+        return True
 
-    def contains(self, value):
-        return self.containmentTest(value)
+    def containsWith(self, value, boundValues):
+        """
+        Return whether the value is contained in this interval, once any
+        dependent endpoints have been evaluated using the values in the
+        boundValues dictionary. This is equivalent to (but much cheaper
+        than) evaluating the endpoints and calling getUpdated(...).contains.
+        """
+        if self.fullyEvaluated:
+            return self.__contains(value, self.min, self.max)
+        if self.__limitFunctions is None:
+            self.__limitFunctions = (
+                Interval.__compileLimit(self.min, self.type),
+                Interval.__compileLimit(self.max, self.type),
+            )
+        (minFunction, maxFunction) = self.__limitFunctions
+        minVal = minFunction(boundValues)
+        maxVal = maxFunction(boundValues)
+        return self.__contains(value, minVal, maxVal)
+
+    def containsMany(self, values, boundValues={}):
+        """
+        Return a list of booleans, telling which of the values are contained
+        in this interval. See containsWith.
+        """
+        if self.fullyEvaluated:
+            (minVal, maxVal) = (self.min, self.max)
+            return [self.__contains(v, minVal, maxVal) for v in values]
+        return [self.containsWith(v, boundValues) for v in values]
+
+    @staticmethod
+    def __compileLimit(limit, type):
+        """
+        Return a function mapping dependency values to the limit, converted
+        the same way as the limits of a new Interval.
+        """
+        if not isinstance(limit, str):
+            return lambda dep: limit
+        evaluate = Evaluator.compile(limit)
+        return lambda dep: Interval.__evaluateLimit(evaluate(dep), type)
 
     def getLimits(self):
         return (self.inclMin, self.exclMin, self.inclMax, self.exclMax)
@@ -736,3 +1018,167 @@ class Interval:
 
     def __repr__(self):
         return self.__str__()
+
+
+class IntervalIndex:
+    """
+    A set of fully evaluated intervals, sorted by their lower endpoints,
+    that supports membership testing in O(log k) time for k intervals.
+    The intervals may overlap.
+    """
+    __slots__ = ('__intervals', '__mins', '__furthest')
+
+    def __init__(self, intervals):
+        assert all(i.isFullyEvaluated() for i in intervals)
+        self.__intervals = sorted(intervals, key=IntervalIndex.__lowerKey)
+        self.__mins = [IntervalIndex.__lowerKey(i) for i in self.__intervals]
+        # For each prefix of the sorted intervals, the interval that reaches
+        # the furthest. Any value that it doesn't reach is not contained.
+        self.__furthest = []
+        furthest = None
+        for i in self.__intervals:
+            if furthest is None or \
+                    IntervalIndex.__upperKey(i) > \
+                    IntervalIndex.__upperKey(furthest):
+                furthest = i
+            self.__furthest.append(furthest)
+
+    @staticmethod
+    def __lowerKey(interval):
+        limit = interval.getMin()
+        return -math.inf if limit is None else limit
+
+    @staticmethod
+    def __upperKey(interval):
+        limit = interval.getMax()
+        return (math.inf if limit is None else limit, not interval.maxIsExcl)
+
+    def contains(self, value):
+        n = bisect_right(self.__mins, value)
+        if n == 0:
+            return False
+        furthest = self.__furthest[n - 1]
+        if furthest.contains(value):
+            return True
+        # The value may be equal to an exclusive lower limit.
+        if IntervalIndex.__lowerKey(furthest) != value:
+            return False
+        return any(i.contains(value) for i in self.__intervals[:n])
+
+    def containsMany(self, values):
+        """
+        Return a list of booleans, telling which of the values are contained
+        in any of the intervals.
+        """
+        return [self.contains(v) for v in values]
+
+    def __len__(self):
+        return len(self.__intervals)
+
+
+class IdTrie:
+    """
+    A tree of dotted parameter IDs, where the parent of 'A.B.C' is 'A.B'.
+    Adding an ID implicitly adds its ancestors. Children are kept in the
+    order they were first added. Queries take time proportional to the
+    size of the result, rather than to the number of IDs.
+
+    The root of the tree is None, so the children of None are the IDs
+    without a parent (top-level IDs).
+    """
+    __slots__ = ('__children',)
+
+    def __init__(self, ids=()):
+        self.__children = {None: {}}    # ID -> ordered set of child IDs.
+        for paramId in ids:
+            self.add(paramId)
+
+    def add(self, paramId):
+        if paramId in self.__children:
+            return
+        parentId = parent(paramId)
+        self.add(parentId)
+        self.__children[parentId][paramId] = None
+        self.__children[paramId] = {}
+
+    def children(self, paramId=None):
+        """
+        Return a list of the IDs directly below the ID.
+        """
+        return list(self.__children.get(paramId, ()))
+
+    def descendants(self, paramId=None):
+        """
+        Return a list of all IDs below the ID, in depth-first order.
+        """
+        result = []
+        stack = [iter(self.__children.get(paramId, ()))]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                continue
+            result.append(child)
+            stack.append(iter(self.__children[child]))
+        return result
+
+    def subtree(self, paramId):
+        """
+        Return a list of the ID and all IDs below it, or an empty list if
+        the ID is unknown.
+        """
+        if paramId not in self.__children:
+            return []
+        return [paramId] + self.descendants(paramId)
+
+    def __contains__(self, paramId):
+        return paramId is not None and paramId in self.__children
+
+    def __len__(self):
+        return len(self.__children) - 1
+
+
+class BloomFilter:
+    """
+    A compact, probabilistic set of hashable items. Membership tests may
+    give false positives (at roughly the specified error rate, once the
+    filter holds capacity items), but never false negatives.
+    """
+    def __init__(self, capacity, errorRate=0.01):
+        """
+        Raises ValueError if the capacity is not positive or if the error
+        rate is not between 0 and 1 (exclusive).
+        """
+        if capacity < 1:
+            raise ValueError('The capacity must be positive')
+        if not 0 < errorRate < 1:
+            raise ValueError('The error rate must be between 0 and 1')
+        bits = -capacity * math.log(errorRate) / (math.log(2) ** 2)
+        self.__size = max(8, int(math.ceil(bits)))
+        hashes = self.__size / capacity * math.log(2)
+        self.__hashes = max(1, int(round(hashes)))
+        self.__bits = bytearray((self.__size + 7) // 8)
+        self.__count = 0
+
+    def add(self, item):
+        for i in self.__getIndices(item):
+            self.__bits[i >> 3] |= 1 << (i & 7)
+        self.__count += 1
+
+    def __getIndices(self, item):
+        # Double hashing: the k indices are h1 + i*h2.
+        h1 = hash(item)
+        h2 = hash((h1, self.__size)) | 1
+        return ((h1 + i * h2) % self.__size for i in range(self.__hashes))
+
+    def __contains__(self, item):
+        for i in self.__getIndices(item):
+            if not self.__bits[i >> 3] & (1 << (i & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        """
+        Return the number of items that have been added.
+        """
+        return self.__count
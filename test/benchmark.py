@@ -0,0 +1,118 @@
+"""
+test.benchmark
+
+Micro-benchmarks for performance sensitive parts of InPUT. These are not
+unit tests. Run the module directly to print the results:
+
+    python -m test.benchmark
+
+:copyright: (c) 2013 by Christoffer Fink.
+:license: MIT. See LICENSE for details.
+"""
+import os
+import shutil
+import tempfile
+import timeit
+import tracemalloc
+from inputpy.factories import XMLFactory, CompiledSpaceCache
+from inputpy.param import getParameter
+from inputpy.q import *
+
+def benchmarkDependentIsValid(n=100000):
+    """
+    Return the time (in seconds) it takes to check n values against a
+    parameter with dependent ranges.
+    """
+    param = getParameter('B', NPARAM, INTEGER, inclMin='A.X + 1',
+        exclMax='A.X * 10 + Y')
+    dep = {'A.X': 5, 'Y': 2}
+    values = [i % 60 for i in range(n)]
+    def check():
+        for v in values:
+            param.isValid(v, dep)
+    return timeit.timeit(check, number=1)
+
+def benchmarkMultiRangeIsValid(n=100000, k=50):
+    """
+    Return the time (in seconds) it takes to check n values against a
+    parameter with k disjoint ranges.
+    """
+    mins = ','.join(str(i * 10) for i in range(k))
+    maxs = ','.join(str(i * 10 + 5) for i in range(k))
+    param = getParameter('X', NPARAM, INTEGER, inclMin=mins, inclMax=maxs)
+    values = [i % (k * 10) for i in range(n)]
+    def check():
+        for v in values:
+            param.isValid(v)
+    return timeit.timeit(check, number=1)
+
+def benchmarkParameterMemory(n=10000):
+    """
+    Return the number of bytes allocated per parameter when creating n
+    numeric parameters with (partly dependent) ranges.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    params = [
+        getParameter('X%d' % (i), NPARAM, INTEGER, inclMin='1, A',
+            exclMax='10, A + 5')
+        for i in range(n)
+    ]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(params)
+
+def writeSpace(fileName, n):
+    """
+    Write a design space with n numeric parameters, all but the first one
+    depending on the first one.
+    """
+    lines = [
+        '<i:DesignSpace id="benchmark" '
+        'xmlns:i="http://TheInPUT.org/DesignSpace">',
+        '<i:NParam id="X0" type="integer" inclMin="0" inclMax="10" />',
+    ]
+    for i in range(1, n):
+        lines.append('<i:NParam id="X%d" type="integer" inclMin="X0" '
+            'exclMax="X0 * 2 + 10" />' % (i))
+    lines.append('</i:DesignSpace>')
+    with open(fileName, 'w') as f:
+        f.write('\n'.join(lines))
+
+def benchmarkImportSpace(n=1000, compiled=False):
+    """
+    Return the time (in seconds) it takes to import a design space with n
+    parameters, either from XML or from a compiled space.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        fileName = os.path.join(directory, 'space.xml')
+        writeSpace(fileName, n)
+        if compiled:
+            load = CompiledSpaceCache().get
+            load(fileName)
+        else:
+            load = XMLFactory.getDesignSpace
+        return timeit.timeit(lambda: load(fileName), number=1)
+    finally:
+        shutil.rmtree(directory)
+
+def benchmarkLoadCompiledSpace(n=1000):
+    return benchmarkImportSpace(n, compiled=True)
+
+BENCHMARKS = (
+    ('isValid (dependent)', benchmarkDependentIsValid),
+    ('isValid (50 ranges)', benchmarkMultiRangeIsValid),
+    ('import space (XML)', benchmarkImportSpace),
+    ('import space (compiled)', benchmarkLoadCompiledSpace),
+)
+
+MEMORY_BENCHMARKS = (
+    ('NParam size', benchmarkParameterMemory),
+)
+
+if __name__ == '__main__':
+    for (name, benchmark) in BENCHMARKS:
+        print('%-30s %.3f s' % (name, benchmark()))
+    for (name, benchmark) in MEMORY_BENCHMARKS:
+        print('%-30s %.0f bytes' % (name, benchmark()))
@@ -12,6 +12,7 @@ from test.factories import *
 from test.tools import *
 from test.types.simple import EmptyClass
 from test.types.geo import Point
+from inputpy.q import ARRAY
 
 DESIGN_SPACE_FILE = 'arraySpace.xml'
 CODE_MAPPING_FILE = 'arrayMapping.xml'
@@ -89,6 +90,16 @@ class TestArraySpace(unittest.TestCase):
             array = gen.nextValue(param)
             assertMatchingArrayDimensions(sizes, array)
 
+    def testShapeAndElementParameter(self):
+        for (paramId, sizes) in EXPECTED_SIZES.items():
+            param = paramStore.getParam(paramId)
+            shape = tuple(s or 1 for s in param.getShape())
+            self.assertEqual(sizes, shape)
+            element = param.getElementParameter()
+            self.assertNotEqual(ARRAY, element.getTag())
+            self.assertEqual(element.getType(), param.getType())
+            self.assertEqual(element.getId(), param.getId())
+
     def testEqualityForRawParam(self):
         for (paramId, expected) in EXPECTED_ARRAYS.items():
             param = paramStore.getParam(paramId)
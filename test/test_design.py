@@ -3,7 +3,7 @@
 :license: MIT. See LICENSE for details.
 """
 import unittest
-from inputpy.design import Design
+from inputpy.design import Design, Delta, DesignArchive, copyArray
 from inputpy.param import getParameter
 from inputpy.paramstore import ParamStore
 from inputpy.designspace import DesignSpace
@@ -193,5 +193,282 @@ class TestDesign(unittest.TestCase):
     def testSetValueShouldValidateValues(self):
         pass
 
+    def testCloneShouldShareValuesUntilWritten(self):
+        param1 = getParameter('A', NPARAM, INTEGER + '[2][3]')
+        param2 = getParameter('B', NPARAM, INTEGER)
+        space = DesignSpace(ParamStore((param1, param2)))
+        design = space.nextDesign('Design')
+        clone = design.clone('Clone')
+        self.assertEqual('Clone', clone.getId())
+        self.assertIs(design.getSpace(), clone.getSpace())
+        self.assertIs(design.params, clone.params)
+
+        b = design.getValue('B')
+        clone.setValue('B', b + 1)
+        self.assertEqual(b, design.getValue('B'))
+        self.assertEqual(b + 1, clone.getValue('B'))
+        # The array is still shared.
+        self.assertIs(design.getValue('A'), clone.getValue('A'))
+
+    def testCloneShouldCopyArraysWhenElementIsWritten(self):
+        param = getParameter('A', NPARAM, INTEGER + '[2][3]',
+            inclMin=0, inclMax=3)
+        space = DesignSpace(ParamStore(param))
+        design = space.nextDesign('Design')
+        design.setValue('A', [[0, 0, 0], [0, 0, 0]])
+        clone1 = design.clone()
+        clone2 = clone1.clone()
+        clone1.setValue('A.2.3', 1)
+        design.setValue('A.1.1', 2)
+        self.assertEqual([[0, 0, 0], [0, 0, 1]], clone1.getValue('A'))
+        self.assertEqual([[2, 0, 0], [0, 0, 0]], design.getValue('A'))
+        self.assertEqual([[0, 0, 0], [0, 0, 0]], clone2.getValue('A'))
+        # Once copied, the array is owned and writes go straight to it.
+        array = clone1.getValue('A')
+        clone1.setValue('A.1.2', 3)
+        self.assertIs(array, clone1.getValue('A'))
+        self.assertEqual([0, 3, 0], array[0])
+
+    def testCloneOfReadOnlyDesignShouldBeReadOnly(self):
+        param = getParameter('A', NPARAM, INTEGER)
+        space = DesignSpace(ParamStore(param))
+        clone = space.nextDesign(readOnly=True).clone()
+        with self.assertRaises(InPUTException):
+            clone.setValue('A', 1)
+
+    def testSetValues(self):
+        param1 = getParameter('A', NPARAM, INTEGER, inclMin=3, inclMax='B')
+        param2 = getParameter('B', NPARAM, INTEGER, inclMin=5, inclMax=10)
+        param3 = getParameter('C', NPARAM, INTEGER + '[3]')
+        space = DesignSpace(ParamStore((param1, param2, param3)))
+        design = space.nextDesign()
+        # A is only valid after B has been updated.
+        design.setValues({'A': 9, 'B': 10, 'C.2': 4})
+        self.assertEqual(9, design.getValue('A'))
+        self.assertEqual(10, design.getValue('B'))
+        self.assertEqual(4, design.getValue('C.2'))
+        self.assertIn('C.3', design.getSupportedParamIds())
+
+    def testSetValuesShouldBeAtomic(self):
+        param1 = getParameter('A', NPARAM, INTEGER, inclMin=3, inclMax='B')
+        param2 = getParameter('B', NPARAM, INTEGER, inclMin=5, inclMax=10)
+        param3 = getParameter('C', NPARAM, INTEGER, fixed=3)
+        param4 = getParameter('E', NPARAM, INTEGER + '[3]')
+        space = DesignSpace(ParamStore((param1, param2, param3, param4)))
+        design = space.nextDesign()
+        before = dict(design.params)
+        invalid = (
+            {'A': 9, 'B': 8}, {'A': 5, 'B': 11}, {'A': 5, 'C': 3},
+            {'A': 5, 'D': 3}, {'A': None}, {'B': 6, 'E.4': 1},
+            {'B': 6, 'E.0': 1}, {'B': 6, 'E.1.1': 1}, {'B': 6, 'B.1': 1},
+        )
+        for values in invalid:
+            with self.assertRaises(InPUTException):
+                design.setValues(values)
+            self.assertEqual(before, design.params)
+        space.setRuntimeValidation(False)
+        with self.assertRaises(InPUTException):
+            design.setValues({'B': 6, 'E.4': 1})
+        self.assertEqual(before, design.params)
+        design.setReadOnly()
+        with self.assertRaises(InPUTException):
+            design.setValues({'A': 5})
+
+    def testEqualDesignsShouldHaveEqualHashes(self):
+        param1 = getParameter('A', NPARAM, INTEGER + '[2][3]')
+        param2 = getParameter('B', NPARAM, INTEGER)
+        space = DesignSpace(ParamStore((param1, param2)))
+        design = space.nextDesign('Design')
+        other = Design(dict(design.params), space, 'Design')
+        self.assertEqual(design, other)
+        self.assertEqual(hash(design), hash(other))
+        self.assertEqual(1, len({design, other, design.clone('Design')}))
+        other.setValue('B', design.getValue('B') + 1)
+        self.assertNotEqual(design, other)
+        self.assertEqual(2, len({design, other}))
+
+    def getValidationSpace(self):
+        param1 = getParameter('A', NPARAM, INTEGER, inclMin=3, inclMax='B')
+        param2 = getParameter('B', NPARAM, INTEGER, inclMin=5, inclMax=10)
+        param3 = getParameter('C', NPARAM, INTEGER, fixed=3)
+        return DesignSpace(ParamStore((param1, param2, param3)))
+
+    def testUncheckedWritesWhenRuntimeValidationIsOff(self):
+        space = self.getValidationSpace()
+        self.assertTrue(space.isRuntimeValidationActive())
+        space.setRuntimeValidation(False)
+        design = space.nextDesign()
+        self.assertFalse(design.isRuntimeValidationActive())
+        design.setValue('A', 11)
+        design.setValue('C', 4)
+        design.setValues({'B': 20})
+        self.assertEqual(11, design.getValue('A'))
+        self.assertEqual(4, design.getValue('C'))
+        self.assertEqual(20, design.getValue('B'))
+        with self.assertRaises(InPUTException) as cm:
+            design.validate()
+        self.assertIn('B, C', str(cm.exception))
+        design.setValues({'B': 10, 'C': 3, 'A': 9})
+        design.validate()
+        # Unknown parameters fail the same way with or without validation.
+        for paramId in ('D', 'A.1'):
+            with self.assertRaises(InPUTException):
+                design.setValue(paramId, 5)
+        design.setReadOnly()
+        with self.assertRaises(InPUTException):
+            design.setValue('A', 5)
+
+    def testValidateNestedDependencies(self):
+        x = getParameter('X', NPARAM, INTEGER, parentId='P',
+            inclMin=1, inclMax=5)
+        y = getParameter('Y', NPARAM, INTEGER, parentId='P',
+            inclMin='X', inclMax=9)
+        space = DesignSpace(ParamStore(
+            getParameter('P', SPARAM, STRING, nested=[x, y])))
+        design = Design({'P': 'P', 'P.X': 2, 'P.Y': 3}, space)
+        design.validate()
+        design.setValue('P.Y', 2)
+        design.setValues({'P.X': 1, 'P.Y': 1})
+        with self.assertRaises(InPUTException):
+            design.setValue('P.Y', 0)
+        design.setRuntimeValidation(False)
+        design.setValue('P.X', 5)
+        with self.assertRaises(InPUTException):
+            design.validate()
+
+    def testValidateFixedArrays(self):
+        space = PresetDesignSpaceFactory.getDesignSpace('arraySpace.xml')
+        design = space.nextDesign()
+        design.validate()
+        design.setRuntimeValidation(False)
+        design.setValue('FixedIntArray.1.1.1', 4)
+        with self.assertRaises(InPUTException) as cm:
+            design.validate()
+        self.assertIn('FixedIntArray', str(cm.exception))
+
+    def testRuntimeValidationPerDesign(self):
+        space = self.getValidationSpace()
+        design = space.nextDesign()
+        design.setRuntimeValidation(False)
+        design.setValue('B', 20)
+        # The setting is kept by clones, but can be reverted to the space.
+        clone = design.clone()
+        clone.setValue('B', 21)
+        clone.setRuntimeValidation(None)
+        with self.assertRaises(InPUTException):
+            clone.setValue('B', 22)
+        space.setRuntimeValidation(False)
+        design.setRuntimeValidation(True)
+        with self.assertRaises(InPUTException):
+            design.setValue('B', 23)
+        self.assertEqual(20, design.getValue('B'))
+
+    def getDiffSpace(self):
+        param1 = getParameter('A', NPARAM, INTEGER + '[2][3]',
+            inclMin=0, inclMax=9)
+        param2 = getParameter('B', NPARAM, INTEGER)
+        param3 = getParameter('C', NPARAM, FLOAT)
+        return DesignSpace(ParamStore((param1, param2, param3)))
+
+    def testDiff(self):
+        space = self.getDiffSpace()
+        design = space.nextDesign()
+        other = design.clone()
+        self.assertTrue(design.diff(other).isEmpty())
+        other.setValue('A.2.3', (design.getValue('A.2.3') + 1) % 10)
+        other.setValue('B', design.getValue('B') + 1)
+        expected = Delta({
+            'A.2.3': other.getValue('A.2.3'), 'B': other.getValue('B'),
+        })
+        self.assertEqual(expected, design.diff(other))
+        # Arrays of different shapes are replaced.
+        other.setRuntimeValidation(False)
+        other.setValue('A', [[1, 2, 3]])
+        self.assertEqual([[1, 2, 3]], design.diff(other).changes['A'])
+
+    def testDiffWithMissingParameters(self):
+        design = Design({'A': 1, 'B': 2})
+        other = Design({'B': 2, 'C': 3})
+        delta = design.diff(other)
+        self.assertEqual(Delta({'C': 3}, ('A',)), delta)
+        design.applyDelta(delta)
+        self.assertEqual(other.params, design.params)
+        self.assertCountEqual(['B', 'C'], design.getSupportedParamIds())
+
+    def testApplyDelta(self):
+        space = self.getDiffSpace()
+        design = space.nextDesign()
+        other = space.nextDesign()
+        other.setValue('A.1.2', (design.getValue('A.1.2') + 1) % 10)
+        delta = design.diff(other)
+        clone = design.clone()
+        clone.applyDelta(delta)
+        self.assertEqual(other.params, clone.params)
+        # The original design is not affected.
+        self.assertTrue(design.clone().diff(design).isEmpty())
+        self.assertFalse(design.diff(clone).isEmpty())
+        with self.assertRaises(InPUTException):
+            space.nextDesign(readOnly=True).applyDelta(delta)
+
+    def testDesignArchive(self):
+        space = self.getDiffSpace()
+        designs = [space.nextDesign('Design 0')]
+        designs[0].setValue('A', [[0, 0, 0], [0, 0, 0]])
+        for i in range(1, 10):
+            design = designs[-1].clone('Design %d' % (i))
+            design.setValue('B', i)
+            design.setValue('A.1.%d' % (i % 3 + 1), i)
+            designs.append(design)
+        archive = DesignArchive(designs[0])
+        for design in designs[1:]:
+            archive.append(design)
+        self.assertEqual(10, len(archive))
+        for delta in archive.getDeltas():
+            self.assertEqual(2, len(delta))
+        for (expected, design) in zip(designs, archive):
+            self.assertEqual(expected.getId(), design.getId())
+            self.assertEqual(expected.params, design.params)
+        self.assertEqual(designs[4].params, archive.getDesign(4).params)
+        self.assertEqual(designs[-1].params, archive.getDesign(-1).params)
+
+    def testDesignArchiveViews(self):
+        designs = [
+            Design({'A': 1, 'B': [1, 2]}), Design({'A': 2, 'B': [1, 3]}),
+            Design({'B': [4, 3], 'C': 5}), Design({'A': 3, 'B': [4, 3]}),
+        ]
+        archive = DesignArchive(designs[0])
+        for design in designs[1:]:
+            archive.append(design)
+        replayed = list(archive)
+        for (expected, design) in zip(designs, replayed):
+            self.assertEqual(expected.params, design.params)
+            self.assertCountEqual(expected.getSupportedParamIds(),
+                design.getSupportedParamIds())
+        # Changing one view does not affect the others.
+        replayed[1].setValue('B.1', 9)
+        replayed[2].setValue('C', 6)
+        self.assertEqual([9, 3], replayed[1].getValue('B'))
+        for i in (0, 3):
+            self.assertEqual(designs[i].params, replayed[i].params)
+        self.assertEqual([1, 3], list(archive)[1].getValue('B'))
+
+    def testDesignArchiveShouldNotShareArrays(self):
+        space = self.getDiffSpace()
+        design = space.nextDesign()
+        base = copyArray(design.getValue('A'))
+        archive = DesignArchive(design)
+        design.setValue('A.1.1', (base[0][0] + 1) % 10)
+        self.assertEqual(base, archive.getBase().getValue('A'))
+        # Replaying a delta does not share its arrays either.
+        other = Design(dict(design.params), space)
+        other.setRuntimeValidation(False)
+        other.setValue('A', [[1, 2, 3]])
+        archive.append(other)
+        replayed = archive.getDesign(1)
+        replayed.setValue('A.1.1', 4)
+        self.assertEqual([[1, 2, 3]], archive.getDeltas()[0].changes['A'])
+        self.assertEqual([[1, 2, 3]], archive.getDesign(1).getValue('A'))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,9 +3,14 @@
 :license: MIT. See LICENSE for details.
 """
 import unittest
+import warnings
 from inputpy.param import getParameter
 from inputpy.paramstore import ParamStore
 from inputpy.designspace import DesignSpace
+from inputpy.design import Design, LazyValue
+from inputpy.exceptions import InPUTException
+from inputpy.mapping import Mapping
+from test.types.geo import DoublePoint
 from test.factories import PresetDesignSpaceFactory
 from inputpy.q import *
 
@@ -180,6 +185,559 @@ class TestDesignSpace(unittest.TestCase):
             self.assertIn(paramId, supportedIds)
         self.assertNotIn('IntArray1.1', supportedIds)
 
+    def testLazyDesignShouldDeferStructuredParameters(self):
+        space = PresetDesignSpaceFactory.getDesignSpace('choiceSpace.xml')
+        design = space.nextDesign(lazy=True)
+        self.assertIsInstance(design.params['Point'], LazyValue)
+        self.assertIsInstance(design.params['Shape'], LazyValue)
+        # Numeric values are sampled up front.
+        self.assertEqual(1, design.params['Point.X'])
+        self.assertEqual(2, design.params['Point.Y'])
+        # Strings are cheap and are not deferred.
+        self.assertIn(design.params['Name'], ('Alice', 'Bob'))
+        # Only the requested object is instantiated.
+        self.assertNotIsInstance(design.getValue('Point'), LazyValue)
+        self.assertNotIsInstance(design.params['Point'], LazyValue)
+        self.assertIsInstance(design.params['Shape'], LazyValue)
+
+    def testLazyDesignShouldInstantiateOnFirstAccess(self):
+        factory = PresetDesignSpaceFactory.getDesignSpace
+        space = factory('simpleTriangleSpace.xml')
+        design = space.nextDesign(lazy=True)
+        triangle = design.getValue('T1')
+        self.assertNotIsInstance(triangle, LazyValue)
+        self.assertIs(triangle, design.getValue('T1'))
+        # T1.P1 was resolved while constructing T1, so both share the same
+        # object, exactly like an eagerly initialized design.
+        self.assertIs(triangle.getP1(), design.getValue('T1.P1'))
+        self.assertIsInstance(design.params['T2'], LazyValue)
+
+    def testLazyDesignShouldMatchEagerDesign(self):
+        factory = PresetDesignSpaceFactory.getDesignSpace
+        space = factory('simpleTriangleSpace.xml')
+        expected = space.nextDesign()
+        for i in range(10):
+            design = space.nextDesign(lazy=True)
+            self.assertCountEqual(expected.params.keys(), design.params.keys())
+            for paramId in expected.params.keys():
+                value = design.getValue(paramId)
+                self.assertNotIsInstance(value, LazyValue)
+                self.assertEqual(type(expected.getValue(paramId)), type(value))
+
+    def testNextDesignWithGivenValues(self):
+        param1 = getParameter('A', NPARAM, INTEGER, inclMin=3, inclMax='B + C')
+        param2 = getParameter('B', NPARAM, INTEGER, inclMin='C', inclMax=10)
+        param3 = getParameter('C', NPARAM, INTEGER, inclMin=5, inclMax=7)
+        space = DesignSpace(ParamStore((param1, param2, param3)))
+        for design in space.nextDesigns(20, given={'C': 7}):
+            self.assertEqual(7, design.getValue('C'))
+            self.assertTrue(7 <= design.getValue('B') <= 10)
+        design = space.nextDesign('Design', given={'B': 10, 'C': 5})
+        self.assertEqual('Design', design.getId())
+        self.assertEqual(10, design.getValue('B'))
+        self.assertTrue(3 <= design.getValue('A') <= 15)
+        # The shared parameters are never modified.
+        self.assertFalse(param3.isFixed())
+
+    def testNextDesignWithInvalidGivenValueShouldFail(self):
+        param1 = getParameter('A', NPARAM, INTEGER, inclMin='B', inclMax=10)
+        param2 = getParameter('B', NPARAM, INTEGER, inclMin=5, inclMax=7)
+        param3 = getParameter('C', NPARAM, INTEGER, fixed=3)
+        space = DesignSpace(ParamStore((param1, param2, param3)))
+        with self.assertRaises(InPUTException):
+            space.nextDesign(given={'B': 8})
+        with self.assertRaises(InPUTException):
+            space.nextDesign(given={'A': 4})
+        with self.assertRaises(InPUTException):
+            space.nextDesign(given={'C': 4})
+        with self.assertRaises(InPUTException):
+            space.nextDesign(given={'D': 4})
+        self.assertEqual(3, space.nextDesign(given={'C': 3}).getValue('C'))
+
+    def testNextDesignWithGivenFixedArray(self):
+        space = PresetDesignSpaceFactory.getDesignSpace('arraySpace.xml')
+        fixed = space.nextDesign().getValue('FixedIntArray')
+        design = space.nextDesign(given={'FixedIntArray': fixed})
+        self.assertEqual(fixed, design.getValue('FixedIntArray'))
+        fixed[0][0][0] = 4
+        with self.assertRaises(InPUTException):
+            space.nextDesign(given={'FixedIntArray': fixed})
+
+    def testNextDesignWithGivenChoices(self):
+        space = PresetDesignSpaceFactory.getDesignSpace('choiceSpace.xml')
+        given = {'Name': 'Bob', 'Point': 'Double', 'Point.X': 1}
+        designs = space.nextDesigns(10, lazy=True, given=given)
+        self.assertEqual(10, len(designs))
+        for design in designs:
+            self.assertEqual('Bob', design.getValue('Name'))
+            self.assertIs(DoublePoint, type(design.getValue('Point')))
+
+    def testNextDesignWithGivenNestedValueShouldSelectChoice(self):
+        space = self.getAlgorithmSpace()
+        for design in space.nextDesigns(10, given={'Alg.GA.Pop': 50}):
+            self.assertEqual('GA', design.getValue('Alg'))
+            self.assertEqual(50, design.getValue('Alg.GA.Pop'))
+        given = {'Alg': 'SA', 'Alg.GA.Pop': 50}
+        with self.assertRaises(InPUTException):
+            space.nextDesign(given=given)
+
+    def testNextDesignsShouldNotShareGivenArrays(self):
+        param = getParameter('A', NPARAM, INTEGER + '[3]')
+        space = DesignSpace(ParamStore(param))
+        array = [1, 2, 3]
+        designs = space.nextDesigns(2, given={'A': array})
+        designs[0].setValue('A.1', 5)
+        self.assertEqual([1, 2, 3], designs[1].getValue('A'))
+        self.assertEqual([1, 2, 3], array)
+
+    def testMutateShouldStayWithinDependentRanges(self):
+        param1 = getParameter('A', NPARAM, INTEGER, inclMin=3, inclMax='B + C')
+        param2 = getParameter('B', NPARAM, INTEGER, inclMin='C', inclMax=10)
+        param3 = getParameter('C', NPARAM, INTEGER, inclMin=5, inclMax=7)
+        param4 = getParameter('D', NPARAM, FLOAT, exclMin=0, exclMax='C')
+        param5 = getParameter('E', NPARAM, INTEGER, fixed=3)
+        param6 = getParameter('F', NPARAM, INTEGER + '[2][3]',
+            inclMin=0, inclMax='C')
+        space = DesignSpace(ParamStore(
+            (param1, param2, param3, param4, param5, param6)))
+        design = space.nextDesign()
+        for i in range(50):
+            design = space.mutate(design, rate=0.5, scale=0.5, seed=i)
+            (a, b, c, d) = [design.getValue(p) for p in 'ABCD']
+            self.assertTrue(5 <= c <= 7)
+            self.assertTrue(c <= b <= 10)
+            self.assertTrue(3 <= a <= b + c)
+            self.assertTrue(0 < d < c)
+            self.assertEqual(3, design.getValue('E'))
+            for row in design.getValue('F'):
+                self.assertTrue(all(0 <= x <= c for x in row))
+
+    def testMutateShouldBeReproducible(self):
+        param1 = getParameter('A', NPARAM, FLOAT, inclMin=0, inclMax=1)
+        param2 = getParameter('B', NPARAM, BOOLEAN)
+        space = DesignSpace(ParamStore((param1, param2)))
+        design = space.nextDesign()
+        mutated1 = space.mutateDesigns([design, design], rate=1, seed=3)
+        mutated2 = space.mutateDesigns([design, design], rate=1, seed=3)
+        self.assertEqual(mutated1[0].params, mutated2[0].params)
+        self.assertEqual(mutated1[1].params, mutated2[1].params)
+        self.assertNotEqual(design.getValue('A'), mutated1[0].getValue('A'))
+        self.assertNotEqual(design.getValue('B'), mutated1[0].getValue('B'))
+        # A zero rate never changes anything.
+        self.assertEqual(design.params, space.mutate(design, rate=0).params)
+
+    def testMutateShouldSwitchChoices(self):
+        choices = [
+            getParameter(c, SCHOICE, STRING, parentId='Name')
+            for c in ('Alice', 'Bob')
+        ]
+        param = getParameter('Name', SPARAM, STRING, nested=choices)
+        space = DesignSpace(ParamStore(param))
+        design = space.nextDesign(given={'Name': 'Alice'})
+        design = space.mutate(design, rate=1)
+        self.assertEqual('Bob', design.getValue('Name'))
+        design = space.mutate(design, rate=1)
+        self.assertEqual('Alice', design.getValue('Name'))
+
+    def testUniqueDesignsShouldCompareStructuredArraysByValue(self):
+        mapping = Mapping('P', 'test.types.simple.Pair', constructor='X Y')
+        nested = [
+            getParameter('X', NPARAM, INTEGER, parentId='P',
+                inclMin=0, inclMax=1),
+            getParameter('Y', NPARAM, INTEGER, parentId='P', fixed=0),
+        ]
+        param = getParameter('P', SPARAM, '[1]', mapping=mapping,
+            nested=nested)
+        space = DesignSpace(ParamStore(param))
+        designs = space.nextDesigns(2, unique=True)
+        xs = [d.getValue('P.1').x for d in designs]
+        self.assertCountEqual([0, 1], xs)
+        # Both designs have been sampled, although with other objects.
+        with self.assertRaises(InPUTException):
+            space.nextDesign(unique=True)
+
+    def testMutateShouldRepairStructuredParameters(self):
+        mapping = Mapping('P', 'test.types.geo.Point', constructor='X Y')
+        nested = [
+            getParameter(p, NPARAM, INTEGER, parentId='P',
+                inclMin=0, inclMax=100)
+            for p in ('X', 'Y')
+        ]
+        param = getParameter('P', SPARAM, mapping=mapping, nested=nested)
+        space = DesignSpace(ParamStore(param))
+        design = space.nextDesign()
+        for i in range(10):
+            mutated = space.mutate(design, rate=1)
+            point = mutated.getValue('P')
+            self.assertIsNot(design.getValue('P'), point)
+            self.assertEqual(mutated.getValue('P.X'), point.getX())
+            self.assertEqual(mutated.getValue('P.Y'), point.getY())
+        # Unaffected structured values are shared.
+        mutated = space.mutate(design, rate=0)
+        self.assertIs(design.getValue('P'), mutated.getValue('P'))
+
+    def getAlgorithmSpace(self):
+        ga = getParameter('GA', SCHOICE, STRING, parentId='Alg', nested=[
+            getParameter('Pop', NPARAM, INTEGER, parentId='Alg.GA',
+                inclMin=10, inclMax=100),
+        ])
+        sa = getParameter('SA', SCHOICE, STRING, parentId='Alg', nested=[
+            getParameter('Temp', NPARAM, FLOAT, parentId='Alg.SA',
+                inclMin=0, inclMax=1),
+        ])
+        alg = getParameter('Alg', SPARAM, STRING, nested=[ga, sa])
+        x = getParameter('X', NPARAM, INTEGER, inclMin=0, inclMax=10)
+        y = getParameter('Y', NPARAM, INTEGER, inclMin='X', inclMax=10)
+        return DesignSpace(ParamStore((alg, x, y)))
+
+    def getFiniteSpace(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A + 1', inclMax=4)
+        c = getParameter('C', NPARAM, BOOLEAN)
+        return DesignSpace(ParamStore((a, b, c)))
+
+    def testEnumerate(self):
+        space = self.getFiniteSpace()
+        designs = list(space.enumerate())
+        values = [tuple(d.getValue(k) for k in 'ABC') for d in designs]
+        self.assertEqual(
+            [(1, 2, False), (1, 2, True), (1, 3, False), (1, 3, True)],
+            values[:4])
+        self.assertEqual((3, 4, True), values[-1])
+        self.assertEqual(12, len(set(values)))
+        self.assertEqual(12, space.cardinality())
+        for (i, expected) in enumerate(designs):
+            self.assertEqual(expected.params, space.designAt(i).params)
+        self.assertEqual(designs[-1].params, space.designAt(-1).params)
+        with self.assertRaises(IndexError):
+            space.designAt(12)
+
+    def testEnumerateChoices(self):
+        ga = getParameter('GA', SCHOICE, STRING, parentId='Alg', nested=[
+            getParameter('Pop', NPARAM, INTEGER, parentId='Alg.GA',
+                inclMin=1, inclMax=3),
+        ])
+        sa = getParameter('SA', SCHOICE, STRING, parentId='Alg')
+        alg = getParameter('Alg', SPARAM, STRING, nested=[ga, sa])
+        x = getParameter('X', NPARAM, BOOLEAN)
+        space = DesignSpace(ParamStore((alg, x)))
+        self.assertEqual(8, space.cardinality())
+        designs = list(space.enumerate())
+        self.assertEqual(8, len(designs))
+        algs = [d.getValue('Alg') for d in designs]
+        self.assertEqual(6, algs.count('GA'))
+        self.assertEqual(2, algs.count('SA'))
+        for design in designs:
+            if design.getValue('Alg') == 'SA':
+                self.assertNotIn('Alg.GA.Pop', design.params)
+        for i in range(8):
+            self.assertEqual(designs[i].params, space.designAt(i).params)
+
+    def testEnumerateInfiniteSpaceShouldFail(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        b = getParameter('B', NPARAM, FLOAT, inclMin=0, inclMax=1)
+        space = DesignSpace(ParamStore((a, b)))
+        with self.assertRaises(InPUTException):
+            space.cardinality()
+        with self.assertRaises(InPUTException):
+            next(space.enumerate())
+
+    def testCardinalityShouldBeCachedUntilSpaceChanges(self):
+        space = self.getFiniteSpace()
+        self.assertEqual(12, space.cardinality())
+        space.setFixed('A', 2)
+        self.assertEqual(4, space.cardinality())
+
+    def testVolume(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        x = getParameter('X', NPARAM, FLOAT, inclMin=(0, 1, 5),
+            inclMax=(2, 3, 6))
+        y = getParameter('Y', NPARAM, FLOAT, inclMin='X', inclMax='X + A')
+        z = getParameter('Z', NPARAM, FLOAT + '[2][3]', inclMin=0,
+            inclMax=2)
+        w = getParameter('W', NPARAM, FLOAT, fixed=1.5)
+        space = DesignSpace(ParamStore((a, x, y, z, w)))
+        # X has width 4, Y is bounded by [0, 9] and Z has 6 elements.
+        self.assertEqual(4 * 9 * 2 ** 6, space.volume())
+        self.assertEqual(0, self.getFiniteSpace().volume())
+
+    def testVolumeOfChoices(self):
+        ga = getParameter('GA', SCHOICE, STRING, parentId='Alg', nested=[
+            getParameter('Rate', NPARAM, FLOAT, parentId='Alg.GA',
+                inclMin=0, inclMax=0.5),
+        ])
+        sa = getParameter('SA', SCHOICE, STRING, parentId='Alg', nested=[
+            getParameter('Temp', NPARAM, FLOAT, parentId='Alg.SA',
+                inclMin=0, inclMax=2),
+        ])
+        ts = getParameter('TS', SCHOICE, STRING, parentId='Alg')
+        alg = getParameter('Alg', SPARAM, STRING, nested=[ga, sa, ts])
+        space = DesignSpace(ParamStore(alg))
+        self.assertEqual(2.5, space.volume())
+
+    def testUniqueDesignsShouldFindTheLastDesigns(self):
+        space = self.getFiniteSpace()
+        space.UNIQUE_RETRIES = 1
+        designs = space.nextDesigns(12, unique=True)
+        values = {tuple(d.getValue(k) for k in 'ABC') for d in designs}
+        self.assertEqual(12, len(values))
+        with self.assertRaises(InPUTException) as cm:
+            space.nextDesign(unique=True)
+        self.assertIn('exhausted', str(cm.exception))
+
+    def getSmallSpace(self):
+        param1 = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        param2 = getParameter('B', NPARAM, BOOLEAN)
+        return DesignSpace(ParamStore((param1, param2)))
+
+    def testUniqueDesignsUntilExhausted(self):
+        space = self.getSmallSpace()
+        designs = space.nextDesigns(6, unique=True)
+        values = {(d.getValue('A'), d.getValue('B')) for d in designs}
+        self.assertEqual(6, len(values))
+        with self.assertRaises(InPUTException):
+            space.nextDesign(unique=True)
+        # Designs sampled normally are not affected.
+        space.nextDesign()
+        space.clearSeen()
+        space.nextDesign(unique=True)
+
+    def testUniqueDesignsWithGivenValues(self):
+        space = self.getSmallSpace()
+        space.markSeen(space.nextDesign(given={'A': 2, 'B': True}))
+        design = space.nextDesign(given={'A': 2}, unique=True)
+        self.assertFalse(design.getValue('B'))
+        with self.assertRaises(InPUTException):
+            space.nextDesign(given={'A': 2}, unique=True)
+
+    def testUniqueDesignsWithBloomFilter(self):
+        space = self.getSmallSpace()
+        space.useBloomFilter(100)
+        designs = space.nextDesigns(6, unique=True)
+        values = {(d.getValue('A'), d.getValue('B')) for d in designs}
+        self.assertEqual(6, len(values))
+        with self.assertRaises(InPUTException):
+            space.nextDesign(unique=True)
+
+    def testUniqueLazyDesignsShouldNotBeResolved(self):
+        space = PresetDesignSpaceFactory.getDesignSpace('choiceSpace.xml')
+        for design in space.nextDesigns(5, lazy=True, unique=True):
+            self.assertFalse(design.params['Shape'].isResolved())
+
+    def getResamplingSpace(self):
+        # C has an empty range whenever B is 3, and B is always equal to A.
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A', inclMax='A')
+        c = getParameter('C', NPARAM, INTEGER, inclMin=1, inclMax='3 - B')
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return DesignSpace(ParamStore((a, b, c)))
+
+    def testEmptyRangeShouldBeRejectedWithoutResampling(self):
+        space = self.getResamplingSpace()
+        with self.assertRaises(ValueError):
+            space.nextDesign(given={'A': 3})
+        self.assertEqual({'C': 1}, space.getRejections())
+        space.clearRejections()
+        self.assertEqual({}, space.getRejections())
+
+    def testRetryShouldOnlyResampleDirectDependencies(self):
+        space = self.getResamplingSpace()
+        space.setResampling(DesignSpace.RETRY, 5)
+        self.assertEqual((DesignSpace.RETRY, 5), space.getResampling())
+        with self.assertRaises(ValueError):
+            space.nextDesign(given={'A': 3})
+        self.assertEqual({'C': 6}, space.getRejections())
+
+    def testBacktrackShouldResampleAlongDependencyChain(self):
+        space = self.getResamplingSpace()
+        space.setResampling(DesignSpace.BACKTRACK, 20)
+        for i in range(20):
+            design = space.nextDesign()
+            self.assertEqual(design.getValue('A'), design.getValue('B'))
+            self.assertLess(design.getValue('B'), 3)
+            self.assertLessEqual(design.getValue('C'), 3 - design.getValue('B'))
+        # A given value is never resampled, so the chain ends there.
+        with self.assertRaises(ValueError):
+            space.nextDesign(given={'A': 3})
+
+    def testOtherValueErrorsShouldNotBeResampled(self):
+        # Math.log(0) fails, but that does not make the range of B empty.
+        a = getParameter('A', NPARAM, INTEGER, fixed=0)
+        b = getParameter('B', NPARAM, FLOAT, inclMin=0, inclMax='Math.log(A)')
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            space = DesignSpace(ParamStore((a, b)))
+        space.setResampling(DesignSpace.BACKTRACK, 5)
+        with self.assertRaisesRegex(ValueError, 'math domain error'):
+            space.nextDesign()
+        self.assertEqual({}, space.getRejections())
+
+    def testInvalidResamplingStrategyShouldFail(self):
+        space = self.getResamplingSpace()
+        with self.assertRaises(ValueError):
+            space.setResampling('restart')
+        with self.assertRaises(ValueError):
+            space.setResampling(DesignSpace.RETRY, 0)
+
+    def getBatchValidationSpace(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=3, inclMax='B')
+        b = getParameter('B', NPARAM, INTEGER, inclMin=5, inclMax=10)
+        c = getParameter('C', NPARAM, INTEGER, fixed=3)
+        return DesignSpace(ParamStore((a, b, c)))
+
+    def testValidateBatch(self):
+        space = self.getBatchValidationSpace()
+        designs = [
+            space.nextDesign(),
+            {'A': 9, 'B': 8, 'C': 3},
+            {'A': 2, 'B': 11, 'C': 4},
+            {'A': 7, 'D': 1},
+        ]
+        mask = space.validate(designs)
+        self.assertEqual([False, True, True, True], mask['A'])
+        self.assertEqual([False, False, True, False], mask['B'])
+        self.assertEqual([False, False, True, False], mask['C'])
+        self.assertEqual([False, False, False, True], mask['D'])
+
+    def testValidateColumns(self):
+        space = self.getBatchValidationSpace()
+        mask = space.validate({'A': [3, 6, 11], 'B': [5, 5, 10]})
+        self.assertEqual([False, True, True], mask['A'])
+        self.assertEqual([False, False, False], mask['B'])
+        self.assertEqual({}, space.validate([]))
+
+    def testValidateSampledDesigns(self):
+        factory = PresetDesignSpaceFactory.getDesignSpace
+        configs = (
+            'arraySpace.xml', 'simpleIntegerSpace.xml',
+            'simpleStructuredSpace.xml', 'advancedTriangleSpace.xml',
+            'advancedIntegerParameterSpace.xml',
+        )
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for config in configs:
+                space = factory(config)
+                mask = space.validate(space.nextDesigns(20))
+                for (paramId, violations) in mask.items():
+                    self.assertFalse(any(violations), paramId)
+
+    def testValidateArrays(self):
+        a = getParameter('A', NPARAM, INTEGER + '[3]', inclMin=0, inclMax=9)
+        b = getParameter('B', NPARAM, INTEGER + '[2][]', inclMin=0,
+            inclMax='C')
+        c = getParameter('C', NPARAM, INTEGER, inclMin=1, inclMax=5)
+        space = DesignSpace(ParamStore((a, b, c)))
+        designs = [
+            {'A': [1, 2, 3], 'B': [[1], [2, 3]], 'C': 3},
+            {'A': [100, 200], 'B': [[1], [4]], 'C': 3},
+            {'A': [1, 2, 30], 'B': [[1, 2, 3]], 'C': 5},
+        ]
+        mask = space.validate(designs)
+        self.assertEqual([False, True, True], mask['A'])
+        self.assertEqual([False, True, True], mask['B'])
+        design = space.nextDesign()
+        with self.assertRaises(InPUTException):
+            design.setValue('A', [100, 200])
+        with self.assertRaises(InPUTException):
+            design.setValue('A.2', 10)
+        design.setValue('A.2', 9)
+        design.setRuntimeValidation(False)
+        design.setValue('B.1', [6])
+        with self.assertRaises(InPUTException) as cm:
+            design.validate()
+        self.assertIn('B', str(cm.exception))
+
+    def testValidateFractionalFloatLimits(self):
+        a = getParameter('A', NPARAM, FLOAT, inclMin=3.5, inclMax=3.5)
+        b = getParameter('B', NPARAM, FLOAT + '[2]', inclMin=0.5,
+            inclMax='A + 0.25')
+        space = DesignSpace(ParamStore((a, b)))
+        mask = space.validate([{'A': 3.5, 'B': [0.5, 3.75]},
+            {'A': 3, 'B': [0.25, 3.8]}])
+        self.assertEqual([False, True], mask['A'])
+        self.assertEqual([False, True], mask['B'])
+
+    def testValidateGroupsDependentValues(self):
+        space = self.getBatchValidationSpace()
+        values = {'A': [3, 6, 10, 11, 5, 8], 'B': [5, 5, 10, 10, 5, 10]}
+        mask = space.validate(values)
+        self.assertEqual([False, True, False, True, False, False], mask['A'])
+
+    def testEqualityUsesFingerprint(self):
+        factory = PresetDesignSpaceFactory.getDesignSpace
+        space1 = factory('choiceSpace.xml')
+        space2 = factory('choiceSpace.xml')
+        self.assertIsNot(space1, space2)
+        self.assertEqual(space1.getFingerprint(), space2.getFingerprint())
+        self.assertEqual(space1, space2)
+        self.assertEqual(hash(space1), hash(space2))
+        space3 = factory('arraySpace.xml')
+        self.assertNotEqual(space1.getFingerprint(), space3.getFingerprint())
+
+    def testCrossoverShouldKeepChoicesTogether(self):
+        space = self.getAlgorithmSpace()
+        design1 = space.nextDesign(given={'Alg': 'GA', 'X': 0, 'Y': 1})
+        design2 = space.nextDesign(given={'Alg': 'SA', 'X': 9, 'Y': 10})
+        # Maps each choice to (parent, nested parameter, other parameter).
+        expected = {
+            'GA': (design1, 'Alg.GA.Pop', 'Alg.SA.Temp'),
+            'SA': (design2, 'Alg.SA.Temp', 'Alg.GA.Pop'),
+        }
+        for method in DesignSpace.CROSSOVER_METHODS:
+            for i in range(10):
+                for child in space.crossover(design1, design2, method, seed=i):
+                    (parent, kept, lost) = expected[child.getValue('Alg')]
+                    self.assertEqual(parent.getValue(kept),
+                        child.getValue(kept))
+                    self.assertNotIn(lost, child.params)
+                    # Dependent ranges are repaired.
+                    x = child.getValue('X')
+                    self.assertIn(x, (0, 9))
+                    self.assertTrue(x <= child.getValue('Y') <= 10)
+
+    def testCrossoverShouldSplitValuesBetweenChildren(self):
+        space = self.getAlgorithmSpace()
+        design1 = space.nextDesign(given={'Alg': 'GA', 'X': 0, 'Y': 10})
+        design2 = space.nextDesign(given={'Alg': 'SA', 'X': 1, 'Y': 10})
+        pairs = space.crossoverDesigns([design1] * 5, [design2] * 5, seed=1)
+        self.assertEqual(5, len(pairs))
+        for (child1, child2) in pairs:
+            for p in ('Alg', 'X', 'Y'):
+                self.assertCountEqual(
+                    (design1.getValue(p), design2.getValue(p)),
+                    (child1.getValue(p), child2.getValue(p)))
+        (child1, child2) = space.crossover(design1, design2, rate=0)
+        self.assertEqual(design1.params, child1.params)
+        self.assertEqual(design2.params, child2.params)
+        (child1, child2) = space.crossover(design1, design2, rate=1)
+        self.assertEqual(design2.params, child1.params)
+        self.assertEqual(design1.params, child2.params)
+
+    def testCrossoverShouldKeepValidInheritedArrays(self):
+        param1 = getParameter('C', NPARAM, INTEGER, inclMin=0, inclMax=100)
+        param2 = getParameter('F', NPARAM, INTEGER + '[4]',
+            inclMin=0, inclMax='C')
+        space = DesignSpace(ParamStore((param1, param2)))
+        arrays = ([1, 2, 3, 4], [90, 91, 92, 93])
+        design1 = Design({'C': 100, 'F': arrays[0]}, space)
+        design2 = Design({'C': 99, 'F': arrays[1]}, space)
+        for i in range(10):
+            for child in space.crossover(design1, design2, seed=i):
+                self.assertIn(child.getValue('F'), arrays)
+        # Inherited arrays are still repaired when necessary.
+        design2 = Design({'C': 2, 'F': [0, 1, 2, 2]}, space)
+        for i in range(10):
+            for child in space.crossover(design1, design2, seed=i):
+                c = child.getValue('C')
+                self.assertTrue(all(x <= c for x in child.getValue('F')))
+
+    def testCrossoverWithUnknownMethodShouldFail(self):
+        space = self.getAlgorithmSpace()
+        design = space.nextDesign()
+        with self.assertRaises(ValueError):
+            space.crossover(design, design, 'onepoint')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,8 +2,14 @@
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
-from inputpy.factories import XMLFactory
+import inputpy.factories as factories
+from inputpy.factories import XMLFactory, SpaceCache, CompiledSpaceCache
+from inputpy.exceptions import InPUTException
 from test.factories import PresetCodeMappingFactory, PresetDesignSpaceFactory
 from test.factories import PresetDesignFactory
 #from test.factories import *
@@ -82,5 +88,177 @@ class TestFactories(unittest.TestCase):
                 self.assertEqual(v, first[k], msg=msg)
 
 
+    def testDesignArraysFollowTheDocument(self):
+        design = XMLFactory.getDesign('testDesign.xml')
+        array = design.getValue('SomeLargePrimitiveArray')
+        self.assertEqual(10, len(array))
+        self.assertEqual(-5756421694435518464, array[0][0][0][0])
+        self.assertEqual(6866433717130389503, array[0][0][1][0])
+        choices = design.getValue('SomeComplexStructural')
+        self.assertEqual(3, len(choices))
+        for c in choices:
+            self.assertEqual('SingleComplexChoice', type(c).__name__)
+        nested = design.getValue('SomeStructuralArrayOfUnspecifiedSize')
+        self.assertEqual('SomeSecondChoice', type(nested[0][0][0]).__name__)
+
+    def testConvertArraysShouldOrderElementsByIndex(self):
+        space = XMLFactory.getDesignSpace('arraySpace.xml')
+        values = {
+            'IntArray1.3': 3, 'IntArray1.1': 1, 'IntArray1.2': 2,
+            'IntArray2.2.1.2': 4, 'IntArray2.1.1.1': 1,
+            'IntArray2.2.1.1': 3, 'IntArray2.1.1.2': 2, 'X': 5,
+        }
+        values = XMLFactory.convertArrays(values, space)
+        self.assertEqual({
+            'IntArray1': [1, 2, 3],
+            'IntArray2': [[[1, 2]], [[3, 4]], None],
+            'X': 5,
+        }, values)
+
+    def testImportMissingDesignShouldFail(self):
+        with self.assertRaises(InPUTException):
+            XMLFactory.getDesign('noSuchDesign.xml')
+
+
+class TestSpaceCache(unittest.TestCase):
+    SPACES = ('simpleIntegerSpace.xml', 'arraySpace.xml')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for f in self.SPACES:
+            shutil.copy(f, self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def getPath(self, fileName):
+        return os.path.join(self.dir, fileName)
+
+    def testDesignsShouldShareSpaces(self):
+        factory = SpaceCache().get
+        first = XMLFactory.getDesign('simpleIntegerDesign.xml', factory)
+        second = XMLFactory.getDesign('simpleIntegerDesign.xml', factory)
+        self.assertIs(first.space, second.space)
+        # Caching is not active by default.
+        first = XMLFactory.getDesign('simpleIntegerDesign.xml')
+        second = XMLFactory.getDesign('simpleIntegerDesign.xml')
+        self.assertIsNot(first.space, second.space)
+
+    def testChangedSpaceShouldBeImportedAgain(self):
+        cache = SpaceCache()
+        path = self.getPath('arraySpace.xml')
+        space = cache.get(path)
+        self.assertIs(space, cache.get(path))
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIsNot(space, cache.get(path))
+        self.assertEqual(1, len(cache))
+
+    def testLeastRecentlyUsedSpaceShouldBeEvicted(self):
+        (a, b) = [self.getPath(f) for f in self.SPACES]
+        cache = SpaceCache(maxEntries=1)
+        cache.get(a)
+        cache.get(b)
+        self.assertNotIn(a, cache)
+        self.assertIn(b, cache)
+        cache = SpaceCache(maxBytes=1)
+        cache.get(a)
+        cache.get(b)
+        self.assertEqual(1, len(cache))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+UNPICKLED = []
+
+def unpickled():
+    UNPICKLED.append(True)
+
+class Trap:
+    """
+    An object that records when it is unpickled.
+    """
+    def __reduce__(self):
+        return (unpickled, ())
+
+
+class TestCompiledSpaceCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'arraySpace.xml')
+        shutil.copy('arraySpace.xml', self.path)
+        self.imported = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def importSpace(self, fileName):
+        self.imported += 1
+        return XMLFactory.getDesignSpace(fileName)
+
+    def testCompiledSpaceShouldBeLoaded(self):
+        cache = CompiledSpaceCache(factory=self.importSpace)
+        space = cache.get(self.path)
+        self.assertTrue(os.path.exists(cache.getCacheFile(self.path)))
+        loaded = CompiledSpaceCache(factory=self.importSpace).get(self.path)
+        self.assertEqual(1, self.imported)
+        self.assertIsNot(space, loaded)
+        self.assertEqual(self.path, loaded.getFileName())
+        self.assertEqual(space.getSupportedParamIds(),
+                loaded.getSupportedParamIds())
+        design = loaded.nextDesign()
+        for paramId in loaded.params.getIdTrie().children():
+            self.assertIsNotNone(design.getValue(paramId))
+
+    def testChangedSpaceShouldBeCompiledAgain(self):
+        cache = CompiledSpaceCache(factory=self.importSpace)
+        cache.get(self.path)
+        with open(self.path, 'a') as f:
+            f.write('<!-- Changed. -->')
+        cache.get(self.path)
+        cache.get(self.path)
+        self.assertEqual(2, self.imported)
+
+    def testBrokenCompiledSpaceShouldBeIgnored(self):
+        cacheDir = os.path.join(self.dir, 'cache')
+        cache = CompiledSpaceCache(cacheDir, factory=self.importSpace)
+        cacheFile = cache.getCacheFile(self.path)
+        self.assertEqual(cacheDir, os.path.dirname(cacheFile))
+        os.makedirs(cacheDir)
+        with open(cacheFile, 'wb') as f:
+            f.write(b'Not a compiled space.')
+        cache.get(self.path)
+        cache.get(self.path)
+        self.assertEqual(1, self.imported)
+
+    def testStaleCompiledSpaceShouldNotBeUnpickled(self):
+        cache = CompiledSpaceCache(factory=self.importSpace)
+        cacheFile = cache.getCacheFile(self.path)
+        os.makedirs(os.path.dirname(cacheFile))
+        headers = (b'', b'%s 1 %s\n' % (CompiledSpaceCache.MAGIC,
+            cache.getKey(self.path).encode()))
+        for header in headers:
+            with open(cacheFile, 'wb') as f:
+                f.write(header + pickle.dumps(Trap()))
+            CompiledSpaceCache(factory=self.importSpace).get(self.path)
+        self.assertEqual([], UNPICKLED)
+        self.assertEqual(2, self.imported)
+
+    def testKeyShouldDependOnLibrary(self):
+        cache = CompiledSpaceCache()
+        key = cache.getKey(self.path)
+        libraryHash = factories.getLibraryHash()
+        factories.LIBRARY_HASH = 'Some other version.'
+        try:
+            self.assertNotEqual(key, cache.getKey(self.path))
+        finally:
+            factories.LIBRARY_HASH = libraryHash
+        self.assertEqual(key, cache.getKey(self.path))
+
+    def testMissingSpaceShouldFail(self):
+        with self.assertRaises(InPUTException):
+            CompiledSpaceCache().get(os.path.join(self.dir, 'noSuchSpace.xml'))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -144,6 +144,34 @@ class TestGenerators(unittest.TestCase):
         param = paramFactory(args, cm)
         self.assertEqual('some string', generator.nextValue(param))
 
+    def testGetDomain(self):
+        param = getParameter('A', NPARAM, INTEGER,
+            inclMin=(1, 3, 8), inclMax=(4, 5, 9))
+        self.assertEqual([1, 2, 3, 4, 5, 8, 9],
+            list(generator.getDomain(param)))
+        param = getParameter('A', NPARAM, INTEGER, exclMin='B', exclMax=5)
+        domain = generator.getDomain(param, {'B': 2})
+        self.assertEqual(2, len(domain))
+        self.assertEqual(4, domain[1])
+        param = getParameter('A', NPARAM, BOOLEAN)
+        self.assertEqual([False, True], list(generator.getDomain(param)))
+        param = getParameter('A', NPARAM, FLOAT, inclMin=1.5, inclMax=1.5)
+        self.assertEqual([1.5], list(generator.getDomain(param)))
+        param = getParameter('A', NPARAM, FLOAT, fixed=2.5)
+        self.assertEqual([2.5], list(generator.getDomain(param)))
+        param = getParameter('A', NPARAM, FLOAT, inclMin=1, inclMax=2)
+        with self.assertRaises(ValueError):
+            generator.getDomain(param)
+
+    def testGetDomainForArray(self):
+        param = getParameter('A', NPARAM, INTEGER + '[2][3]',
+            inclMin=0, inclMax=1)
+        domain = generator.getDomain(param)
+        self.assertEqual(2 ** 6, len(domain))
+        self.assertEqual([[0, 0, 0], [0, 0, 0]], domain[0])
+        self.assertEqual([[0, 0, 0], [0, 1, 1]], domain[3])
+        self.assertEqual(list(domain), [domain[i] for i in range(64)])
+
     def checkDimensions(self, array, sizes):
         tools.assertMatchingArrayDimensions(sizes, array)
 
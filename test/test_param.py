@@ -283,6 +283,20 @@ class TestParam(unittest.TestCase):
         self.assertFalse(param.isValid(0))
         self.assertFalse(param.isValid(4))
 
+    def testIsValidWithMultipleRanges(self):
+        param = getParameter('X', NPARAM, INTEGER, exclMin='10, 1, 4, A',
+            exclMax='12, 3, 20, A + 3')
+        values = list(range(-1, 22))
+        dep = {'A': -1}
+        expected = [
+            any(i.containsWith(v, dep) for i in param.getIntervals())
+            for v in values
+        ]
+        self.assertEqual(expected, [param.isValid(v, dep) for v in values])
+        self.assertEqual(expected, param.isValidMany(values, dep))
+        self.assertTrue(param.isValid(0, dep))
+        self.assertFalse(param.isValid(4, dep))
+
     def compareParameters(self, reference, param):
         self.assertEqual(reference.getId(), param.getId())
         self.assertEqual(reference.getType(), param.getType())
@@ -3,9 +3,11 @@
 :license: MIT. See LICENSE for details.
 """
 import unittest
+import warnings
 from inputpy.param import getParameter
 from inputpy.paramstore import ParamStore
 from inputpy.mapping import DUMMY_MAPPING
+from inputpy.util import Bounds
 from inputpy.q import *
 
 class TestParamStore(unittest.TestCase):
@@ -113,6 +115,156 @@ class TestParamStore(unittest.TestCase):
         initOrder = ps.getInitializationOrder()
         self.assertCountEqual(('A.B.X', 'A.B.Y'), initOrder[0])
 
+    def testIdTrie(self):
+        m = DUMMY_MAPPING
+        x = getParameter('X', NPARAM, INTEGER, parentId='A.B')
+        y = getParameter('Y', NPARAM, INTEGER, parentId='A.B')
+        b = getParameter('B', SPARAM, nested=(x, y), parentId='A', mapping=m)
+        a = getParameter('A', SPARAM, nested=(b,), mapping=m)
+        c = getParameter('C', NPARAM, INTEGER)
+        ps = ParamStore((a, c))
+        trie = ps.getIdTrie()
+        self.assertEqual(['A', 'C'], trie.children())
+        self.assertCountEqual(('A.B.X', 'A.B.Y'), trie.children('A.B'))
+        self.assertCountEqual(('A.B', 'A.B.X', 'A.B.Y'), trie.descendants('A'))
+        tops = [p.getId() for p in ps.getTopLevelParameters()]
+        self.assertEqual(['A', 'C'], tops)
+        # A parameter whose parent is missing is not at the top level.
+        ps = ParamStore((x, c))
+        ps.finalize()
+        tops = [p.getId() for p in ps.getTopLevelParameters()]
+        self.assertEqual(['C'], tops)
+
+    def testFingerprint(self):
+        def makeStore(maxValue):
+            a = getParameter('A', NPARAM, INTEGER, inclMax=maxValue)
+            b = getParameter('B', NPARAM, INTEGER, inclMin='A')
+            return ParamStore((a, b))
+        ps1 = makeStore(10)
+        ps2 = makeStore(10)
+        ps3 = makeStore(11)
+        self.assertEqual(ps1.getFingerprint(), ps2.getFingerprint())
+        self.assertNotEqual(ps1.getFingerprint(), ps3.getFingerprint())
+        # Fixing a parameter changes the content of the store.
+        ps2.setFixed('A', 3)
+        self.assertNotEqual(ps1.getFingerprint(), ps2.getFingerprint())
+        ps2.setFixed('A', None)
+        self.assertEqual(ps1.getFingerprint(), ps2.getFingerprint())
+
+    def testGetBounds(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=(1, 5), inclMax=(3, 9))
+        b = getParameter('B', NPARAM, FLOAT, inclMin='A / 2', inclMax='A * 2')
+        c = getParameter('C', NPARAM, INTEGER + '[2]', inclMax=0)
+        d = getParameter('D', SPARAM, STRING)
+        ps = ParamStore((a, b, c, d))
+        self.assertEqual([Bounds(1, 3), Bounds(5, 9)], ps.getBounds('A'))
+        self.assertEqual([Bounds(0.5, 18)], ps.getBounds('B'))
+        self.assertEqual([Bounds(-2**32, 0)], ps.getBounds('C'))
+        self.assertIsNone(ps.getBounds('D'))
+        ps.setFixed('A', 4)
+        self.assertEqual([Bounds(2, 8)], ps.getBounds('B'))
+
+    def testAlwaysEmptyDependentRangeShouldRaiseError(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A + 5', inclMax=2)
+        with self.assertRaises(ValueError):
+            ParamStore((a, b)).finalize()
+        b = getParameter('B', NPARAM, FLOAT, exclMin='A', exclMax=1)
+        with self.assertRaises(ValueError):
+            ParamStore((a, b)).finalize()
+
+    def testDependentIntegerLimitsShouldBeTruncated(self):
+        # A / 2 is truncated to 0, so B can always be 0.
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=1)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A / 2', inclMax=0)
+        ps = ParamStore((a, b))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            ps.finalize()
+        self.assertEqual([Bounds(0, 0)], ps.getBounds('B'))
+        self.assertTrue(ps.isValid('B', 0, {'A': 1}))
+
+    def testPossiblyEmptyDependentRangeShouldWarn(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A', exclMax=2)
+        with self.assertWarns(UserWarning):
+            ParamStore((a, b)).finalize()
+        b = getParameter('B', NPARAM, INTEGER, exclMin='A - 1',
+            inclMax='A + 10')
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            ParamStore((a, b)).finalize()
+
+    def testLinearDependentRangesShouldBeProvenNonEmpty(self):
+        params = [getParameter('X0', NPARAM, INTEGER, inclMin=0, inclMax=10)]
+        for i in range(1, 10):
+            params.append(getParameter('X%d' % (i), NPARAM, INTEGER,
+                inclMin='X%d' % (i - 1), exclMax='X%d * 2 + 10' % (i - 1)))
+        params.append(getParameter('Y', NPARAM, INTEGER,
+            inclMin='X0 / 2', inclMax='X0 / 2'))
+        params.append(getParameter('Z', NPARAM, FLOAT,
+            inclMin='X0 / 3', inclMax='X0 / 3'))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            ParamStore(params).finalize()
+
+    def testPossiblyEmptyDependentRangesShouldWarnOnce(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A * A', inclMax=5)
+        c = getParameter('C', NPARAM, FLOAT, exclMin='A', exclMax='A * 2 - 1')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            ParamStore((a, b, c)).finalize()
+        self.assertEqual(1, len(caught))
+        self.assertIn('B (A), C (A)', str(caught[0].message))
+
+    def testParamIndices(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin='B')
+        b = getParameter('B', NPARAM, INTEGER)
+        c = getParameter('C', NPARAM, INTEGER, inclMax='A')
+        ps = ParamStore((c, a, b))
+        ids = ps.getIndexedParamIds()
+        self.assertEqual(('B', 'A', 'C'), ids)
+        for (i, paramId) in enumerate(ids):
+            self.assertEqual(i, ps.getParamIndex(paramId))
+            self.assertEqual(paramId, ps.getParamIdAt(i))
+        self.assertIsNone(ps.getParamIndex('D'))
+        self.assertEqual('B', ps.getAbsoluteId('A', 'B'))
+        self.assertIsNone(ps.getAbsoluteId('A', 'D'))
+
+    def testCheckBounds(self):
+        a = getParameter('A', NPARAM, INTEGER, inclMin=1, inclMax=3)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A',
+            exclMax='A + 10')
+        ps = ParamStore((a, b))
+        self.assertTrue(ps.checkBounds('A', 3))
+        self.assertFalse(ps.checkBounds('A', 4))
+        self.assertTrue(ps.checkBounds('B', 5))
+        self.assertTrue(ps.checkBounds('B', 3))
+        self.assertIsNone(ps.checkBounds('B', 2))
+        self.assertIsNone(ps.checkBounds('B', 11))
+        self.assertFalse(ps.checkBounds('B', 0))
+        self.assertFalse(ps.checkBounds('B', 13))
+        # Undecided values are checked using the values of A.
+        self.assertFalse(ps.isValid('B', 2, {'A': 3}))
+        self.assertTrue(ps.isValid('B', 12, {'A': 3}))
+
+    def testCheckBoundsShouldAgreeWithIntervals(self):
+        # Intervals truncate their limits, so 0 and 3 are valid here.
+        a = getParameter('A', NPARAM, INTEGER, inclMin=0.1, inclMax=1.9)
+        b = getParameter('B', NPARAM, INTEGER, inclMin='A + 0.5',
+            inclMax='A * 1.5 + 1')
+        ps = ParamStore((a, b))
+        for value in range(-1, 4):
+            expected = ps.getParam('A').isValid(value)
+            self.assertIn(ps.checkBounds('A', value), (expected, None))
+            self.assertEqual(expected, ps.isValid('A', value))
+        for dep in ({'A': 0}, {'A': 1}):
+            for value in range(-1, 4):
+                expected = ps.getParam('B').isValid(value, dep)
+                self.assertIn(ps.checkBounds('B', value), (expected, None))
+                self.assertEqual(expected, ps.isValid('B', value, dep))
+
     def checkRangeErrors(self, kwargs, pa=None):
         args = pa or ('A', NPARAM, INTEGER)
         ps = ParamStore(getParameter(*args, **kwargs))
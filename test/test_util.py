@@ -2,6 +2,8 @@
 :copyright: (c) 2013 by Christoffer Fink.
 :license: MIT. See LICENSE for details.
 """
+import math
+import pickle
 import unittest
 from inputpy.util import Evaluator, depLen, initOrder
 import inputpy.util as util
@@ -102,6 +104,18 @@ class TestEvaluator(unittest.TestCase):
             self.assertEqual(expected, Evaluator.remapExpression(*args))
 
 
+    def testCompile(self):
+        tests = (
+            ('A + B', {'A': 1, 'B': 2, 'C': 3}),
+            ('A.X * 2 + B.X', {'A.X': 3, 'B.X': 4}),
+            ('Math.sqrt(A) - 1', {'A': 16}),
+            ('3 + 4', {}),
+        )
+        for (exp, params) in tests:
+            f = Evaluator.compile(exp)
+            self.assertEqual(Evaluator.evaluate(exp, params), f(params))
+
+
 class TestMiscUtil(unittest.TestCase):
 
     DEPENDENCIES = (
@@ -239,6 +253,10 @@ class TestMiscUtil(unittest.TestCase):
         for t in tests:
             self.assertEqual(t[1], util.relative(t[0]))
 
+    def testRelativeTo(self):
+        self.assertEqual(['C', 'D'], util.relativeTo('A.B', 'A.B.C.D'))
+        self.assertEqual(['2'], util.relativeTo('A', 'A.2'))
+
     def testAbsolute(self):
         tests = (
             ('T1.P1', 'X', 'T1.P1.X'),
@@ -433,6 +451,44 @@ class TestInterval(unittest.TestCase):
         self.assertEqual(interval.isLeftOpen(), updated.isLeftOpen())
         self.assertEqual(interval.getType(), updated.getType())
 
+    def testContainsWith(self):
+        specs = ('[A, A * 2]', ']A, A * 2]', '[A.X, *[', ']*, A.X + 1[')
+        values = range(-1, 10)
+        for spec in specs:
+            interval = util.Interval(spec=spec, type=int)
+            for dep in ({'A': 2, 'A.X': 2}, {'A': 4, 'A.X': -1}):
+                (minVal, maxVal) = (interval.getMin(), interval.getMax())
+                if isinstance(minVal, str):
+                    minVal = Evaluator.evaluate(minVal, dep)
+                if isinstance(maxVal, str):
+                    maxVal = Evaluator.evaluate(maxVal, dep)
+                updated = interval.getUpdated((minVal, maxVal))
+                for value in values:
+                    self.assertEqual(updated.contains(value),
+                        interval.containsWith(value, dep))
+
+    def testPickledIntervalShouldStillWork(self):
+        interval = util.Interval(spec=']A, A * 2]', type=int)
+        interval.containsWith(3, {'A': 2})
+        copy = pickle.loads(pickle.dumps(interval))
+        self.assertEqual(interval.spec, copy.spec)
+        self.assertTrue(copy.containsWith(3, {'A': 2}))
+        self.assertFalse(copy.containsWith(5, {'A': 2}))
+
+    def testIntervalIndex(self):
+        specs = (
+            '[1, 3]', ']3, 5]', ']7, 9[', '[8, 12]', '[*, -5[', ']20, *]',
+            '[14, 14]', ']15, 18[', '[15, 16]',
+        )
+        intervals = [util.Interval(spec=spec) for spec in specs]
+        index = util.IntervalIndex(intervals)
+        self.assertEqual(len(specs), len(index))
+        values = [v / 2 for v in range(-20, 50)]
+        expected = [any(i.contains(v) for i in intervals) for v in values]
+        self.assertEqual(expected, [index.contains(v) for v in values])
+        self.assertEqual(expected, index.containsMany(values))
+        self.assertFalse(util.IntervalIndex([]).contains(1))
+
     def testGetElementIds(self):
         tests = (
             ('X', [1,2,3], ('X.1', 'X.2', 'X.3')),
@@ -445,5 +501,81 @@ class TestInterval(unittest.TestCase):
             self.assertCountEqual(expected, ids)
 
 
+class TestBounds(unittest.TestCase):
+    def testArithmetic(self):
+        a = util.Bounds(1, 3)
+        b = util.Bounds(-1, 2)
+        self.assertEqual(util.Bounds(0, 5), a + b)
+        self.assertEqual(util.Bounds(-1, 4), a - b)
+        self.assertEqual(util.Bounds(-3, 6), a * b)
+        self.assertEqual(util.Bounds(-3, -1), -a)
+        self.assertEqual(util.Bounds(2, 4), 1 + a)
+        self.assertEqual(util.Bounds(-2, 0), 1 - a)
+        self.assertEqual(util.Bounds(0.25, 0.75), a / 4)
+
+    def testDivisionByRangeContainingZeroIsUnbounded(self):
+        result = util.Bounds(1, 3) / util.Bounds(-1, 2)
+        self.assertEqual(util.Bounds(-math.inf, math.inf), result)
+
+    def testEvaluateBounds(self):
+        bounds = {'A': util.Bounds(1, 3), 'B.C': util.Bounds(0, 2)}
+        result = util.evaluateBounds('2 * A - B.C + 1', bounds)
+        self.assertEqual(util.Bounds(1, 7), result)
+        self.assertEqual(util.Bounds(3, 3), util.evaluateBounds('1 + 2', {}))
+        result = util.evaluateBounds('Math.cos(A)', bounds)
+        self.assertEqual(util.Bounds(-math.inf, math.inf), result)
+
+    def testEvaluateAffine(self):
+        bounds = {'A': util.Bounds(1, 3), 'B.C': util.Bounds(0, 2)}
+        a = util.evaluateAffine('A * 2 + B.C / 2 + 1', ('A', 'B.C'))
+        b = util.evaluateAffine('A - 1', ('A', 'B.C'))
+        self.assertEqual(util.Bounds(3, 6), (a - b).getBounds(bounds))
+        self.assertEqual(util.Bounds(0, 0), (b - b).getBounds(bounds))
+        self.assertIsNone(util.evaluateAffine('A * A', ('A',)))
+        self.assertIsNone(util.evaluateAffine('Math.cos(A)', ('A',)))
+
+
+class TestIdTrie(unittest.TestCase):
+    def testQueries(self):
+        trie = util.IdTrie(('A.B.C', 'A.D', 'E', 'A.B.F'))
+        self.assertEqual(['A', 'E'], trie.children())
+        self.assertEqual(['A.B', 'A.D'], trie.children('A'))
+        self.assertEqual(['A.B.C', 'A.B.F'], trie.children('A.B'))
+        self.assertEqual([], trie.children('A.D'))
+        self.assertEqual([], trie.children('X'))
+        self.assertEqual(['A.B', 'A.B.C', 'A.B.F', 'A.D'],
+            trie.descendants('A'))
+        self.assertEqual(['A.B', 'A.B.C', 'A.B.F'], trie.subtree('A.B'))
+        self.assertEqual([], trie.subtree('X'))
+        self.assertEqual(6, len(trie))
+        self.assertEqual(6, len(trie.descendants()))
+        self.assertIn('A.B', trie)
+        self.assertNotIn('A.X', trie)
+        self.assertNotIn(None, trie)
+
+
+class TestBloomFilter(unittest.TestCase):
+    def testAddedItemsShouldBeContained(self):
+        bloom = util.BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(i)
+        self.assertEqual(1000, len(bloom))
+        for i in range(1000):
+            self.assertIn(i, bloom)
+
+    def testFalsePositiveRate(self):
+        bloom = util.BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(i)
+        falsePositives = sum(1 for i in range(1000, 11000) if i in bloom)
+        self.assertLess(falsePositives, 300)
+
+    def testInvalidArguments(self):
+        with self.assertRaises(ValueError):
+            util.BloomFilter(0)
+        with self.assertRaises(ValueError):
+            util.BloomFilter(10, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
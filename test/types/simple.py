@@ -27,3 +27,9 @@ class NonEmpty2(NonEmptyClass):
             raise ValueError('NonEmpty2 expects floats')
         else:
             NonEmptyClass.__init__(self, obj)
+
+# Unlike the other classes, a Pair is only equal to itself.
+class Pair:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
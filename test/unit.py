@@ -5,13 +5,15 @@
 import unittest
 from test.test_design import TestDesign
 from test.test_design_space import TestDesignSpace
-from test.test_factories import TestFactories
+from test.test_factories import TestFactories, TestSpaceCache
+from test.test_factories import TestCompiledSpaceCache
 from test.test_generators import TestGenerators
 from test.test_mapping import TestMapping
 from test.test_param import TestParam
 from test.test_param_store import TestParamStore
 from test.test_types import TestTypes
 from test.test_util import TestEvaluator, TestMiscUtil, TestInterval
+from test.test_util import TestBounds, TestIdTrie, TestBloomFilter
 from test.test_array_space import TestArraySpace
 from test.test_tools import TestTools
 from test.test_choice import TestChoice
@@ -19,8 +21,9 @@ from test.test_choice import TestChoice
 __all__ = (
     'TestDesign', 'TestDesignSpace', 'TestParam', 'TestParamStore',
     'TestEvaluator', 'TestMiscUtil', 'TestGenerators', 'TestMapping',
-    'TestTypes', 'TestFactories', 'TestArraySpace', 'TestChoice',
-    'TestTools', 'TestInterval',
+    'TestTypes', 'TestFactories', 'TestSpaceCache', 'TestCompiledSpaceCache',
+    'TestArraySpace', 'TestChoice',
+    'TestTools', 'TestInterval', 'TestBounds', 'TestIdTrie', 'TestBloomFilter',
 )
 
 if __name__ == '__main__':